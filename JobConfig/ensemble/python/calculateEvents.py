@@ -1,7 +1,63 @@
 #! /usr/bin/env python
 from normalizations import *
+import contextlib
+import csv
+import json
+import sys
+
+def parse_values(text):
+    """
+    Parses a list of values for sweep mode: either comma separated values
+    (e.g. "95,100,105") or an inclusive range start:stop:step (e.g. "95:105:0.5").
+    """
+    if ":" in text:
+        start, stop, step = map(float, text.split(":"))
+        return np.arange(start, stop + step / 2.0, step)
+    return np.array([float(v) for v in text.split(",")])
+
+def sweep(args):
+    """Writes yield grids (livetime x threshold) for the processes in args.sweep as CSV or JSON."""
+    livetimes = parse_values(str(args.livetime))
+    emin_options = {"DIO": args.dioemin, "RPCInternal": args.rpcemin, "RPCExternal": args.rpcemin,
+                    "RMCInternal": args.rmcemin, "RMCExternal": args.rmcemin, "IPAMichel": args.ipaemin}
+    thresholds = {}
+    for process in args.sweep:
+        if process not in emin_options:
+            raise ValueError(f"Unknown process for sweep: {process}, choose from {', '.join(SWEEP_PROCESSES)}")
+        if emin_options[process] is None:
+            raise ValueError(f"No threshold given for {process}")
+        thresholds[process] = parse_values(str(emin_options[process]))
+
+    # keep diagnostics printed by the normalizations out of the data stream
+    with contextlib.redirect_stdout(sys.stderr):
+        grids = yield_grids(livetimes, thresholds, str(args.BB), float(args.rmckmax), rmc_mode=str(args.rmcmode))
+        total_pot = get_pot(livetimes, str(args.BB))
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump({process: {"livetime": livetimes.tolist(),
+                                 "POT": total_pot.tolist(),
+                                 "emin": thresholds[process].tolist(),
+                                 "yield": grid.tolist()}
+                       for process, grid in grids.items()}, out, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.writer(out)
+            writer.writerow(["process", "livetime", "POT", "emin", "yield"])
+            for process, grid in grids.items():
+                for i, livetime in enumerate(livetimes):
+                    for j, emin in enumerate(thresholds[process]):
+                        writer.writerow([process, repr(float(livetime)), repr(float(total_pot[i])),
+                                         repr(float(emin)), repr(float(grid[i, j]))])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return grids
 
 def main(args):
+    if args.sweep:
+        return sweep(args)
     Yield = 0
     if (str(args.printpot) == "print"):
       get_pot(float(args.livetime), str(args.BB),True)
@@ -27,10 +83,10 @@ def main(args):
       Yield = rpc_normalization(float(args.livetime), float(args.tmin), str(args.internal), str(args.rpcemin), str(args.BB))
       print("ExternalRPC_yield=",Yield)
     if(args.prc == "RMC" and int(args.internal) == 1):
-      Yield = rmc_normalization(float(args.livetime),  str(args.internal), float(args.rmcemin))
+      Yield = rmc_normalization(float(args.livetime),  str(args.internal), float(args.rmcemin), mode=str(args.rmcmode))
       print("InternalRMC_yield=",Yield)
     if(args.prc == "RMC" and int(args.internal) == 0):
-      Yield = rmc_normalization(float(args.livetime),  str(args.internal), float(args.rmcemin))
+      Yield = rmc_normalization(float(args.livetime),  str(args.internal), float(args.rmcemin), mode=str(args.rmcmode))
       print("ExternalRMC_yield=",Yield)
     if(args.prc == "IPAMichel"):
       Yield = ipaMichel_normalization(float(args.livetime), float(args.ipaemin), str(args.BB))
@@ -52,6 +108,12 @@ if __name__ == '__main__':
     parser.add_argument("--tmin", help="tmin", default=0)
     parser.add_argument("--internal", help="internal", default=1)
     parser.add_argument("--nsig", help="internal")
+    parser.add_argument("--rmckmax", help="kmax theory value", default=90.1)
+    parser.add_argument("--rmcmode", choices=["binned", "analytic"], default="binned", help="RMC spectrum integration")
+    parser.add_argument("--sweep", nargs='+', help="sweep mode: processes to tabulate e.g. DIO RPCInternal RMCExternal IPAMichel;"
+                        " --livetime and the emin options then take comma lists or start:stop:step ranges")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="sweep output format")
+    parser.add_argument("--output", help="sweep output file (default: stdout)")
     args = parser.parse_args()
     (args) = parser.parse_args()
     main(args)
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+"""
+Columnar reduction of per-event weights over the Events trees of art files.
+
+For every file the weight product (by default mu2e::EventWeight) is reduced
+with an RDataFrame: number of entries, sum, sum of squares, minimum,
+maximum and a fixed-binning histogram are all filled in one compiled event
+loop that streams the tree cluster by cluster, so memory does not grow with
+the number of events. Files are fanned out over a process pool as in
+rootscan.py and the per-file summaries are merged.
+
+The merged summary gives the mean weight (e.g. the RPC survival factor used
+in rpc_normalization) and its statistical uncertainty.
+
+How to use:
+python eventweights.py --files filenames_RPCInternal --bins 100 --range 0 1
+python eventweights.py --files filenames_RPCInternal --format json
+"""
+import argparse
+import json
+import math
+import sys
+from typing import NamedTuple
+
+import rootscan
+
+#-------------------------------------------------------------------------------------#
+class WeightSummary(NamedTuple):
+    """
+    Weight statistics of one or more files.
+
+    Attributes:
+        files (int): number of files merged.
+        entries (int): number of events.
+        sum (float): sum of weights.
+        sum2 (float): sum of squared weights.
+        min, max (float): smallest and largest weight (nan if there are no events).
+        low, high (float): histogram range.
+        counts (list[float]): histogram contents, with underflow first and overflow last.
+    """
+    files: int
+    entries: int
+    sum: float
+    sum2: float
+    min: float
+    max: float
+    low: float
+    high: float
+    counts: list
+
+    @property
+    def mean(self):
+        return self.sum / self.entries if self.entries else math.nan
+
+    @property
+    def mean_error(self):
+        """Standard error of the mean weight."""
+        if self.entries < 2:
+            return math.nan
+        variance = max(self.sum2 / self.entries - self.mean**2, 0.0) * self.entries / (self.entries - 1)
+        return math.sqrt(variance / self.entries)
+
+    @property
+    def effective_entries(self):
+        """Kish effective sample size, sum^2 / sum2."""
+        return self.sum**2 / self.sum2 if self.sum2 > 0 else 0.0
+
+def merge(summaries):
+    """Returns the WeightSummary of several files with the same histogram binning."""
+    summaries = list(summaries)
+    if not summaries:
+        raise ValueError("Nothing to merge")
+    first = summaries[0]
+    if any((s.low, s.high, len(s.counts)) != (first.low, first.high, len(first.counts)) for s in summaries):
+        raise ValueError("Cannot merge weight summaries with different binning")
+    return WeightSummary(sum(s.files for s in summaries), sum(s.entries for s in summaries),
+                         math.fsum(s.sum for s in summaries), math.fsum(s.sum2 for s in summaries),
+                         min((s.min for s in summaries if s.entries), default=math.nan),
+                         max((s.max for s in summaries if s.entries), default=math.nan),
+                         first.low, first.high,
+                         [math.fsum(column) for column in zip(*(s.counts for s in summaries))])
+
+#-------------------------------------------------------------------------------------#
+def reduce_file(path, bins=100, low=0.0, high=1.0, reduction=rootscan.EVENT_WEIGHT):
+    """
+    Returns the WeightSummary of one file.
+
+    Args:
+        path (str): file name or xroot url.
+        bins, low, high: histogram binning.
+        reduction (rootscan.Reduction): the weight product; its tree, branch prefix and method.
+    """
+    import ROOT
+
+    empty = WeightSummary(1, 0, 0.0, 0.0, math.nan, math.nan, float(low), float(high), [0.0] * (int(bins) + 2))
+    fin = ROOT.TFile.Open(path)
+    if not fin or fin.IsZombie():
+        raise OSError(f"Could not open ROOT file: {path}")
+    try:
+        tree = fin.Get(reduction.tree)
+        if not tree or tree.GetEntries() == 0:
+            return empty
+        branch = rootscan.find_branch(tree, reduction.prefix)
+        if not branch:
+            return empty
+        df = (ROOT.RDataFrame(tree).Alias("wrapper_", branch)
+              .Define("weight_", f"double(wrapper_.product()->{reduction.method}())")
+              .Define("weight2_", "weight_*weight_"))
+        # book every result before reading any, so they are all filled in one event loop
+        count = df.Count()
+        total = df.Sum("weight_")
+        total2 = df.Sum("weight2_")
+        smallest = df.Min("weight_")
+        largest = df.Max("weight_")
+        hist = df.Histo1D(("weights", "", int(bins), float(low), float(high)), "weight_")
+        counts = [hist.GetBinContent(i) for i in range(int(bins) + 2)]
+        return WeightSummary(1, int(count.GetValue()), float(total.GetValue()), float(total2.GetValue()),
+                             float(smallest.GetValue()), float(largest.GetValue()), float(low), float(high), counts)
+    finally:
+        fin.Close()
+
+def reduce_files(paths, bins=100, low=0.0, high=1.0, reduction=rootscan.EVENT_WEIGHT, workers=None):
+    """
+    Returns the per-file WeightSummary of paths, in order, reducing files in parallel.
+
+    Args:
+        paths (iterable of str): files to reduce.
+        bins, low, high: histogram binning.
+        reduction (rootscan.Reduction): the weight product.
+        workers (int): process pool size; defaults to rootscan.default_workers().
+    """
+    return rootscan.map_files(reduce_file, paths, bins, low, high, reduction, workers=workers)
+
+#-------------------------------------------------------------------------------------#
+def main(args):
+    reduction = rootscan.Reduction(args.tree, args.branch, args.method)
+    paths = rootscan.read_file_list(args.files)
+    per_file = reduce_files(paths, args.bins, args.range[0], args.range[1], reduction, args.workers)
+    summary = merge(per_file)
+    if args.format == "json":
+        result = summary._asdict()
+        result.update(mean=summary.mean, mean_error=summary.mean_error, effective_entries=summary.effective_entries)
+        if args.perfile:
+            result["per_file"] = {path: s._asdict() for path, s in zip(paths, per_file)}
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        if args.perfile:
+            for path, s in zip(paths, per_file):
+                print(f"{path} entries {s.entries} sum {s.sum} mean {s.mean}")
+        print(f"files {summary.files} entries {summary.entries} sum {summary.sum} sum2 {summary.sum2}")
+        print(f"min {summary.min} max {summary.max} mean {summary.mean} +- {summary.mean_error} effective entries {summary.effective_entries}")
+        width = (summary.high - summary.low) / (len(summary.counts) - 2)
+        print(f"underflow {summary.counts[0]} overflow {summary.counts[-1]}")
+        for i, content in enumerate(summary.counts[1:-1]):
+            print(f"{summary.low + i*width:g} {summary.low + (i + 1)*width:g} {content}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sum and histogram per-event weights over the Events trees of art files")
+    parser.add_argument("--files", required=True, help="file list, one file per line")
+    parser.add_argument("--bins", type=int, default=100, help="number of histogram bins")
+    parser.add_argument("--range", type=float, nargs=2, default=[0.0, 1.0], metavar=("LOW", "HIGH"), help="histogram range")
+    parser.add_argument("--tree", default=rootscan.EVENT_WEIGHT.tree, help="tree holding the weights")
+    parser.add_argument("--branch", default=rootscan.EVENT_WEIGHT.prefix, help="branch name prefix of the weight product")
+    parser.add_argument("--method", default=rootscan.EVENT_WEIGHT.method, help="product method returning the weight")
+    parser.add_argument("--perfile", action="store_true", help="also report every file")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="output format")
+    parser.add_argument("--workers", type=int, help="number of parallel file reductions (default: number of CPUs)")
+    args = parser.parse_args()
+    main(args)
@@ -2,19 +2,52 @@
 # Ed Callaghan
 # Gross generator efficiency --- includes threshold, and atomic/nuclear capture
 # November 2024
+"""
+Builds the IPA Michel spectral efficiency table (ipa_spec_eff.tbl).
+
+The composite decay-in-orbit spectrum of the stopping target material is the
+weighted sum of the per-element spectra. The efficiency above every threshold
+comes from a single cumulative trapezoid pass over that composite curve, so
+the table can have any number of thresholds. The table is written with its
+binary sidecar (see spectra.py) and is looked up by ipaMichel_normalization.
+
+The composition defaults to the C/H mixture below; any other is given as a
+JSON file with the same keys per element, the spectrum being a table file name
+(looked up in JobConfig/ensemble/tables if it is not a path).
+
+How to use:
+python ipa-michel-efficiency.py --output ipa_spec_eff.tbl
+python ipa-michel-efficiency.py --composition composition.json --nthresholds 5001 --plot
+"""
+import argparse
+import json
+import os
 
-from matplotlib import pyplot as plt
 import numpy as np
-import os
-import scipy.interpolate as si
-from scipy.integrate import quad
-
-def load_spectrum(path):
-    arr = np.loadtxt(path)
-    xx = arr[:,0]
-    yy = arr[:,1]
-    print(xx,yy)
-    return xx, yy
+
+import spectra
+
+DEFAULT_COMPOSITION = {
+    'C': {
+          'mass_fraction': 0.89,    # fractional
+          'decay_fraction': 0.922,  # fractional
+          'atomic_mass': 12.0107,   # atomic mass units
+          'atomic_radius': 75.0,    # picometers
+          'spectrum': spectra.DIO_6C_TABLE,
+         },
+    'H': {
+          'decay_fraction': 0.999,  # fractional
+          'mass_fraction': 0.11,    # fractional
+          'atomic_mass': 1.007975,  # atomic mass units
+          'atomic_radius': 32.0,    # picometers
+          'spectrum': spectra.DIO_1H_TABLE,
+         },
+}
+
+def load_spectrum(name):
+    path = name if os.path.exists(name) else spectra.table_path(name)
+    spectrum = spectra.load_spectrum(path)
+    return spectrum.energies, spectrum.values
 
 def calculate_weights(d):
     normalization = 0.0
@@ -34,86 +67,90 @@ def calculate_weights(d):
     for v in d.values():
         v['weight'] /= normalization
 
+def composite_spectrum(d, points):
+    """Returns the normalized composite density of the elements on a grid of `points` energies."""
+    xmin = min([v['spectrum'][0][0]  for v in d.values()])
+    xmax = max([v['spectrum'][0][-1] for v in d.values()])
+    xx = np.linspace(xmin, xmax, int(points))
+    yy = sum([v['weight'] * np.interp(xx, *v['spectrum'], left=0.0, right=0.0) for v in d.values()])
+    yy /= spectra.cumulative_trapezoid(yy, xx)[-1]
+    return xx, yy
 
-def generate_interpolations(d):
-    for k,v in d.items():
-        v['interpolation'] = si.interp1d(*v['spectrum'],
-                                         bounds_error=False,
-                                         fill_value=0.0)
-
-elements = {
-    'C': {
-          'mass_fraction': 0.89,    # fractional
-          'decay_fraction': 0.922,  # fractional
-          'atomic_mass': 12.0107,   # atomic mass units
-          'atomic_radius': 75.0,    # picometers
-          'spectrum': load_spectrum("heeck_finer_binning_2016_szafron-scaled-to-6C.tbl"),
-         },
-    'H': {
-          'decay_fraction': 0.999,  # fractional
-          'mass_fraction': 0.11,    # fractional
-          'atomic_mass': 1.007975,  # atomic mass units
-          'atomic_radius': 32.0,    # picometers
-          'spectrum': load_spectrum("heeck_finer_binning_2016_szafron-scaled-to-1H.tbl"),
-         },
-}
-calculate_weights(elements)
-generate_interpolations(elements)
-
-decay_efficiency = sum([v['volume_fraction'] * v['decay_fraction'] \
-                        for v in elements.values()])
-for k,v in elements.items():
-    tup = (k, v['volume_fraction'], v['decay_fraction'], v['weight'])
-    print('%s: %.3f %.3f %.3f' % tup)
-print('decay efficiency: %.3f%%' % (100.0 * decay_efficiency))
-
-xmin = min([v['spectrum'][0][0]  for v in elements.values()])
-xmax = max([v['spectrum'][0][-1] for v in elements.values()])
-xx = np.linspace(xmin, xmax, int(1e6))
-yy = sum([v['weight'] * v['interpolation'](xx) for v in elements.values()])
-yy /= np.trapz(yy, xx)
-spectrum = si.interp1d(xx, yy)
-integral = quad(spectrum, xmin, xmax)
-print(integral)
-
-fig = plt.figure()
-plt.xlabel('Energy [MeV]')
-plt.ylabel(r'Probability density [MeV$^{-1}$]')
-plt.plot(xx, yy)
-plt.tight_layout()
-plt.savefig('composite-spectrum.pdf')
-
-xx = np.linspace(50.0, 100.0, int(100))
-yy = np.array([quad(spectrum, x, xmax) for x in xx])
-spectral_efficiency = yy[:,0]
-yy = spectral_efficiency
-
-fig = plt.figure()
-plt.yscale('log')
-plt.xlabel('Threshold [MeV]')
-plt.ylabel('Spectral efficiency [%]')
-plt.plot(xx, 100.0 * yy)
-for i,j in enumerate(xx):
-  print(xx[i], yy[i])
-plt.tight_layout()
-plt.savefig('spectral-efficiency-vs-threshold.pdf')
-
-# 2 hours per 10^{4} decays
-scaling = 2.0 * 1.0e-4
-
-# total runtime cost
-stops = 2e9
-decays = stops * decay_efficiency * spectral_efficiency
-cost = scaling * decays
-yy = cost
-
-fig = plt.figure()
-plt.yscale('log')
-plt.xlabel('Threshold [MeV]')
-plt.ylabel('Runtime [CPU-hours]')
-plt.plot(xx, yy)
-plt.tight_layout()
-plt.savefig('ost-vs-threshold.pdf')
-
-plt.show()
-
+def plot(xx, yy, thresholds, spectral_efficiency, decay_efficiency, stops):
+    from matplotlib import pyplot as plt
+
+    fig = plt.figure()
+    plt.xlabel('Energy [MeV]')
+    plt.ylabel(r'Probability density [MeV$^{-1}$]')
+    plt.plot(xx, yy)
+    plt.tight_layout()
+    plt.savefig('composite-spectrum.pdf')
+
+    fig = plt.figure()
+    plt.yscale('log')
+    plt.xlabel('Threshold [MeV]')
+    plt.ylabel('Spectral efficiency [%]')
+    plt.plot(thresholds, 100.0 * spectral_efficiency)
+    plt.tight_layout()
+    plt.savefig('spectral-efficiency-vs-threshold.pdf')
+
+    # 2 hours per 10^{4} decays
+    scaling = 2.0 * 1.0e-4
+
+    # total runtime cost
+    decays = stops * decay_efficiency * spectral_efficiency
+    cost = scaling * decays
+
+    fig = plt.figure()
+    plt.yscale('log')
+    plt.xlabel('Threshold [MeV]')
+    plt.ylabel('Runtime [CPU-hours]')
+    plt.plot(thresholds, cost)
+    plt.tight_layout()
+    plt.savefig('cost-vs-threshold.pdf')
+
+    plt.show()
+
+def main(args):
+    if args.composition:
+        with open(args.composition) as f:
+            elements = json.load(f)
+    else:
+        elements = {k: dict(v) for k, v in DEFAULT_COMPOSITION.items()}
+    for v in elements.values():
+        v['spectrum'] = load_spectrum(v['spectrum'])
+    calculate_weights(elements)
+
+    decay_efficiency = sum([v['volume_fraction'] * v['decay_fraction'] \
+                            for v in elements.values()])
+    for k,v in elements.items():
+        tup = (k, v['volume_fraction'], v['decay_fraction'], v['weight'])
+        print('%s: %.3f %.3f %.3f' % tup)
+    print('decay efficiency: %.3f%%' % (100.0 * decay_efficiency))
+
+    xx, yy = composite_spectrum(elements, args.points)
+    thresholds = np.linspace(args.emin, args.emax, int(args.nthresholds))
+    spectral_efficiency = spectra.tail_efficiency(xx, yy, thresholds)
+    if args.verbose:
+        for threshold, efficiency in zip(thresholds, spectral_efficiency):
+            print(threshold, efficiency)
+
+    spectra.write_table(args.output, thresholds, spectral_efficiency)
+    print(f"wrote {len(thresholds)} thresholds to {args.output}")
+
+    if args.plot:
+        plot(xx, yy, thresholds, spectral_efficiency, decay_efficiency, args.stops)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the IPA Michel spectral efficiency table")
+    parser.add_argument("--composition", help="JSON file with the element composition (default: C/H)")
+    parser.add_argument("--points", type=float, default=1e6, help="points of the composite spectrum grid")
+    parser.add_argument("--emin", type=float, default=50.0, help="first threshold (MeV)")
+    parser.add_argument("--emax", type=float, default=100.0, help="last threshold (MeV)")
+    parser.add_argument("--nthresholds", type=int, default=100, help="number of thresholds in the table")
+    parser.add_argument("--output", default=spectra.IPA_EFFICIENCY_TABLE, help="output table")
+    parser.add_argument("--stops", type=float, default=2e9, help="muon stops for the cost plot")
+    parser.add_argument("--plot", action="store_true", help="make the spectrum, efficiency and cost plots")
+    parser.add_argument("--verbose", action="store_true", help="print every threshold")
+    args = parser.parse_args()
+    main(args)
@@ -3,10 +3,13 @@ from string import Template
 import argparse
 import sys
 import random
+import math
 import os
 import glob
 import ROOT
 from normalizations import *
+import rootscan
+import metadatacache
 import subprocess
 
 """
@@ -14,191 +17,229 @@ How to use:
 python ../Production/JobConfig/ensemble/python/make_template_fcl.py --BB=1BB --verbose=1 --rue=1e-13 --livetime=60 --run=1201 --dioemin=75 --tmin=450 --samplingseed=1  --prc "CE" "DIO"
 """
 
-def main(args):
-  
-  # live time in seconds
-  livetime = float(args.livetime)
+def subrun_sizes(total_events, max_events_per_subrun):
+  """
+  Yields the number of events of each subrun: max_events_per_subrun for all
+  but the last, which takes the remainder. At least one subrun is yielded.
+  """
+  remaining = int(total_events)
+  while True:
+    events = min(remaining, int(max_events_per_subrun))
+    yield events
+    remaining -= events
+    if remaining <= 0:
+      break
 
-  # r mue and rmup rates
-  #rue = float(args.rue)
+class DatasetCursor:
+  """
+  Position of the next unused event in the file list of one signal.
 
-  dioemin = float(args.dioemin)
-  tmin = float(args.tmin)
-  run = int(args.run)
-  samplingseed = int(args.samplingseed)
-  processes = ""
-  for i, j in enumerate(args.prc):
-    processes +=str(j)
+  Attributes:
+    signal (str): the signal name, for messages.
+    filenames (list[str]): the files of the signal, in sampling order.
+    event_counts (list[int]): Events entries of each file.
+    file (int): index of the file holding the next unused event.
+    entry (int): entry of that event within its file.
+  """
+  def __init__(self, signal, filenames, event_counts):
+    self.signal = signal
+    self.filenames = filenames
+    self.event_counts = event_counts
+    self.file = 0
+    self.entry = 0
 
-  ROOT.gRandom.SetSeed(0)
+  def files_for(self, n_events, spare=1):
+    """Returns the files holding the next n_events, plus up to `spare` files as margin for fluctuations."""
+    last = self.file
+    needed = self.entry + n_events
+    while last < len(self.filenames) - 1 and needed > self.event_counts[last]:
+      needed -= self.event_counts[last]
+      last += 1
+    return self.filenames[self.file:min(last + 1 + spare, len(self.filenames))]
 
-  # extract normalization of each background/signal process:
+  def advance(self, n_events):
+    """Moves past n_events, starting again from the first file once the list is used up."""
+    if sum(self.event_counts) == 0:
+      return
+    self.entry += n_events
+    while self.entry >= self.event_counts[self.file]:
+      self.entry -= self.event_counts[self.file]
+      self.file += 1
+      if self.file == len(self.filenames):
+        print("WARNING: all",self.signal,"files used, events will be reused from the first file")
+        self.file = 0
+
+def process_norms(processes, livetime, BB, dioemin, tmin, rpcemin, rmcemin, rmckmax, ipaemin):
+  """Returns the normalization (mean generated events) of each requested background/signal process."""
   norms = {
-          "CRYCosmic": cry_onspill_normalization(livetime, args.BB),
-          "CORSIKACosmic": corsika_onspill_normalization(livetime, args.BB),
-          "DIO": dio_normalization(livetime, dioemin, args.BB),
-          "RPCInternal": rpc_normalization(livetime, args.tmin, 1, args.rpcemin, args.BB),
-          "RPCExternal": rpc_normalization(livetime, args.tmin, 0, args.rpcemin, args.BB),
-          "RMCInternal": rmc_normalization(livetime, 1, args.rmcemin, args.rmckmax, args.BB),
-          "RMCExternal": rmc_normalization(livetime, 0, args.rmcemin, args.rmckmax, args.BB),
-          "IPAMichel": ipaMichel_normalization(livetime, args.ipaemin, args.BB)
+          "CRYCosmic": lambda: cry_onspill_normalization(livetime, BB),
+          "CORSIKACosmic": lambda: corsika_onspill_normalization(livetime, BB),
+          "DIO": lambda: dio_normalization(livetime, dioemin, BB),
+          "RPCInternal": lambda: rpc_normalization(livetime, tmin, 1, rpcemin, BB),
+          "RPCExternal": lambda: rpc_normalization(livetime, tmin, 0, rpcemin, BB),
+          "RMCInternal": lambda: rmc_normalization(livetime, 1, rmcemin, rmckmax, BB),
+          "RMCExternal": lambda: rmc_normalization(livetime, 0, rmcemin, rmckmax, BB),
+          "IPAMichel": lambda: ipaMichel_normalization(livetime, ipaemin, BB)
           }
+  return {signal: norms[signal]() for signal in processes}
 
-  starting_event_num = {}
-  max_possible_events = {}
-  mean_reco_events = {}
-  filenames = {}
-  current_file = {}
+def scan_inputs(processes, workers=None, verbose=0):
+  """
+  Scans the filenames_<signal> list of every process through the metadata cache.
 
-  # loop over each "signal"
-  for signal in args.prc:
+  Returns:
+    dict: signal -> list of rootscan.FileMetadata, in file list order.
+  """
+  scans = {}
+  for signal in processes:
       print(signal)
-      #FIXME starting and ending event
-      
-      # open file list from the filelists directory
-      ffns = open(os.path.join("filenames_%s" % signal))
-      
-      # add empty file list
-      filenames[signal] = []
+      scans[signal] = metadatacache.scan_files(rootscan.read_file_list("filenames_%s" % signal), workers=workers)
+      if int(verbose) == 2:
+        for record in scans[signal]:
+          print(" file ", record.path, " reco events ", record.reco_events, " gen events ", record.gen_events, " livetime ", record.livetime)
+  return scans
+
+def expected_reco_events(norms, scans, verbose=0):
+  """Returns the expected number of reconstructed events of each signal: its normalization times its efficiency."""
+  mean_reco_events = {}
+  for signal in norms:
+      records = scans[signal]
+
+      # things are slightly different for the Cosmics: the generated "events" are the livetime
+      reco_events = rootscan.total(records, "reco_events")
+      if signal == "CRYCosmic" or signal == "CORSIKACosmic":
+          gen_events = rootscan.total(records, "livetime")
+      else:
+          gen_events = rootscan.total(records, "gen_events")
       
-      # enter empty entry for current file
-      current_file[signal] = 0
+      #if signal == "RPCInternal" or signal == "RPCExternal":
+      #  gen_events *= float(args.surv) # survival probability
       
-      # enter empty entry for starting event
-      starting_event_num[signal] = [0,0,0]
-
-      # start counters
-      reco_events = 0
-      gen_events = 0
-      livetime=0
-      # loop over files in list
-      for line in ffns:
-          
-          # find a given filename
-          fn = line.strip()
-          
-          # add this filename to the list of filenames
-          filenames[signal].append(fn)
-          
-          # use ROOT to get the events in that file
-          fin = ROOT.TFile(fn)
-          te = fin.Get("Events")
-
-          # determine total number of events surviving all cuts
-          reco_events += te.GetEntries()
-          if int(args.verbose) == 2:
-            print(" reco events ", reco_events)
-        
-          # determine total number of events generated
-          t = fin.Get("SubRuns")
-          
-          # things are slightly different for the Cosmics:
-          if signal == "CRYCosmic" or signal == "CORSIKACosmic":
-              # find the right branch
-              bl = t.GetListOfBranches()
-              bn = ""
-              
-              for i in range(bl.GetEntries()):
-                  if bl[i].GetName().startswith("mu2e::CosmicLivetime"):
-                      bn = bl[i].GetName()
-              for i in range(t.GetEntries()):
-                  t.GetEntry(i)
-                  
-                  livetime+=getattr(t,bn).product().liveTime()
-                  gen_events += getattr(t,bn).product().liveTime()
-          else:
-              # find the right branch
-              bl = t.GetListOfBranches()
-              bn = ""
-              # find number of generated events via the GenEventCount field:
-              for i in range(bl.GetEntries()):
-                  if bl[i].GetName().startswith("mu2e::GenEventCount"):
-                      bn = bl[i].GetName()
-              for i in range(t.GetEntries()):
-                  t.GetEntry(i)
-                  gen_events += getattr(t,bn).product().count()
-          
-          #if signal == "RPCInternal" or signal == "RPCExternal":
-          #  gen_events *= float(args.surv) # survival probability
-          
-          if int(args.verbose) == 2:
-            print("total gen events ",gen_events)
+      if int(verbose) == 2:
+        print("total gen events ",gen_events)
 
       # mean is the normalized number of that event type as expected
       mean_gen_events = norms[signal]
-      if int(args.verbose) == 1:
+      if int(verbose) == 1:
         print("mean_reco_events",mean_gen_events,reco_events,float(gen_events))
       
       # factors in efficiency
       mean_reco_events[signal] = mean_gen_events*reco_events/float(gen_events) 
       print("NORM",mean_gen_events,"RECO",reco_events, "GEN",float(gen_events),"EXPECTED EVENTS:",mean_reco_events[signal] )
-      if int(args.verbose) == 1:
+      if int(verbose) == 1:
         print(signal,"GEN_EVENTS:",gen_events,"RECO_EVENTS:",reco_events,"EXPECTED EVENTS:",mean_reco_events[signal])
+  return mean_reco_events
 
-  # poisson sampling:
-  total_sample_events = ROOT.gRandom.Poisson(sum(mean_reco_events.values()))
-  if int(args.verbose) == 1:
-    print("TOTAL EXPECTED EVENTS:",sum(mean_reco_events.values()),"GENERATING:",total_sample_events)
-
-  # calculate the normalized weights for each signal
-  weights = {signal: mean_reco_events[signal]/float(total_sample_events) for signal in mean_reco_events}
-  if int(args.verbose) == 1:
-    print("weights " , weights)
+def load_template():
+  """Returns the SamplingInput.fcl Template."""
+  with open(os.path.join(os.environ["MUSE_WORK_DIR"],"Production/JobConfig/ensemble/fcl/SamplingInput.fcl")) as fin:
+    return Template(fin.read())
 
-  # generate subrun by subrun
+def write_sampling_fcls(t, weights, scans, total_sample_events, run, tag, release, samplingseed, comments,
+                        max_events_per_subrun=10000000, outdir="."):
+  """
+  Writes SamplingInput_sr<N>.fcl files for total_sample_events events, subrun by subrun.
 
-  # open the SamplingInput template:
-  fin = open(os.path.join(os.environ["MUSE_WORK_DIR"],"Production/JobConfig/ensemble/fcl/SamplingInput.fcl"))
-  t = Template(fin.read())
+  Args:
+    t (Template): the SamplingInput.fcl template.
+    weights (dict): signal -> sampling weight.
+    scans (dict): signal -> list of rootscan.FileMetadata, see scan_inputs.
+    total_sample_events (int): the sampled number of events.
+    run, tag, release, samplingseed: output naming and seeding.
+    comments (str): parameter summary put at the top of every fcl.
+    max_events_per_subrun (int): maximum events per fcl file.
+    outdir (str): directory for the fcl files.
 
-  subrun = 0
-  num_events_already_sampled = 0
-  problem = False
+  Returns:
+    int: the number of fcl files written.
+  """
+  # one cursor per signal tracks the next unused event in its file list
+  cursors = {signal: DatasetCursor(signal, [record.path for record in scans[signal]],
+                                   [record.reco_events for record in scans[signal]]) for signal in weights}
+  sum_weights = sum(weights.values())
 
-  # this parameter controls how many events per fcl file:
-  max_events_per_subrun = 10000000#10000
-  while True:
-      # split into "subruns" as requested by the max_events_per_subrun parameter
-      events_this_run = max_events_per_subrun
-      if num_events_already_sampled + events_this_run > total_sample_events:
-          events_this_run = total_sample_events - num_events_already_sampled
+  nsubruns = 0
+  for subrun, events_this_run in enumerate(subrun_sizes(total_sample_events, max_events_per_subrun)):
 
       # loop over signals via weights. Add text based on weight and file names
       datasets = ""
       for signal in weights:
+          cursor = cursors[signal]
+          # events this subrun is expected to draw from this signal
+          expected = int(math.ceil(events_this_run*weights[signal]/sum_weights)) if sum_weights > 0 else 0
           datasets += "      %s: {\n" % (signal)
-          datasets += "        fileNames : [\"%s\"]\n" % (filenames[signal][current_file[signal]])
+          datasets += "        fileNames : [%s]\n" % (", ".join("\"%s\"" % fn for fn in cursor.files_for(expected)))
           datasets += "        weight : %e\n" % (weights[signal])
           # add information on starting event, useful when have multiple .fcl per run
-          if starting_event_num[signal] != [0,0,0]:
-              datasets += "        skipToEvent : \"%d:%d:%d\"\n" % (starting_event_num[signal][0],starting_event_num[signal][1],starting_event_num[signal][2])
+          if cursor.entry > 0:
+              datasets += "        skipToEvent : \"%d:%d:%d\"\n" % rootscan.event_id(cursor.filenames[cursor.file], cursor.entry)
           datasets += "      }\n"
+          cursor.advance(expected)
 
       d = {}
       d["datasets"] = datasets
-      d["outnameMC"] = os.path.join("dts.mu2e.ensemble"+args.tag+"."+args.release+".%06d_%08d.art" % (run,subrun))
-      d["outnameData"] = os.path.join("dts.mu2e.ensemble"+args.tag+"."+args.release+".%06d_%08d.art" % (run,subrun))
+      d["outnameMC"] = os.path.join("dts.mu2e.ensemble"+tag+"."+release+".%06d_%08d.art" % (run,subrun))
+      d["outnameData"] = os.path.join("dts.mu2e.ensemble"+tag+"."+release+".%06d_%08d.art" % (run,subrun))
       d["run"] = run
       d["subRun"] = subrun
       d["samplingSeed"] = samplingseed + subrun
       # put all the exact parameter values in the fcl file
-      d["comments"] = "#livetime: %f\n#dioemin: %f\n#tmin: %f\n#run: %f\n#nevts: %d\n" % (livetime,dioemin,tmin,run,events_this_run)
+      d["comments"] = comments + "#nevts: %d\n" % (events_this_run)
 
-      # make the .fcl file for this subrun (subrun # d)
-      fout = open(os.path.join("SamplingInput_sr%d.fcl" % (subrun)),"w")
+      # make the .fcl file for this subrun (subrun # d), written as we go
+      fout = open(os.path.join(outdir, "SamplingInput_sr%d.fcl" % (subrun)),"w")
       fout.write(t.substitute(d))
       fout.close()
+      nsubruns += 1
+
+  print("wrote",nsubruns,"SamplingInput fcl files for",total_sample_events,"events")
+  return nsubruns
+
+def make_ensemble(params, scans, t, verbose=0, outdir="."):
+  """
+  Normalizes, samples and writes the SamplingInput fcls of one ensemble.
+
+  Args:
+    params (dict): livetime, BB, dioemin, tmin, rpcemin, rmcemin, rmckmax, ipaemin,
+                   run, samplingseed, tag, release and optionally maxevents.
+    scans (dict): signal -> list of rootscan.FileMetadata, see scan_inputs.
+    t (Template): the SamplingInput.fcl template.
+
+  Returns:
+    int: the number of fcl files written.
+  """
+  # live time in seconds
+  livetime = float(params["livetime"])
+  dioemin = float(params["dioemin"])
+  tmin = float(params["tmin"])
+  run = int(params["run"])
+
+  # extract normalization of each background/signal process:
+  norms = process_norms(scans, livetime, params["BB"], dioemin, params["tmin"], params["rpcemin"],
+                        params["rmcemin"], params["rmckmax"], params["ipaemin"])
+  mean_reco_events = expected_reco_events(norms, scans, verbose)
+
+  # poisson sampling:
+  total_sample_events = ROOT.gRandom.Poisson(sum(mean_reco_events.values()))
+  if int(verbose) == 1:
+    print("TOTAL EXPECTED EVENTS:",sum(mean_reco_events.values()),"GENERATING:",total_sample_events)
+
+  # calculate the normalized weights for each signal
+  weights = {signal: mean_reco_events[signal]/float(total_sample_events) for signal in mean_reco_events}
+  if int(verbose) == 1:
+    print("weights " , weights)
+
+  # generate subrun by subrun
+  comments = "#livetime: %f\n#dioemin: %f\n#tmin: %f\n#run: %f\n" % (livetime,dioemin,tmin,run)
+  return write_sampling_fcls(t, weights, scans, total_sample_events, run, params["tag"], params["release"],
+                             int(params["samplingseed"]), comments,
+                             int(float(params.get("maxevents", 10000000))), outdir)
+
+def main(args):
+  ROOT.gRandom.SetSeed(0)
+  scans = scan_inputs(args.prc, args.workers, args.verbose)
+  return make_ensemble(vars(args), scans, load_template(), args.verbose)
 
-      num_events_already_sampled += events_this_run
-    
-      if problem:
-          print("Error detected, exiting")
-          sys.exit(1)
-      if num_events_already_sampled >= total_sample_events:
-          break
-      subrun+=1
-      return events_this_run
-      
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--verbose", help="verbose")
@@ -215,6 +256,8 @@ if __name__ == "__main__":
     parser.add_argument("--samplingseed", help="samplingseed")
     parser.add_argument("--tag", help="ouput file tag")
     parser.add_argument("--prc", help="list of signals e.g CE DIO Cosmic", nargs='+')
+    parser.add_argument("--maxevents", default=10000000, help="maximum events per SamplingInput_sr<N>.fcl subrun")
+    parser.add_argument("--workers", type=int, help="number of parallel file scans (default: number of CPUs)")
     args = parser.parse_args()
     (args) = parser.parse_args()
     main(args)
@@ -0,0 +1,217 @@
+#! /usr/bin/env python
+"""
+Persistent per-file cache of the metadata found by rootscan.py.
+
+Rebuilding an ensemble usually rescans the same dts files with only a
+different livetime or seed. The scan results (Events entries, summed
+GenEventCount, summed CosmicLivetime and the SumOfWeights totals) are stored
+in a local SQLite database keyed by the file name, so repeat runs only open
+files that are not cached yet.
+
+An entry is valid if its file name matches and, when the file is reachable
+through the local file system (e.g. /pnfs), its size and modification time
+match as well. Files only reachable by URL are trusted by name, as Mu2e
+file names are unique and files are never rewritten in place.
+
+Environment variables:
+    MU2E_METADATA_CACHE : the SQLite file (default: ~/.cache/mu2e/rootmetadata.sqlite)
+
+How to use:
+metadatacache.py --dataset dts.mu2e.DIOtail95.MDC2020an.art --head 100
+metadatacache.py --files filenames_DIO
+metadatacache.py --stats
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import rootscan
+
+#-------------------------------------------------------------------------------------#
+# Reductions stored for every scanned file, on top of GenEventCount and CosmicLivetime
+CACHED_REDUCTIONS = tuple(reduction for sums in rootscan.SUM_OF_WEIGHTS.values() for reduction in sums.values())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    reco_events INTEGER NOT NULL,
+    gen_events REAL NOT NULL,
+    livetime REAL NOT NULL,
+    sums TEXT NOT NULL,
+    scanned REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def cache_path():
+    """Returns the SQLite file of the cache."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "mu2e", "rootmetadata.sqlite")
+    return os.environ.get("MU2E_METADATA_CACHE", default)
+
+def file_stamp(path):
+    """Returns (size, mtime_ns) of a local file, or (None, None) for URLs and unreachable files."""
+    if "://" in path:
+        return None, None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    return stat.st_size, stat.st_mtime_ns
+
+#-------------------------------------------------------------------------------------#
+class MetadataCache:
+    """
+    SQLite-backed cache of rootscan.FileMetadata records.
+
+    Attributes:
+        path (str): the SQLite file.
+        hits, misses (int): lookups answered from the cache / needing a scan, in this session.
+    """
+    def __init__(self, path=None):
+        self.path = path or cache_path()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # several grid or interactive jobs may share one cache
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, path, prefixes=()):
+        """
+        Returns the cached FileMetadata of path, or None if it is missing, stale,
+        or lacks any of the requested sums.
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, reco_events, gen_events, livetime, sums FROM files WHERE name = ?",
+            (os.path.basename(path),)).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, reco_events, gen_events, livetime, sums = row
+        stamp = file_stamp(path)
+        if stamp != (None, None) and size is not None and (size, mtime_ns) != stamp:
+            return None
+        sums = json.loads(sums)
+        if any(prefix not in sums for prefix in prefixes):
+            return None
+        return rootscan.FileMetadata(path, reco_events, gen_events, livetime, sums)
+
+    def put(self, records):
+        """Stores scanned records, replacing any previous entries of the same files."""
+        now = time.time()
+        rows = []
+        for record in records:
+            size, mtime_ns = file_stamp(record.path)
+            rows.append((os.path.basename(record.path), size, mtime_ns, record.reco_events,
+                         record.gen_events, record.livetime, json.dumps(record.sums), now))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def scan_files(self, paths, reductions=(), workers=None):
+        """
+        Returns rootscan.FileMetadata for paths, in order, scanning only files
+        that are not cached and storing their results.
+
+        Args:
+            paths (iterable of str): files to scan.
+            reductions (iterable of rootscan.Reduction): extra sums needed by the caller.
+            workers (int): process pool size for the files that need a scan.
+        """
+        paths = list(paths)
+        reductions = tuple(reductions)
+        prefixes = [reduction.prefix for reduction in reductions]
+        records = [self.get(path, prefixes) for path in paths]
+        missing = [path for path, record in zip(paths, records) if record is None]
+        self.hits += len(paths) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            scanned = rootscan.scan_files(missing, tuple(dict.fromkeys(CACHED_REDUCTIONS + reductions)), workers)
+            self.put(scanned)
+            by_path = dict(zip(missing, scanned))
+            records = [by_path[path] if record is None else record for path, record in zip(paths, records)]
+        self._count(hits=len(paths) - len(missing), misses=len(missing))
+        return records
+
+    def _count(self, **counts):
+        """Adds to the lifetime hit/miss counters stored in the cache."""
+        with self.connection:
+            for name, value in counts.items():
+                self.connection.execute("INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                                        (name, value, value))
+
+    def stats(self):
+        """Returns a dict with the number of cached files and the lifetime hit/miss counters."""
+        result = {"files": self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0], "hits": 0, "misses": 0}
+        result.update(self.connection.execute("SELECT name, value FROM stats").fetchall())
+        return result
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        with self.connection:
+            self.connection.execute("DELETE FROM files")
+            self.connection.execute("DELETE FROM stats")
+
+def scan_files(paths, reductions=(), workers=None):
+    """rootscan.scan_files through the default cache, reporting this session's hits and misses."""
+    with MetadataCache() as cache:
+        records = cache.scan_files(paths, reductions, workers)
+        print(f"metadata cache {cache.path}: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+    return records
+
+#-------------------------------------------------------------------------------------#
+def dataset_files(dataset):
+    """Returns the files of a dataset as listed by mu2eDatasetFileList."""
+    proc = subprocess.run(["mu2eDatasetFileList", dataset], stdout=subprocess.PIPE, text=True, check=True)
+    return [line.strip() for line in proc.stdout.splitlines() if line.strip()]
+
+def main(args):
+    with MetadataCache(args.cache) as cache:
+        if args.clear:
+            cache.clear()
+            print(f"Cleared {cache.path}")
+        paths = []
+        for dataset in args.dataset or []:
+            paths += dataset_files(dataset)[:args.head]
+        for listing in args.files or []:
+            paths += rootscan.read_file_list(listing)[:args.head]
+        if paths:
+            reductions = [rootscan.EVENT_WEIGHT] if args.eventweight else []
+            cache.scan_files(paths, reductions, args.workers)
+            print(f"warmed {len(paths)} files: {cache.hits} hits, {cache.misses} misses")
+        if args.stats:
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            rate = 100.0 * stats["hits"] / lookups if lookups else 0.0
+            print(f"{cache.path}: {stats['files']} files cached, {stats['hits']} hits, {stats['misses']} misses ({rate:.1f}% hit rate)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm and inspect the ROOT file metadata cache")
+    parser.add_argument("--cache", help="SQLite file (default: MU2E_METADATA_CACHE or ~/.cache/mu2e/rootmetadata.sqlite)")
+    parser.add_argument("--dataset", nargs='+', help="datasets to pre-warm, listed with mu2eDatasetFileList")
+    parser.add_argument("--files", nargs='+', help="file lists to pre-warm e.g. filenames_DIO")
+    parser.add_argument("--head", type=int, help="only the first HEAD files of each dataset or list")
+    parser.add_argument("--eventweight", action="store_true", help="also cache the EventWeight sums")
+    parser.add_argument("--workers", type=int, help="number of parallel file scans (default: number of CPUs)")
+    parser.add_argument("--stats", action="store_true", help="print the hit/miss statistics")
+    parser.add_argument("--clear", action="store_true", help="remove all cached entries first")
+    args = parser.parse_args()
+    main(args)
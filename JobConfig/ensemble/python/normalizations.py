@@ -1,11 +1,13 @@
 #! /usr/bin/env
-import DbService
 import argparse
-import ROOT
 import math
 import random
 import os
+import sys
+from functools import cached_property
 import numpy as np
+import simefficiencies
+import spectra
 
 
 #-------------------------------------------------------------------------------------#  
@@ -32,87 +34,125 @@ INTERNAL_PER_RMC = 0.00690
 INTERNAL_RPC_PER_RPC = 0.00690 # Source: Reference uploaded on DocDB-717
 
 
-# --- Configuration Placeholders (Mutable Variables) ---
-# These values get overwritten later in the script or during runtime.
+#-------------------------------------------------------------------------------------#
 
-# Expected rates per Proton on Target (POT)
-target_stopped_muons_per_pot = 1.0
-target_stopped_pions_per_pot = 1.0
-ipa_stopped_mu_per_POT = 1.0
-ipa_stopping_rate = 1.0
+# --- Simulation Efficiencies ---
 
-# Event counters (initialized to zero)
-num_pion_stops = 0.0
-num_pion_resamples = 0.0
-num_pion_filters = 0.0
-selected_sum_of_weights = 0.0
+class NormalizationContext:
+    """
+    Stopping rates and simulation efficiencies derived from the SimEfficiencies table.
 
-# Rate and operational parameters
-rate = 1.0
-dutyfactor = 1.0
-total_pot = 0.
+    The table is only read when one of the attributes is first accessed, and it
+    comes from the on-disk snapshot cache in simefficiencies.py, so the
+    conditions database is contacted at most once per snapshot lifetime.
 
-#-------------------------------------------------------------------------------------#
+    Args:
+        purpose (str): db purpose. Defaults to 'Sim_best'.
+        version (str): db version. Defaults to 'v1_1'.
+        run (int): run number of the IOV. Defaults to 1430.
+        table (str): table name. Defaults to 'SimEfficiencies2'.
+        ttl (float): snapshot lifetime in seconds (None uses MU2E_SIMEFF_TTL).
+        offline (bool): never query the database (None uses MU2E_SIMEFF_OFFLINE).
+    """
+    def __init__(self, purpose=simefficiencies.DEFAULT_PURPOSE, version=simefficiencies.DEFAULT_VERSION,
+                 run=simefficiencies.DEFAULT_RUN, table=simefficiencies.DEFAULT_TABLE, ttl=None, offline=None):
+        self.purpose = purpose
+        self.version = version
+        self.run = run
+        self.table = table
+        self.ttl = ttl
+        self.offline = offline
+
+    @cached_property
+    def rows(self):
+        """list[SimEfficiency]: the parsed table rows."""
+        return simefficiencies.load_table(self.purpose, self.version, self.run, self.table,
+                                          ttl=self.ttl, offline=self.offline)
+
+    def _product(self, tags):
+        """Returns the product of the efficiencies of all rows whose tag is in tags."""
+        product = 1.0
+        for row in self.rows:
+            if row.tag in tags:
+                product *= row.efficiency
+        return product
+
+    def _last(self, tag, column, default):
+        """Returns a column of the last row with the given tag."""
+        value = default
+        for row in self.rows:
+            if row.tag == tag:
+                value = getattr(row, column)
+        return value
+
+    # Fill variables associated with muon stops in target
+    @cached_property
+    def target_stopped_muons_per_pot(self):
+        tags = ("MuminusStopsCat", "MuBeamCat")
+        if not any(row.tag in tags for row in self.rows):
+            return 1.0
+        return self._product(tags) * 1000
+
+    # Fill variables associated with pion stops in target
+    @cached_property
+    def target_stopped_pions_per_pot(self):
+        return self._product(("PiBeamCat", "PiTargetStops")) # 0.001880093 * 0.5165587875
+
+    @cached_property
+    def num_pion_stops(self):
+        return self._last("PiTargetStops", "numerator", 0.0) #41324703
+
+    @cached_property
+    def num_pion_filters(self):
+        return self._last("PiMinusFilter", "numerator", 0.0) # 6634478
+
+    @cached_property
+    def num_pion_resamples(self):
+        return self._last("PhysicalPionStops", "denominator", 0.0) # 10000000000
+
+    @cached_property
+    def selected_sum_of_weights(self):
+        return self._last("PiSelectedLifeimeWeight_sampler", "efficiency", 0.0) #2393.604874
+
+    # Fill variables associated with IPA stopped muons
+    @cached_property
+    def ipa_stopped_mu_per_POT(self):
+        rate = self._product(("IPAStopsCat", "MuBeamCat"))
+        # stderr: it is first read in the middle of output callers use as data (e.g. calculateEvents.py --sweep)
+        print("IPAStopMuonRate=", rate, file=sys.stderr)
+        return rate
+
+    @property
+    def ipa_stopping_rate(self):
+        return self.ipa_stopped_mu_per_POT
+
+_context = None
+
+def get_context():
+    """Returns the module-wide NormalizationContext, creating it on first use."""
+    global _context
+    if _context is None:
+        _context = NormalizationContext()
+    return _context
+
+def set_context(context):
+    """Replaces the module-wide NormalizationContext, e.g. to use another db purpose/version."""
+    global _context
+    _context = context
+
+# Rates read from the SimEfficiencies table used to be module-level globals.
+# They are still reachable as normalizations.<name>, but are now resolved lazily.
+_CONTEXT_ATTRIBUTES = (
+    "target_stopped_muons_per_pot", "target_stopped_pions_per_pot",
+    "ipa_stopped_mu_per_POT", "ipa_stopping_rate",
+    "num_pion_stops", "num_pion_resamples", "num_pion_filters", "selected_sum_of_weights",
+)
+
+def __getattr__(name):
+    if name in _CONTEXT_ATTRIBUTES:
+        return getattr(get_context(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# --- Database Interaction ---
-
-# Establish a connection and retrieve simulation efficiencies from the database.
-
-# Initialize the database tool
-db_tool = DbService.DbTool()
-db_tool.init()
-
-# Define arguments for the database query
-query_arguments = [
-    "print-run",
-    "--purpose", "Sim_best",
-    "--version", "v1_1",
-    "--run", "1430",
-    "--table", "SimEfficiencies2",
-    "--content"
-]
-
-# Execute the database query
-db_tool.setArgs(query_arguments)
-db_tool.run()
-
-# Store the raw result for further processing
-rr = db_tool.getResult()
-
-# Fill varaibles associated with muon stops in target
-lines= rr.split("\n")
-for line in lines:
-    words = line.split(",")
-    if words[0] == "MuminusStopsCat" or words[0] == "MuBeamCat" :
-        #print(f"Including {words[0]} with rate {words[3]}")
-        rate = rate * float(words[3])
-        target_stopped_muons_per_pot = rate * 1000 
-
-
-# Fill variables associated with pion stops in target
-lines= rr.split("\n")
-for line in lines:
-    words = line.split(",")
-    if words[0] == "PiBeamCat" or words[0] == "PiTargetStops":
-        target_stopped_pions_per_pot *= float(words[3]) # 0.001880093 * 0.5165587875
-    if words[0] == "PiTargetStops":
-        num_pion_stops = words[1]    #41324703
-    if words[0] == "PiMinusFilter" :
-        num_pion_filters = words[1] # 6634478
-    if words[0] == "PhysicalPionStops" :
-        num_pion_resamples= words[2]  # 10000000000
-    if words[0] == "PiSelectedLifeimeWeight_sampler" :
-        selected_sum_of_weights = words[3] #2393.604874
-
-# Fill variables associated with IPA stopped muons
-lines= rr.split("\n")
-for line in lines:
-    words = line.split(",")
-    if words[0] == "IPAStopsCat" or words[0] == "MuBeamCat" :
-        ipa_stopping_rate = ipa_stopping_rate * float(words[3])
-        ipa_stopped_mu_per_POT = ipa_stopping_rate
-print("IPAStopMuonRate=", ipa_stopped_mu_per_POT)
-    
 #-------------------------------------------------------------------------------------#    
 def get_duty_factor(run_mode='1BB'):
     """
@@ -200,10 +240,10 @@ def get_pot(on_spill_time, run_mode='1BB', printout=False, frac=1):
 
 
 # get CE normalization:
-def ce_normalization(on_spill_time, rue, run_mode='1BB'):
+def ce_mean_events(on_spill_time, rue, run_mode='1BB'):
     """
-    Calculates the expected number of Coherent Electron (CE) events
-    for a given live time and efficiency, sampled from a Poisson distribution.
+    Calculates the mean expected number of Coherent Electron (CE) events
+    for a given live time and efficiency.
 
     Args:
         on_spill_time (float): The actual time the beam was on spill (in seconds).
@@ -211,7 +251,7 @@ def ce_normalization(on_spill_time, rue, run_mode='1BB'):
         run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
 
     Returns:
-        int: The number of expected CE events, sampled from a Poisson distribution.
+        float: The mean number of expected CE events.
     """
     # 1. Calculate total Protons on Target (POT) for the given live time
     total_pot = get_pot(on_spill_time, run_mode)
@@ -221,19 +261,40 @@ def ce_normalization(on_spill_time, rue, run_mode='1BB'):
     # Total POT * Muons stopped/POT * Muon captures/stopped muon * RUE
     mean_expected_events = (
         total_pot *
-        target_stopped_muons_per_pot *
+        get_context().target_stopped_muons_per_pot *
         CAPTURES_PER_STOPPED_MUON *
         rue
     )
+    return mean_expected_events
 
-    # 3. Sample from a Poisson distribution to get the observed event count
-    observed_event_count = np.random.poisson(lam=mean_expected_events)
+def ce_normalization(on_spill_time, rue, run_mode='1BB', rng=None):
+    """
+    Calculates the expected number of Coherent Electron (CE) events
+    for a given live time and efficiency, sampled from a Poisson distribution.
+
+    Args:
+        on_spill_time (float): The actual time the beam was on spill (in seconds).
+        rue (float): Reconstructed Unfiltered Efficiency (RUE).
+        run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        rng (numpy.random.Generator): Generator to sample from. Defaults to
+                                      the global numpy random state.
+
+    Returns:
+        int: The number of expected CE events, sampled from a Poisson distribution.
+    """
+    mean_expected_events = ce_mean_events(on_spill_time, rue, run_mode)
+
+    # Sample from a Poisson distribution to get the observed event count
+    if rng is None:
+        observed_event_count = np.random.poisson(lam=mean_expected_events)
+    else:
+        observed_event_count = rng.poisson(lam=mean_expected_events)
 
     return observed_event_count
 
 
 # get DIO normalization:
-def dio_normalization(on_spill_time, e_min, run_mode='1BB'):
+def dio_normalization(on_spill_time, e_min, run_mode='1BB', interpolate=False):
     """
     Calculates the expected number of Decay in Orbit (DIO) events above a given
     minimum energy (e_min) threshold for a specified run time.
@@ -242,6 +303,7 @@ def dio_normalization(on_spill_time, e_min, run_mode='1BB'):
         on_spill_time (float): The actual time the beam was on spill (in seconds).
         e_min (float): The minimum energy threshold for the DIO spectrum cut (MeV).
         run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        interpolate (bool): Interpolate the spectrum tail between bins. Defaults to False.
 
     Returns:
         float: The expected number of DIO physics events passing the energy cut.
@@ -249,47 +311,18 @@ def dio_normalization(on_spill_time, e_min, run_mode='1BB'):
     # 1. Calculate total Protons on Target (POT) for the given live time
     total_pot = get_pot(on_spill_time, run_mode)
 
-    # 2. Load the DIO energy spectrum data from the configuration file
-    # This assumes the environment variable MUSE_WORK_DIR is set
-    spectrum_file_path = os.path.join(
-        os.environ["MUSE_WORK_DIR"],
-        "Production/JobConfig/ensemble/tables/heeck_finer_binning_2016_szafron.tbl"
-    )
-    
-    energies = []
-    values = []
-
+    # 2. Load the DIO energy spectrum (parsed once per process, see spectra.py)
     try:
-        with open(spectrum_file_path, 'r') as spec_file:
-            for line in spec_file:
-                if not line.strip() or line.strip().startswith('#'): continue # Skip empty/comment lines
-                try:
-                    energy, value = map(float, line.split())
-                    energies.append(energy)
-                    values.append(value)
-                except ValueError:
-                    print(f"Warning: Could not parse line in spectrum file: {line.strip()}")
-
+        spectrum = spectra.load_table(spectra.DIO_TABLE)
     except FileNotFoundError:
-        raise FileNotFoundError(f"DIO spectrum file not found at: {spectrum_file_path}")
+        raise FileNotFoundError(f"DIO spectrum file not found at: {spectra.table_path(spectra.DIO_TABLE)}")
 
     # 3. Calculate normalization (fraction of spectrum above e_min)
-    total_norm = sum(values)
-    cut_norm = 0
-
-    for i in range(len(values)):
-        if energies[i] >= e_min:
-            cut_norm += values[i]
-
-    # Handle case where total_norm might be zero to avoid ZeroDivisionError
-    if total_norm == 0:
-        fraction_sampled = 0.0
-    else:
-        fraction_sampled = cut_norm / total_norm
+    fraction_sampled = spectrum.fraction_above(e_min, interpolate=interpolate)
 
     # 4. Calculate the total number of expected physics events
     # Total POT * Muons stopped/POT * DIO events/stopped muon
-    base_physics_events = total_pot * target_stopped_muons_per_pot * DIO_PER_STOPPED_MUON
+    base_physics_events = total_pot * get_context().target_stopped_muons_per_pot * DIO_PER_STOPPED_MUON
 
     # 5. Apply the energy cut fraction
     expected_events_above_emin = base_physics_events * fraction_sampled
@@ -300,7 +333,7 @@ def dio_normalization(on_spill_time, e_min, run_mode='1BB'):
 
 
 
-def rpc_normalization(on_spill_time, t_min, internal, e_min, run_mode='1BB'):
+def rpc_normalization(on_spill_time, t_min, internal, e_min, run_mode='1BB', interpolate=False):
     """
     Calculates the expected number of Radiative Pion Capture (RPC) events
     above a given energy (e_min) and time (t_min) threshold.
@@ -313,6 +346,7 @@ def rpc_normalization(on_spill_time, t_min, internal, e_min, run_mode='1BB'):
         internal (int/bool): Flag (1 or 0) to include internal conversion scaling.
         e_min (float): Minimum energy threshold for spectrum cut (MeV).
         run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        interpolate (bool): Interpolate the spectrum tail between bins. Defaults to False.
 
     Returns:
         float: The expected number of RPC physics events passing the cuts.
@@ -321,49 +355,24 @@ def rpc_normalization(on_spill_time, t_min, internal, e_min, run_mode='1BB'):
     total_pot = get_pot(on_spill_time, run_mode)
 
     # 2. Load the RPC energy spectrum data (Bistrilich source)
-    spectrum_file_path = os.path.join(
-        os.environ["MUSE_WORK_DIR"],
-        "Production/JobConfig/ensemble/tables/rpcspectrum.tbl"
-    )
-    
-    energies = []
-    values = []
-
     try:
-        with open(spectrum_file_path, 'r') as spec_file:
-            for line in spec_file:
-                if not line.strip() or line.strip().startswith('#'): continue
-                try:
-                    energy, value = map(float, line.split())
-                    energies.append(energy)
-                    values.append(value)
-                except ValueError:
-                    print(f"Warning: Could not parse line in spectrum file: {line.strip()}")
-
+        spectrum = spectra.load_table(spectra.RPC_TABLE)
     except FileNotFoundError:
-        raise FileNotFoundError(f"RPC spectrum file not found at: {spectrum_file_path}")
+        raise FileNotFoundError(f"RPC spectrum file not found at: {spectra.table_path(spectra.RPC_TABLE)}")
 
     # 3. Calculate normalization (fraction of spectrum above e_min)
-    total_norm = sum(values)
-    cut_norm = 0
-    for i in range(len(values)):
-        if energies[i] >= float(e_min):
-            cut_norm += values[i]
-
-    if total_norm == 0:
-        rpc_e_sample_frac = 0.0
-    else:
-        rpc_e_sample_frac = cut_norm / total_norm
+    rpc_e_sample_frac = spectrum.fraction_above(float(e_min), interpolate=interpolate)
 
     # 4. Calculate base physics events rate before final cuts
 
-    # Calculate efficiency terms based on simulation globals
-    filter_efficiency = float(num_pion_filters) / float(num_pion_stops)
-    survival_probability_weight = float(selected_sum_of_weights) / float(num_pion_resamples) 
+    # Calculate efficiency terms based on simulation efficiencies
+    context = get_context()
+    filter_efficiency = float(context.num_pion_filters) / float(context.num_pion_stops)
+    survival_probability_weight = float(context.selected_sum_of_weights) / float(context.num_pion_resamples) 
 
     base_physics_events = (
         total_pot *
-        target_stopped_pions_per_pot *
+        context.target_stopped_pions_per_pot *
         filter_efficiency *
         survival_probability_weight *
         RPC_PER_STOPPED_PION *
@@ -378,13 +387,13 @@ def rpc_normalization(on_spill_time, t_min, internal, e_min, run_mode='1BB'):
         print("RPC_emin=",e_min)
         print("RPC_tmin=",t_min)
         print("RPC_fraction_sampled=",rpc_e_sample_frac)
-        print("pistoprate=",target_stopped_pions_per_pot)
+        print("pistoprate=",context.target_stopped_pions_per_pot)
     
         base_physics_events *= INTERNAL_RPC_PER_RPC
     
     return base_physics_events
 
-def rmc_normalization(on_spill_time, internal, e_min, k_max=90.1, run_mode='1BB'):
+def rmc_normalization(on_spill_time, internal, e_min, k_max=90.1, run_mode='1BB', mode='binned'):
     """
     Calculates the expected number of Radiative Muon Capture (RMC) events
     above a given energy (e_min) threshold.
@@ -398,6 +407,8 @@ def rmc_normalization(on_spill_time, internal, e_min, k_max=90.1, run_mode='1BB'
         e_min (float): Minimum energy threshold for spectrum cut (MeV).
         k_max (float): Maximum possible RMC energy (MeV). Defaults to 90.1 MeV.
         run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        mode (str): 'binned' (0.1 MeV bin sum, reproduces earlier ensembles) or
+                    'analytic' (closed form integral). Defaults to 'binned'.
 
     Returns:
         float: The expected number of RMC physics events passing the cuts.
@@ -405,46 +416,19 @@ def rmc_normalization(on_spill_time, internal, e_min, k_max=90.1, run_mode='1BB'
     # 1. Calculate total Protons on Target (POT)
     total_pot = get_pot(on_spill_time, run_mode)
 
-    # 2. Generate the RMC energy spectrum internally using the closure approximation
-    energies = []
-    values = []
-    
-    # Spectrum starts at 57.05 MeV, with 0.1 MeV bins
-    start_energy = 57.05
-    bin_width = 0.1
-    num_bins = int((float(k_max) - start_energy) / bin_width)
-    
-    for i in range(num_bins):
-        temp_e = start_energy + i * bin_width
-        # Normalize energy by the maximum possible energy for the formula
-        x_fit = temp_e / float(k_max)
-        # Spectrum shape formula: (1 - 2*x + 2*x^2) * x * (1 - x)^2
-        spectrum_value = (1 - 2*x_fit + 2*x_fit*x_fit) * x_fit * (1 - x_fit) * (1 - x_fit)
-        
-        energies.append(temp_e)
-        values.append(spectrum_value)
-  
-    # 3. Calculate normalization (fraction of spectrum above e_min threshold)
-    total_norm = sum(values)
-    cut_norm = 0
-    
-    # We compare the energy threshold (e_min) to the *center* of the energy bin
-    for i in range(len(values)):
-        bin_center = energies[i]
-        
-        if (bin_center - bin_width / 2.0) >= float(e_min):
-            cut_norm += values[i]
+    # 2. Get the RMC energy spectrum generated with the closure approximation
+    # (memoized per k_max, see spectra.py)
+    spectrum = spectra.rmc_spectrum(k_max)
 
-    if total_norm == 0:
-        fraction_sampled = 0.0
-    else:
-        fraction_sampled = cut_norm / total_norm
+    # 3. Calculate normalization (fraction of spectrum above e_min threshold)
+    # In binned mode the threshold is compared to the lower edge of each 0.1 MeV bin
+    fraction_sampled = spectrum.fraction_above(float(e_min), mode=mode)
         
     # 4. Calculate the base number of RMC physics events
     # POT * Muons stopped/POT * Muon captures/stopped muon * RMC_GT_57 rate
     base_physics_events = (
         total_pot *
-        target_stopped_muons_per_pot *
+        get_context().target_stopped_muons_per_pot *
         CAPTURES_PER_STOPPED_MUON *
         RMC_GT_57_PER_CAPTURE
     )
@@ -465,18 +449,21 @@ def rmc_normalization(on_spill_time, internal, e_min, k_max=90.1, run_mode='1BB'
     return base_physics_events
 
 # get IPA Michel normalization:
-def ipaMichel_normalization(on_spill_time, ipa_de_min, run_mode='1BB'):
+def ipaMichel_normalization(on_spill_time, ipa_de_min, run_mode='1BB', interpolate=False):
     """
     Calculates the expected number of IPA (Incoming Particle Decay After Stopping)
     Michel events above a given minimum energy (ipa_de_min) threshold.
 
-    The function reads an efficiency table to find the fraction of events
-    passing the specified energy cut.
+    The function looks up the efficiency table (ipa_spec_eff.tbl, built by
+    ipa-michel-efficiency.py) to find the fraction of events passing the
+    specified energy cut.
 
     Args:
         on_spill_time (float): The actual time the beam was on spill (in seconds).
         ipa_de_min (float): Minimum energy threshold for the IPA spectrum cut (MeV).
         run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        interpolate (bool): Interpolate between tabulated thresholds instead of
+                            using the first threshold above ipa_de_min. Defaults to False.
 
     Returns:
         float: The expected number of IPA Michel events passing the energy cut.
@@ -484,45 +471,23 @@ def ipaMichel_normalization(on_spill_time, ipa_de_min, run_mode='1BB'):
     # 1. Calculate total Protons on Target (POT)
     total_pot = get_pot(on_spill_time, run_mode)
 
-    # 2. Load the IPA spectrum efficiency data
-    spectrum_file_path = os.path.join(
-        os.environ["MUSE_WORK_DIR"],
-        "Production/JobConfig/ensemble/tables/ipa_spec_eff.tbl"
-    )
-    
-    fraction_sampled = 1.0 # Default to 1 (100%) if no cut is found or file is empty
-
+    # 2. Load the IPA spectrum efficiency data (cached, see spectra.py)
     try:
-        with open(spectrum_file_path, 'r') as spec_file:
-            for line in spec_file:
-                if not line.strip() or line.strip().startswith('#'): continue # Skip empty/comment lines
-                try:
-                    # File expected format: [Energy_Threshold (MeV)] [Fraction_Passing_Cut]
-                    energy_threshold, efficiency_fraction = map(float, line.split())
-                    
-                    
-                    if energy_threshold > float(ipa_de_min):
-                        fraction_sampled = efficiency_fraction
-                        print("IPA_emin=", ipa_de_min)
-                        print("IPA_fraction_sampled=", fraction_sampled)
-                        # Calculate and return the result immediately upon finding the match
-                        n_ipa = (
-                            total_pot *
-                            ipa_stopped_mu_per_POT *
-                            IPA_DECAYS_PER_STOPPED_MUON *
-                            fraction_sampled
-                        )
-                        return n_ipa
-                except ValueError:
-                    print(f"Warning: Could not parse line in spectrum file: {line.strip()}")
-
+        table = spectra.load_table(spectra.IPA_EFFICIENCY_TABLE)
     except FileNotFoundError:
-        raise FileNotFoundError(f"IPA spectrum file not found at: {spectrum_file_path}")
+        raise FileNotFoundError(f"IPA spectrum file not found at: {spectra.table_path(spectra.IPA_EFFICIENCY_TABLE)}")
+
+    if len(table) and float(ipa_de_min) < table.energies[-1]:
+        fraction_sampled = spectra.efficiency_at(table, float(ipa_de_min), interpolate=interpolate)
+        print("IPA_emin=", ipa_de_min)
+        print("IPA_fraction_sampled=", fraction_sampled)
+    else:
+        fraction_sampled = 1.0 # Default to 1 (100%) if no cut is found or file is empty
+        print(f"Warning: No specific efficiency found for E_min > {ipa_de_min}. Using default fraction 1.0")
 
-    print(f"Warning: No specific efficiency found for E_min > {ipa_de_min}. Using default fraction 1.0")
     n_ipa = (
         total_pot *
-        ipa_stopped_mu_per_POT *
+        get_context().ipa_stopped_mu_per_POT *
         IPA_DECAYS_PER_STOPPED_MUON *
         fraction_sampled
     )
@@ -531,7 +496,7 @@ def ipaMichel_normalization(on_spill_time, ipa_de_min, run_mode='1BB'):
 # work from signal to rmue  
 def get_ce_rmue(onspilltime, nsig, run_mode = '1BB'):
     POT = get_pot(onspilltime, run_mode)
-    rmue = nsig/(POT * target_stopped_muons_per_pot * CAPTURES_PER_STOPPED_MUON)
+    rmue = nsig/(POT * get_context().target_stopped_muons_per_pot * CAPTURES_PER_STOPPED_MUON)
     return  rmue
 
 
@@ -548,6 +513,105 @@ def corsika_onspill_normalization(livetime, run_mode = '1BB'):
     return livetime
 
 
+#-------------------------------------------------------------------------------------#
+"""
+Vectorized sweeps: yields for arrays of livetimes and thresholds.
+
+Each process is factorized into a rate per POT (from the simulation efficiencies)
+and a spectrum fraction above threshold, so a full (livetime x threshold) grid
+needs one spectrum evaluation per process and one get_pot call.
+"""
+# processes supported by yield_grid, named as in make_template_fcl.py
+SWEEP_PROCESSES = ("DIO", "RPCInternal", "RPCExternal", "RMCInternal", "RMCExternal", "IPAMichel")
+
+def dio_fraction(e_min, interpolate=False):
+    """Fraction of the DIO spectrum above e_min (float or array)."""
+    return spectra.load_table(spectra.DIO_TABLE).fraction_above(e_min, interpolate=interpolate)
+
+def rpc_fraction(e_min, interpolate=False):
+    """Fraction of the RPC spectrum above e_min (float or array)."""
+    return spectra.load_table(spectra.RPC_TABLE).fraction_above(e_min, interpolate=interpolate)
+
+def rmc_fraction(e_min, k_max=90.1, mode='binned'):
+    """Fraction of the RMC closure approximation spectrum above e_min (float or array)."""
+    return spectra.rmc_spectrum(k_max).fraction_above(e_min, mode=mode)
+
+def ipa_fraction(ipa_de_min, interpolate=False):
+    """
+    IPA spectral efficiency for ipa_de_min (float or array), as in
+    ipaMichel_normalization. Thresholds beyond the table return 1.0.
+    """
+    return spectra.efficiency_at(spectra.load_table(spectra.IPA_EFFICIENCY_TABLE), ipa_de_min, interpolate)
+
+def rate_per_pot(process):
+    """
+    Returns the expected number of events per POT for a process, before any energy cut.
+
+    Args:
+        process (str): one of SWEEP_PROCESSES.
+    """
+    context = get_context()
+    if process == "DIO":
+        return context.target_stopped_muons_per_pot * DIO_PER_STOPPED_MUON
+    if process in ("RPCInternal", "RPCExternal"):
+        filter_efficiency = float(context.num_pion_filters) / float(context.num_pion_stops)
+        survival_probability_weight = float(context.selected_sum_of_weights) / float(context.num_pion_resamples)
+        rate = context.target_stopped_pions_per_pot * filter_efficiency * survival_probability_weight * RPC_PER_STOPPED_PION
+        return rate * INTERNAL_RPC_PER_RPC if process == "RPCInternal" else rate
+    if process in ("RMCInternal", "RMCExternal"):
+        rate = context.target_stopped_muons_per_pot * CAPTURES_PER_STOPPED_MUON * RMC_GT_57_PER_CAPTURE
+        return rate * INTERNAL_PER_RMC if process == "RMCInternal" else rate
+    if process == "IPAMichel":
+        return context.ipa_stopped_mu_per_POT * IPA_DECAYS_PER_STOPPED_MUON
+    raise ValueError(f"Unknown process for sweep: {process}")
+
+def spectrum_fraction(process, thresholds, k_max=90.1, interpolate=False, rmc_mode='binned'):
+    """Returns the fraction of the spectrum of a process above each threshold (MeV)."""
+    if process == "DIO":
+        return dio_fraction(thresholds, interpolate)
+    if process in ("RPCInternal", "RPCExternal"):
+        return rpc_fraction(thresholds, interpolate)
+    if process in ("RMCInternal", "RMCExternal"):
+        return rmc_fraction(thresholds, k_max, rmc_mode)
+    if process == "IPAMichel":
+        return ipa_fraction(thresholds, interpolate)
+    raise ValueError(f"Unknown process for sweep: {process}")
+
+def yield_grid(process, livetimes, thresholds, run_mode='1BB', k_max=90.1, interpolate=False, rmc_mode='binned'):
+    """
+    Expected yields of one process for every (livetime, threshold) pair.
+
+    Args:
+        process (str): one of SWEEP_PROCESSES.
+        livetimes (array): on-spill times (seconds).
+        thresholds (array): minimum energy cuts (MeV).
+        run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        k_max (float): RMC maximum energy (MeV). Defaults to 90.1 MeV.
+        interpolate (bool): interpolate DIO/RPC spectra between bins and the IPA efficiency table between thresholds.
+        rmc_mode (str): 'binned' or 'analytic' RMC spectrum.
+
+    Returns:
+        np.ndarray: yields with shape (len(livetimes), len(thresholds)).
+    """
+    total_pot = get_pot(np.atleast_1d(np.asarray(livetimes, dtype=float)), run_mode)
+    fraction = np.atleast_1d(spectrum_fraction(process, np.asarray(thresholds, dtype=float), k_max, interpolate, rmc_mode))
+    return np.outer(total_pot * rate_per_pot(process), fraction)
+
+def yield_grids(livetimes, thresholds, run_mode='1BB', k_max=90.1, interpolate=False, rmc_mode='binned'):
+    """
+    Expected yields for several processes over a common livetime axis.
+
+    Args:
+        livetimes (array): on-spill times (seconds).
+        thresholds (dict): process name -> array of minimum energy cuts (MeV).
+
+    Returns:
+        dict: process name -> yield grid of shape (len(livetimes), len(thresholds[process])).
+    """
+    return {process: yield_grid(process, livetimes, cuts, run_mode, k_max, interpolate, rmc_mode)
+            for process, cuts in thresholds.items()}
+
+
 if __name__ == '__main__':
   tst_1BB = get_pot(9.52e6)
   tst_2BB = get_pot(1.58e6)
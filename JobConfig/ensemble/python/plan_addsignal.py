@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+"""
+Batch planner for the pseudo-experiments of Stage3_addsignal_easy.sh.
+
+The dataset summary and the signal normalization are resolved once, the signal
+yields of all NEXP experiments are drawn in one vectorized call (see
+pseudoexperiments.py), and the random signal/known file selections are made
+with a generator seeded from the ensemble tags. For every experiment i it writes
+
+  filenames_ChosenSig_<i>    : the signal files chosen for the splitter
+  splitter_<i>.fcl           : splits exactly NSIG signal events into one file
+  ntuple_<i>.fcl             : makes the ntuple of the split file
+  filenames_ChosenMixed_<i>  : the split signal ntuple plus the chosen known ntuples
+
+and a summary plan_addsignal.txt (csv). Only the mu2e jobs are left to the shell loop.
+
+How to use:
+python plan_addsignal.py --known MDS2c --signal CeMLeadingLog --rate 1e-13 --BB 1BB --livetime 86000 --nknownfiles 10 --nexp 1000
+"""
+import argparse
+import contextlib
+import csv
+import re
+import subprocess
+import sys
+
+from normalizations import *
+import pseudoexperiments
+
+#-------------------------------------------------------------------------------------#
+def sam_summary(dataset):
+    """Returns the Triggered/Generated/Files/Size numbers of samDatasetsSummary.sh for a dataset."""
+    proc = subprocess.run(["samDatasetsSummary.sh", dataset], stdout=subprocess.PIPE, text=True, check=False)
+    summary = {}
+    for line in proc.stdout.splitlines():
+        if m := re.match(r"(Triggered|Generated|Files|Size):\s*(\d+)", line):
+            summary[m.group(1)] = int(m.group(2))
+    return summary
+
+def read_list(path):
+    """Returns the non-empty lines of a file list."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def write_list(path, names):
+    with open(path, "w") as f:
+        for name in names:
+            f.write(name + "\n")
+
+def write_splitter(path, files, nsig, outname):
+    """Writes the splitter fcl that copies the first nsig events of files to outname."""
+    with open(path, "w") as f:
+        f.write("#include \"Production/JobConfig/ensemble/fcl/split.fcl\"\n")
+        f.write("source.fileNames: [\n")
+        f.write(",\n".join(f"\"{name}\"" for name in files) + "\n")
+        f.write("]\n")
+        f.write(f"source.maxEvents: {nsig}\n")
+        f.write(f"outputs.out.fileName: \"{outname}\"\n")
+
+def write_ntuple(path, ntsname):
+    """Writes the ntuple fcl for the split signal file."""
+    with open(path, "w") as f:
+        f.write("#include \"EventNtuple/fcl/from_mcs-mockdata.fcl\"\n")
+        f.write(f"services.TFileService.fileName: \"{ntsname}\"\n")
+
+#-------------------------------------------------------------------------------------#
+def plan(args):
+    """
+    Plans all pseudo-experiments and writes their configs.
+
+    Returns:
+        list[dict]: one record per experiment (experiment, nsig, signal_files, known_files).
+    """
+    nexp = int(args.nexp)
+    livetime = float(args.livetime)
+    conf = f"{args.release}_{args.dbpurpose}_{args.dbversion}"
+    signal_dataset = f"mcs.{args.owner}.{args.signal}Mix{args.BB}Triggered.{conf}.art"
+    split_stem = f"{args.owner}.{args.signal}Mix{args.BB}TriggeredSplit.{conf}"
+
+    # resolve the inputs once
+    signal_files = read_list(args.signallist or f"filenames_All_{args.signal}")
+    known_files = read_list(args.knownlist or f"filenames_All_{args.known}")
+    n_total_signal = int(args.nsignalfiles) if args.nsignalfiles else sam_summary(signal_dataset).get("Files", len(signal_files))
+    events_per_file = round(float(args.ngen) / n_total_signal)
+    print(f"signal sample has {n_total_signal} files with {events_per_file} events per file")
+
+    # signal yields for every experiment in one call
+    tag = f"{args.known}_{args.signal}_{args.rate}"
+    with contextlib.redirect_stdout(sys.stderr):
+        means = pseudoexperiments.expected_means(livetime, args.BB, ["CE"], rue=float(args.rate))
+    toys = pseudoexperiments.generate(means, nexp, *pseudoexperiments.generators(tag, int(args.seed)))
+    print(f"{args.rate} for {args.BB} and {livetime} s means {means['CE']} signal events on average")
+    file_rng = pseudoexperiments.selection_generator(tag, int(args.seed))
+
+    n_known = int(args.nknownfiles)
+    if n_known > len(known_files):
+        raise ValueError(f"{n_known} known files requested but only {len(known_files)} listed")
+
+    records = []
+    for i, nsig in enumerate(toys["CE"], start=1):
+        nsig = int(nsig)
+        # if its < 1 file we need to make sure we use at least 1 file here
+        n_signal = min(max(round(nsig / events_per_file) if events_per_file else 1, 1), len(signal_files))
+
+        chosen_signal = [signal_files[j] for j in file_rng.choice(len(signal_files), n_signal, replace=False)]
+        write_list(f"filenames_ChosenSig_{i}", chosen_signal)
+        write_splitter(f"splitter_{i}.fcl", chosen_signal, nsig, f"mcs.{split_stem}.{i}.art")
+        write_ntuple(f"ntuple_{i}.fcl", f"nts.{split_stem}.{i}.root")
+
+        # create randomly mixed list of ntuples
+        mixed = [f"nts.{split_stem}.{i}.root"] + [known_files[j] for j in file_rng.choice(len(known_files), n_known, replace=False)]
+        write_list(f"filenames_ChosenMixed_{i}", [mixed[j] for j in file_rng.permutation(len(mixed))])
+
+        records.append({"experiment": i, "nsig": nsig, "signal_files": n_signal, "known_files": n_known})
+
+    with open(args.summary, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["experiment", "nsig", "signal_files", "known_files"])
+        writer.writeheader()
+        writer.writerows(records)
+    print(f"planned {nexp} pseudo experiments, summary in {args.summary}")
+    return records
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plan all Stage 3 pseudo experiments in one pass")
+    parser.add_argument("--owner", default="mu2e", help="dataset owner")
+    parser.add_argument("--known", required=True, help="known physics tag e.g. MDS2c")
+    parser.add_argument("--signal", required=True, help="signal primary e.g. CeMLeadingLog")
+    parser.add_argument("--rate", required=True, help="signal rate e.g. 1e-13")
+    parser.add_argument("--release", default="MDC2020ba", help="SimJob tag e.g. MDC2020ba")
+    parser.add_argument("--dbpurpose", default="best", help="db purpose e.g. best")
+    parser.add_argument("--dbversion", default="v1_3", help="db version e.g. v1_3")
+    parser.add_argument("--BB", required=True, help="BB mode e.g. 1BB")
+    parser.add_argument("--livetime", required=True, help="livetime used for the signal normalization")
+    parser.add_argument("--nknownfiles", required=True, help="number of known ntuples per experiment")
+    parser.add_argument("--nexp", default=1, help="number of pseudo experiments")
+    parser.add_argument("--ngen", default=10000000, help="generated events in the signal sample")
+    parser.add_argument("--nsignalfiles", help="files in the signal sample (default: from samDatasetsSummary.sh)")
+    parser.add_argument("--signallist", help="signal file list (default: filenames_All_<signal>)")
+    parser.add_argument("--knownlist", help="known ntuple list (default: filenames_All_<known>)")
+    parser.add_argument("--seed", default=0, help="extra seed combined with the tags")
+    parser.add_argument("--summary", default="plan_addsignal.txt", help="summary file")
+    args = parser.parse_args()
+    plan(args)
@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+"""
+Vectorized pseudo-experiment generator for ensemble yields.
+
+For N toy experiments the observed total is drawn from a Poisson distribution
+with mean equal to the sum of the expected yields, and it is then split across
+processes with a multinomial draw weighted by those yields. This is equivalent
+to independent Poisson draws per process, but keeps the total and the split as
+separate, reproducible streams.
+
+All randomness comes from a numpy.random.Generator seeded from a single master
+seed derived from the ensemble tag, so the same tag always gives the same toys,
+and the first k experiments do not depend on how many are generated.
+
+How to use:
+python pseudoexperiments.py --tag MDS2c --nexp 1000 --livetime 1e6 --BB 1BB --rue 1e-13 --dioemin 95 --prc CE DIO
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import sys
+
+import numpy as np
+
+from normalizations import *
+
+# processes understood by expected_means, in output order
+PROCESSES = ("CE", "DIO", "RPCInternal", "RPCExternal", "RMCInternal", "RMCExternal", "IPAMichel", "Cosmic")
+
+#-------------------------------------------------------------------------------------#
+def master_seed(tag, seed=0):
+    """Returns a 128-bit master seed derived from the ensemble tag and an optional extra seed."""
+    digest = hashlib.sha256(f"{tag}:{int(seed)}".encode()).hexdigest()
+    return int(digest[:32], 16)
+
+def generators(tag, seed=0):
+    """
+    Returns (total_rng, split_rng): independent generators for the Poisson totals
+    and the multinomial splits, both derived from master_seed(tag, seed).
+    """
+    total_seq, split_seq = np.random.SeedSequence(master_seed(tag, seed)).spawn(2)
+    return np.random.default_rng(total_seq), np.random.default_rng(split_seq)
+
+def selection_generator(tag, seed=0):
+    """
+    Returns a third generator derived from master_seed(tag, seed), independent of
+    generators(), for choices such as which input files an experiment uses.
+    """
+    return np.random.default_rng(np.random.SeedSequence(master_seed(tag, seed)).spawn(3)[2])
+
+#-------------------------------------------------------------------------------------#
+def expected_means(livetime, run_mode='1BB', processes=PROCESSES, rue=None, dioemin=None, rpcemin=None,
+                   rmcemin=None, k_max=90.1, ipaemin=None, cosmic_rate=None):
+    """
+    Returns the expected (mean) yield of each requested process for one experiment.
+
+    Args:
+        livetime (float): on-spill time (seconds).
+        run_mode (str): The operational mode ('1BB' or '2BB'). Defaults to '1BB'.
+        processes (iterable): subset of PROCESSES.
+        rue (float): conversion rate for CE.
+        dioemin, rpcemin, rmcemin, ipaemin (float): energy thresholds (MeV).
+        k_max (float): RMC maximum energy (MeV).
+        cosmic_rate (float): reconstructed cosmic events per second of livetime.
+
+    Returns:
+        dict: process name -> mean number of events.
+    """
+    thresholds = {"DIO": dioemin, "RPCInternal": rpcemin, "RPCExternal": rpcemin,
+                  "RMCInternal": rmcemin, "RMCExternal": rmcemin, "IPAMichel": ipaemin}
+    means = {}
+    for process in processes:
+        if process == "CE":
+            if rue is None:
+                raise ValueError("CE requires rue")
+            means[process] = ce_mean_events(livetime, rue, run_mode)
+        elif process == "Cosmic":
+            if cosmic_rate is None:
+                raise ValueError("Cosmic requires cosmic_rate")
+            means[process] = cosmic_rate * livetime
+        elif process in thresholds:
+            if thresholds[process] is None:
+                raise ValueError(f"{process} requires an energy threshold")
+            means[process] = float(yield_grid(process, [livetime], [thresholds[process]], run_mode, k_max)[0, 0])
+        else:
+            raise ValueError(f"Unknown process: {process}, choose from {', '.join(PROCESSES)}")
+    return means
+
+def generate(means, n_experiments, total_rng, split_rng):
+    """
+    Generates per-process counts for n_experiments toy experiments.
+
+    Args:
+        means (dict): process name -> mean number of events.
+        n_experiments (int): number of toy experiments.
+        total_rng, split_rng (numpy.random.Generator): see generators().
+
+    Returns:
+        dict: process name -> int array of shape (n_experiments,), plus
+              'total' holding the Poisson-sampled totals.
+    """
+    names = list(means)
+    mu = np.array([means[name] for name in names], dtype=float)
+    total_mean = mu.sum()
+    totals = total_rng.poisson(total_mean, size=int(n_experiments))
+    if total_mean > 0:
+        counts = split_rng.multinomial(totals, mu / total_mean)
+    else:
+        counts = np.zeros((int(n_experiments), len(names)), dtype=np.int64)
+    result = {name: counts[:, i] for i, name in enumerate(names)}
+    result["total"] = totals
+    return result
+
+#-------------------------------------------------------------------------------------#
+def main(args):
+    # keep diagnostics printed by the normalizations out of the data stream
+    with contextlib.redirect_stdout(sys.stderr):
+        means = expected_means(float(args.livetime), str(args.BB), args.prc,
+                               rue=None if args.rue is None else float(args.rue),
+                               dioemin=None if args.dioemin is None else float(args.dioemin),
+                               rpcemin=None if args.rpcemin is None else float(args.rpcemin),
+                               rmcemin=None if args.rmcemin is None else float(args.rmcemin),
+                               k_max=float(args.rmckmax),
+                               ipaemin=None if args.ipaemin is None else float(args.ipaemin),
+                               cosmic_rate=None if args.cosmicrate is None else float(args.cosmicrate))
+    print("means", means, file=sys.stderr)
+    toys = generate(means, int(args.nexp), *generators(args.tag, int(args.seed)))
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump({"tag": args.tag, "seed": int(args.seed), "means": means,
+                       "counts": {name: values.tolist() for name, values in toys.items()}}, out, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.writer(out)
+            names = list(means) + ["total"]
+            writer.writerow(["experiment"] + names)
+            for i in range(int(args.nexp)):
+                writer.writerow([i + 1] + [int(toys[name][i]) for name in names])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return toys
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate pseudo-experiment yields")
+    parser.add_argument("--tag", required=True, help="ensemble tag used to derive the master seed e.g. MDS2c")
+    parser.add_argument("--seed", default=0, help="extra seed combined with the tag")
+    parser.add_argument("--nexp", default=1, help="number of pseudo experiments")
+    parser.add_argument("--BB", default="1BB", help="BB mode e.g. 1BB")
+    parser.add_argument("--livetime", required=True, help="simulated livetime")
+    parser.add_argument("--prc", nargs='+', default=["CE"], help=f"processes, from {' '.join(PROCESSES)}")
+    parser.add_argument("--rue", help="signal branching rate")
+    parser.add_argument("--dioemin", help="min energy cut dio")
+    parser.add_argument("--rpcemin", help="min energy cut rpc")
+    parser.add_argument("--rmcemin", help="min energy cut rmc")
+    parser.add_argument("--rmckmax", default=90.1, help="kmax theory value")
+    parser.add_argument("--ipaemin", help="min energy cut ipa")
+    parser.add_argument("--cosmicrate", help="reconstructed cosmic events per second of livetime")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="output format")
+    parser.add_argument("--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+    main(args)
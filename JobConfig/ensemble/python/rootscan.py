@@ -0,0 +1,218 @@
+#! /usr/bin/env python
+"""
+Parallel, columnar metadata scan of art/ROOT files.
+
+The ensemble scripts need a few numbers from every input file: the number of
+entries in the Events tree, the summed GenEventCount or CosmicLivetime of the
+SubRuns tree, and for some samples the SumOfWeights or EventWeight products.
+Instead of walking the trees entry by entry from Python, each requested
+product is reduced with an RDataFrame, so all sums of one tree come from a
+single compiled event loop. Files are fanned out over a process pool and the
+results come back in the order of the input list.
+
+ROOT is imported inside the workers, so the parent process does not need it
+and the pool can safely use the "spawn" start method.
+
+How to use:
+python rootscan.py --files filenames_DIO --workers 8
+python rootscan.py --files filenames_pionfilter --sums filter
+"""
+import argparse
+import concurrent.futures
+import csv
+import multiprocessing
+import os
+import sys
+from typing import NamedTuple
+
+#-------------------------------------------------------------------------------------#
+class Reduction(NamedTuple):
+    """A product to sum over a tree: the tree name, the branch name prefix and the product method."""
+    tree: str
+    prefix: str
+    method: str
+
+GEN_EVENT_COUNT = Reduction("SubRuns", "mu2e::GenEventCount", "count")
+COSMIC_LIVETIME = Reduction("SubRuns", "mu2e::CosmicLivetime", "liveTime")
+EVENT_WEIGHT = Reduction("Events", "mu2e::EventWeight", "weight")
+
+# SumOfWeights products written by the pion filter and the stop sampler, see getWeights.py
+SUM_OF_WEIGHTS = {
+    "filter": {
+        "total": Reduction("SubRuns", "mu2e::SumOfWeights_PionFilter_total", "sum"),
+        "selected": Reduction("SubRuns", "mu2e::SumOfWeights_PionFilter_selected", "sum"),
+    },
+    "sampler": {
+        "total": Reduction("SubRuns", "mu2e::SumOfWeights_StopSelection_total_PhysicalPionStops", "sum"),
+        "selected": Reduction("SubRuns", "mu2e::SumOfWeights_StopSelection_sampled_PhysicalPionStops", "sum"),
+    },
+}
+
+class FileMetadata(NamedTuple):
+    """
+    Scan result for one file.
+
+    Attributes:
+        path (str): the file scanned.
+        reco_events (int): entries in the Events tree.
+        gen_events (float): summed GenEventCount::count() over the SubRuns tree.
+        livetime (float): summed CosmicLivetime::liveTime() over the SubRuns tree.
+        sums (dict): Reduction.prefix -> summed value, for any extra reductions requested.
+    """
+    path: str
+    reco_events: int
+    gen_events: float
+    livetime: float
+    sums: dict
+
+#-------------------------------------------------------------------------------------#
+def find_branch(tree, prefix):
+    """Returns the name of the branch starting with prefix (the last one if several match), or ''."""
+    name = ""
+    for branch in tree.GetListOfBranches():
+        if branch.GetName().startswith(prefix):
+            name = branch.GetName()
+    return name
+
+def reduce_tree(ROOT, tree, reductions):
+    """
+    Sums the products of reductions over all entries of tree in one RDataFrame loop.
+
+    Reductions whose branch is not present in the tree sum to 0.
+
+    Returns:
+        dict: Reduction -> float.
+    """
+    results = {reduction: 0.0 for reduction in reductions}
+    if not tree or tree.GetEntries() == 0:
+        return results
+    df = ROOT.RDataFrame(tree)
+    booked = {}
+    for i, reduction in enumerate(reductions):
+        branch = find_branch(tree, reduction.prefix)
+        if not branch:
+            continue
+        column = f"product_{i}"
+        df = df.Alias(f"wrapper_{i}", branch).Define(column, f"double(wrapper_{i}.product()->{reduction.method}())")
+        booked[reduction] = df.Sum(column)
+    # the first GetValue triggers one event loop that fills every booked sum
+    for reduction, result in booked.items():
+        results[reduction] = float(result.GetValue())
+    return results
+
+def scan_file(path, reductions=()):
+    """
+    Returns the FileMetadata of one art/ROOT file.
+
+    Args:
+        path (str): file name or xroot url.
+        reductions (iterable of Reduction): extra products to sum, on top of
+            GenEventCount and CosmicLivetime.
+    """
+    import ROOT
+
+    fin = ROOT.TFile.Open(path)
+    if not fin or fin.IsZombie():
+        raise OSError(f"Could not open ROOT file: {path}")
+    try:
+        events = fin.Get("Events")
+        reco_events = int(events.GetEntries()) if events else 0
+        extra = tuple(reductions)
+        requested = (GEN_EVENT_COUNT, COSMIC_LIVETIME) + extra
+        sums = {}
+        for tree_name in dict.fromkeys(reduction.tree for reduction in requested):
+            tree_reductions = [reduction for reduction in requested if reduction.tree == tree_name]
+            sums.update(reduce_tree(ROOT, fin.Get(tree_name), tree_reductions))
+    finally:
+        fin.Close()
+    return FileMetadata(path, reco_events, sums[GEN_EVENT_COUNT], sums[COSMIC_LIVETIME],
+                        {reduction.prefix: sums[reduction] for reduction in extra})
+
+def event_id(path, entry):
+    """
+    Returns the (run, subRun, event) of an entry of the Events tree, e.g. for
+    a SamplingInput skipToEvent. Only that entry's EventAuxiliary is read.
+    """
+    import ROOT
+
+    fin = ROOT.TFile.Open(path)
+    if not fin or fin.IsZombie():
+        raise OSError(f"Could not open ROOT file: {path}")
+    try:
+        events = fin.Get("Events")
+        events.SetBranchStatus("*", 0)
+        events.SetBranchStatus("EventAuxiliary*", 1)
+        events.GetEntry(int(entry))
+        aux = events.EventAuxiliary
+        return int(aux.run()), int(aux.subRun()), int(aux.event())
+    finally:
+        fin.Close()
+
+def default_workers():
+    """Returns the default pool size: MU2E_SCAN_WORKERS, or the number of CPUs."""
+    return int(os.environ.get("MU2E_SCAN_WORKERS", os.cpu_count() or 1))
+
+def map_files(function, paths, *args, workers=None):
+    """
+    Returns [function(path, *args) for path in paths], spread over a process pool.
+
+    The pool uses the spawn start method, so every worker starts with a fresh
+    ROOT. function must be a module-level function (picklable).
+
+    Args:
+        function (callable): called with each path followed by args.
+        paths (iterable of str): files to process.
+        workers (int): process pool size; defaults to default_workers().
+            With 1 worker, or a single file, everything runs in this process.
+    """
+    paths = list(paths)
+    workers = min(default_workers() if workers is None else int(workers), len(paths))
+    if workers <= 1:
+        return [function(path, *args) for path in paths]
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(function, paths, *([arg] * len(paths) for arg in args)))
+
+def scan_files(paths, reductions=(), workers=None):
+    """
+    Scans files in parallel and returns their FileMetadata in the order of paths.
+
+    Args:
+        paths (iterable of str): files to scan.
+        reductions (iterable of Reduction): extra products to sum in every file.
+        workers (int): process pool size; defaults to default_workers().
+            With 1 worker, or a single file, the scan runs in this process.
+    """
+    return map_files(scan_file, paths, tuple(reductions), workers=workers)
+
+def read_file_list(path):
+    """Returns the non-empty, stripped lines of a file list such as filenames_<signal>."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def total(records, field):
+    """Sums a FileMetadata field, or an entry of FileMetadata.sums if field is a Reduction."""
+    if isinstance(field, Reduction):
+        return sum(record.sums.get(field.prefix, 0.0) for record in records)
+    return sum(getattr(record, field) for record in records)
+
+#-------------------------------------------------------------------------------------#
+def main(args):
+    reductions = list(SUM_OF_WEIGHTS[args.sums].values()) if args.sums else []
+    if args.eventweight:
+        reductions.append(EVENT_WEIGHT)
+    records = scan_files(read_file_list(args.files), reductions, args.workers)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["file", "reco_events", "gen_events", "livetime"] + [reduction.prefix for reduction in reductions])
+    for record in records:
+        writer.writerow([record.path, record.reco_events, record.gen_events, record.livetime]
+                        + [record.sums[reduction.prefix] for reduction in reductions])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan art/ROOT files for event counts, livetime and weights")
+    parser.add_argument("--files", required=True, help="file list, one file per line")
+    parser.add_argument("--workers", type=int, help="number of parallel scans (default: number of CPUs)")
+    parser.add_argument("--sums", choices=sorted(SUM_OF_WEIGHTS), help="also sum the SumOfWeights products of the filter or sampler")
+    parser.add_argument("--eventweight", action="store_true", help="also sum EventWeight over the Events tree")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+"""
+On-disk snapshot cache for the SimEfficiencies conditions tables.
+
+The normalization utilities need a handful of rows from the SimEfficiencies
+table (stopping rates, pion filter counts, lifetime weights). Querying the
+conditions database costs a round trip for every script invocation, so the
+query result is parsed once and stored as a JSON snapshot keyed by
+(purpose, version, run, table). Later invocations reuse the snapshot until
+it is older than the TTL or is explicitly invalidated.
+
+Environment variables:
+    MU2E_SIMEFF_CACHE_DIR : directory holding the snapshots
+                            (default: ~/.cache/mu2e/simefficiencies)
+    MU2E_SIMEFF_TTL       : snapshot lifetime in seconds (default: 86400,
+                            0 or negative disables expiry)
+    MU2E_SIMEFF_OFFLINE   : if set to 1, never contact the database and use
+                            whatever snapshot exists, regardless of age
+
+Run as a script to inspect, refresh or invalidate a snapshot:
+    simefficiencies.py --show
+    simefficiencies.py --refresh --purpose Sim_best --version v1_1 --run 1430
+    simefficiencies.py --invalidate
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import NamedTuple
+
+#-------------------------------------------------------------------------------------#
+# Default query used by normalizations.py
+DEFAULT_PURPOSE = "Sim_best"
+DEFAULT_VERSION = "v1_1"
+DEFAULT_RUN = 1430
+DEFAULT_TABLE = "SimEfficiencies2"
+
+# Snapshot lifetime in seconds
+DEFAULT_TTL = 86400.0
+
+# Bump when the snapshot layout changes so stale formats are refetched
+SNAPSHOT_FORMAT = 1
+
+class SimEfficiency(NamedTuple):
+    """One row of a SimEfficiencies table: tag, numerator, denominator, efficiency."""
+    tag: str
+    numerator: float
+    denominator: float
+    efficiency: float
+
+#-------------------------------------------------------------------------------------#
+def cache_dir():
+    """Returns the directory holding the snapshot files."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "mu2e", "simefficiencies")
+    return os.environ.get("MU2E_SIMEFF_CACHE_DIR", default)
+
+def cache_path(purpose, version, run, table):
+    """Returns the snapshot file for a given (purpose, version, run, table) key."""
+    name = f"{table}_{purpose}_{version}_{int(run)}.json"
+    return os.path.join(cache_dir(), name)
+
+def default_ttl():
+    """Returns the snapshot lifetime in seconds from MU2E_SIMEFF_TTL."""
+    return float(os.environ.get("MU2E_SIMEFF_TTL", DEFAULT_TTL))
+
+def offline_mode():
+    """Returns True if MU2E_SIMEFF_OFFLINE requests that the database is never queried."""
+    return os.environ.get("MU2E_SIMEFF_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+#-------------------------------------------------------------------------------------#
+def fetch_table(purpose, version, run, table):
+    """
+    Queries the conditions database and returns the raw table content.
+
+    DbService is imported here so that reading a snapshot does not require it.
+    """
+    import DbService
+
+    db_tool = DbService.DbTool()
+    db_tool.init()
+    db_tool.setArgs([
+        "print-run",
+        "--purpose", purpose,
+        "--version", version,
+        "--run", str(run),
+        "--table", table,
+        "--content"
+    ])
+    db_tool.run()
+    return db_tool.getResult()
+
+def parse_table(text):
+    """
+    Parses the comma separated table content into SimEfficiency rows.
+
+    Lines that do not have a tag followed by three numeric columns (headers,
+    comments, blank lines) are skipped. Row order is preserved.
+    """
+    rows = []
+    for line in text.split("\n"):
+        words = line.split(",")
+        if len(words) < 4:
+            continue
+        try:
+            rows.append(SimEfficiency(words[0], float(words[1]), float(words[2]), float(words[3])))
+        except ValueError:
+            continue
+    return rows
+
+#-------------------------------------------------------------------------------------#
+def read_snapshot(path):
+    """Returns (fetched_time, rows) from a snapshot file, or None if missing or unreadable."""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            return None
+        rows = [SimEfficiency(*row) for row in snapshot["rows"]]
+        return float(snapshot["fetched"]), rows
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def write_snapshot(path, key, rows):
+    """Atomically writes a snapshot so concurrent jobs never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "key": key,
+        "fetched": time.time(),
+        "rows": [list(row) for row in rows],
+    }
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, indent=1)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def invalidate(purpose=DEFAULT_PURPOSE, version=DEFAULT_VERSION, run=DEFAULT_RUN, table=DEFAULT_TABLE):
+    """Removes the snapshot for the given key. Returns True if a snapshot was removed."""
+    path = cache_path(purpose, version, run, table)
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def load_table(purpose=DEFAULT_PURPOSE, version=DEFAULT_VERSION, run=DEFAULT_RUN, table=DEFAULT_TABLE,
+               ttl=None, offline=None, refresh=False):
+    """
+    Returns the parsed rows of a SimEfficiencies table, using the snapshot cache.
+
+    Args:
+        purpose, version, run, table: the conditions database query key.
+        ttl (float): snapshot lifetime in seconds; defaults to MU2E_SIMEFF_TTL.
+                     Zero or negative means snapshots never expire.
+        offline (bool): never query the database; defaults to MU2E_SIMEFF_OFFLINE.
+        refresh (bool): ignore any existing snapshot and query the database.
+
+    Returns:
+        list[SimEfficiency]: the table rows, in database order.
+    """
+    ttl = default_ttl() if ttl is None else float(ttl)
+    offline = offline_mode() if offline is None else bool(offline)
+    path = cache_path(purpose, version, run, table)
+
+    snapshot = None if refresh else read_snapshot(path)
+    if snapshot is not None:
+        fetched, rows = snapshot
+        if offline or ttl <= 0 or time.time() - fetched < ttl:
+            return rows
+
+    if offline:
+        raise RuntimeError(f"Offline mode requested but no SimEfficiencies snapshot at: {path}")
+
+    rows = parse_table(fetch_table(purpose, version, run, table))
+    key = {"purpose": purpose, "version": version, "run": int(run), "table": table}
+    try:
+        write_snapshot(path, key, rows)
+    except OSError as e:
+        print(f"Warning: could not write SimEfficiencies snapshot {path}: {e}", file=sys.stderr)
+    return rows
+
+#-------------------------------------------------------------------------------------#
+def main(args):
+    key = (args.purpose, args.version, args.run, args.table)
+    if args.invalidate:
+        removed = invalidate(*key)
+        print(f"{'Removed' if removed else 'No snapshot at'} {cache_path(*key)}")
+        return
+    rows = load_table(*key, refresh=args.refresh)
+    if args.show or args.refresh:
+        print(f"# {cache_path(*key)}")
+        for row in rows:
+            print(f"{row.tag}, {row.numerator}, {row.denominator}, {row.efficiency}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the SimEfficiencies snapshot cache")
+    parser.add_argument("--purpose", default=DEFAULT_PURPOSE, help="db purpose e.g. Sim_best")
+    parser.add_argument("--version", default=DEFAULT_VERSION, help="db version e.g. v1_1")
+    parser.add_argument("--run", type=int, default=DEFAULT_RUN, help="run number")
+    parser.add_argument("--table", default=DEFAULT_TABLE, help="table name")
+    parser.add_argument("--refresh", action="store_true", help="query the database and rewrite the snapshot")
+    parser.add_argument("--invalidate", action="store_true", help="remove the snapshot")
+    parser.add_argument("--show", action="store_true", help="print the cached rows")
+    args = parser.parse_args()
+    main(args)
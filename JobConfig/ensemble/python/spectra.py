@@ -0,0 +1,310 @@
+#! /usr/bin/env python
+"""
+Spectra used by the ensemble normalizations.
+
+Each two-column table (energy, value) in JobConfig/ensemble/tables is loaded
+once per process into numpy arrays together with its cumulative tail sum, so
+the fraction of the spectrum above any threshold is a binary search instead
+of a rescan of the text file.
+
+The parsed arrays are also stored in a binary sidecar next to the table
+(<table>.npz). The sidecar records the size, modification time and SHA-1 of
+the table it was built from and is rebuilt whenever the table changes. If the
+table directory is read-only (e.g. cvmfs) the sidecar is simply not written.
+
+The RMC closure approximation spectrum is generated rather than tabulated;
+RMCSpectrum evaluates it with numpy and memoizes it per (k_max, bin_width).
+"""
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+#-------------------------------------------------------------------------------------#
+TABLE_DIR = "Production/JobConfig/ensemble/tables"
+
+# Tables used by normalizations.py and ipa-michel-efficiency.py
+DIO_TABLE = "heeck_finer_binning_2016_szafron.tbl"
+DIO_1H_TABLE = "heeck_finer_binning_2016_szafron-scaled-to-1H.tbl"
+DIO_6C_TABLE = "heeck_finer_binning_2016_szafron-scaled-to-6C.tbl"
+RPC_TABLE = "rpcspectrum.tbl"
+IPA_EFFICIENCY_TABLE = "ipa_spec_eff.tbl"
+
+SIDECAR_SUFFIX = ".npz"
+
+def table_path(name):
+    """Returns the full path of a table in JobConfig/ensemble/tables. Requires MUSE_WORK_DIR."""
+    return os.path.join(os.environ["MUSE_WORK_DIR"], TABLE_DIR, name)
+
+#-------------------------------------------------------------------------------------#
+class SpectrumTable:
+    """
+    A binned spectrum with a precomputed cumulative tail.
+
+    Attributes:
+        path (str): the text table this spectrum was read from.
+        energies (np.ndarray): bin energies (MeV), in increasing order.
+        values (np.ndarray): bin contents.
+        tail (np.ndarray): tail[i] = sum(values[i:]); tail[len(values)] = 0.
+        total (float): sum of all bin contents.
+    """
+    def __init__(self, path, energies, values):
+        self.path = path
+        order = np.argsort(energies, kind="stable")
+        self.energies = np.asarray(energies, dtype=float)[order]
+        self.values = np.asarray(values, dtype=float)[order]
+        self.tail = np.append(np.cumsum(self.values[::-1])[::-1], 0.0)
+        self.total = float(np.sum(self.values)) if len(self.values) else 0.0
+
+    def __len__(self):
+        return len(self.energies)
+
+    def fraction_above(self, e_min, interpolate=False):
+        """
+        Returns the fraction of the spectrum with energy >= e_min.
+
+        Args:
+            e_min (float or array): minimum energy threshold(s) (MeV).
+            interpolate (bool): if True, interpolate the cumulative tail
+                linearly between neighbouring bins instead of stepping at
+                bin energies.
+
+        Returns:
+            float or np.ndarray: matching the shape of e_min.
+        """
+        e_min = np.asarray(e_min, dtype=float)
+        if self.total == 0:
+            fraction = np.zeros_like(e_min)
+        elif interpolate:
+            fraction = np.interp(e_min, self.energies, self.tail[:-1], left=self.tail[0], right=0.0) / self.total
+        else:
+            fraction = self.tail[np.searchsorted(self.energies, e_min, side="left")] / self.total
+        return float(fraction) if fraction.ndim == 0 else fraction
+
+#-------------------------------------------------------------------------------------#
+def parse_table(path):
+    """Reads a whitespace separated two-column text table, skipping blank and comment lines."""
+    energies = []
+    values = []
+    with open(path, 'r') as spec_file:
+        for line in spec_file:
+            if not line.strip() or line.strip().startswith('#'): continue # Skip empty/comment lines
+            try:
+                energy, value = map(float, line.split())
+                energies.append(energy)
+                values.append(value)
+            except ValueError:
+                print(f"Warning: Could not parse line in spectrum file: {line.strip()}")
+    return energies, values
+
+def file_digest(path):
+    """Returns the SHA-1 hex digest of a file."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+def read_sidecar(path, stat):
+    """
+    Returns (energies, values) from the sidecar of a table, or None if it is
+    missing or was built from a different version of the table. A sidecar
+    whose table was touched without changing its content is rewritten with
+    the new modification time, so later loads do not hash the table again.
+    """
+    try:
+        with np.load(sidecar_path(path), allow_pickle=False) as sidecar:
+            if int(sidecar["size"]) != stat.st_size:
+                return None
+            energies, values = sidecar["energies"], sidecar["values"]
+            touched = int(sidecar["mtime_ns"]) != stat.st_mtime_ns
+            sha1 = str(sidecar["sha1"])
+    except (OSError, KeyError, ValueError):
+        return None
+    if touched:
+        if sha1 != file_digest(path):
+            return None
+        write_sidecar(path, stat, energies, values, sha1=sha1)
+    return energies, values
+
+def write_sidecar(path, stat, energies, values, sha1=None):
+    """Atomically writes the sidecar of a table. Read-only table directories are skipped."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, energies=np.asarray(energies, dtype=float), values=np.asarray(values, dtype=float),
+                     size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=sha1 or file_digest(path))
+        os.replace(tmp, sidecar_path(path))
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+@lru_cache(maxsize=None)
+def load_spectrum(path):
+    """
+    Returns the SpectrumTable for a text table, loaded at most once per process.
+
+    Args:
+        path (str): path of the text table.
+
+    Raises:
+        FileNotFoundError: if the table does not exist.
+    """
+    stat = os.stat(path)
+    arrays = read_sidecar(path, stat)
+    if arrays is None:
+        arrays = parse_table(path)
+        write_sidecar(path, stat, *arrays)
+    return SpectrumTable(path, *arrays)
+
+def load_table(name):
+    """Returns the SpectrumTable for a table in JobConfig/ensemble/tables."""
+    return load_spectrum(table_path(name))
+
+#-------------------------------------------------------------------------------------#
+# Efficiency tables: (threshold, efficiency) such as ipa_spec_eff.tbl
+def efficiency_at(table, thresholds, interpolate=False):
+    """
+    Looks up an efficiency-vs-threshold table with a binary search.
+
+    Args:
+        table (SpectrumTable): the table, energies being the thresholds.
+        thresholds (float or array): thresholds to look up (MeV).
+        interpolate (bool): if False, use the first tabulated threshold
+            greater than the requested one; if True, interpolate linearly
+            between the neighbouring tabulated thresholds.
+
+    Returns:
+        float or np.ndarray: matching the shape of thresholds. Thresholds
+        beyond the last tabulated one return 1.0, below the first one the
+        first efficiency.
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    if interpolate and len(table):
+        efficiency = np.interp(thresholds, table.energies, table.values, left=table.values[0], right=1.0)
+    else:
+        index = np.searchsorted(table.energies, thresholds, side="right")
+        efficiency = np.append(table.values, 1.0)[index]
+    return float(efficiency) if efficiency.ndim == 0 else efficiency
+
+def cumulative_trapezoid(y, x):
+    """Returns the cumulative trapezoidal integral of y(x), starting at 0 (as scipy's cumulative_trapezoid with initial=0)."""
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    return np.concatenate(([0.0], np.cumsum(np.diff(x) * (y[1:] + y[:-1]) / 2.0)))
+
+def tail_efficiency(energies, density, thresholds):
+    """
+    Returns the fraction of a density above each threshold, from one
+    cumulative trapezoid pass over the whole curve.
+
+    Args:
+        energies (np.ndarray): increasing grid (MeV).
+        density (np.ndarray): density on that grid.
+        thresholds (float or array): thresholds (MeV).
+    """
+    cumulative = cumulative_trapezoid(density, energies)
+    below = np.interp(np.asarray(thresholds, dtype=float), energies, cumulative)
+    return (cumulative[-1] - below) / cumulative[-1]
+
+def write_table(path, energies, values):
+    """Writes a two-column text table and its binary sidecar."""
+    with open(path, "w") as f:
+        for energy, value in zip(energies, values):
+            f.write(f"{float(energy)!r} {float(value)!r}\n")
+    write_sidecar(path, os.stat(path), energies, values)
+    load_spectrum.cache_clear()
+
+#-------------------------------------------------------------------------------------#
+# RMC closure approximation, adapted from MuonCaptureSpectrum.cc:
+#   dN/dE ~ (1 - 2x + 2x^2) x (1 - x)^2,  x = E/k_max
+RMC_START_ENERGY = 57.05 # centre of the first 0.1 MeV bin
+RMC_BIN_WIDTH = 0.1
+RMC_LOW_ENERGY = 57.0    # RMC rates are quoted for photons above 57 MeV
+
+def rmc_closure_shape(x):
+    """The closure approximation shape (1 - 2x + 2x^2) x (1 - x)^2, for float or array x."""
+    return (1 - 2*x + 2*x*x) * x * (1 - x) * (1 - x)
+
+def rmc_closure_integral(x):
+    """
+    Antiderivative of rmc_closure_shape. Expanding the shape gives
+    x - 4x^2 + 7x^3 - 6x^4 + 2x^5.
+    """
+    return x**2/2 - 4*x**3/3 + 7*x**4/4 - 6*x**5/5 + x**6/3
+
+class RMCSpectrum:
+    """
+    The RMC closure approximation spectrum for a given k_max.
+
+    The binned mode reproduces rmc_normalization's historical calculation bit
+    for bit: bins of bin_width from RMC_START_ENERGY up to k_max, with a bin
+    counted if its lower edge is >= e_min, and the bin contents summed from
+    low to high energy. A threshold is located by binary search, and the
+    forward sum above each bin is computed in that order the first time a
+    threshold falls on it, then memoized. A reversed running total would be
+    one pass, but it adds in the opposite order and so would change the last
+    bits of most sums.
+
+    The analytic mode integrates the shape in closed form between
+    max(e_min, RMC_LOW_ENERGY) and k_max.
+    """
+    def __init__(self, k_max=90.1, bin_width=RMC_BIN_WIDTH):
+        self.k_max = float(k_max)
+        self.bin_width = float(bin_width)
+        num_bins = int((self.k_max - RMC_START_ENERGY) / self.bin_width)
+        self.energies = RMC_START_ENERGY + np.arange(num_bins) * self.bin_width
+        self.lower_edges = self.energies - self.bin_width / 2.0
+        self.values = rmc_closure_shape(self.energies / self.k_max)
+        self._cut = {num_bins: 0.0}
+        self.total = self.cut(0)
+
+    def cut(self, i):
+        """Returns values[i] + values[i+1] + ... summed in that order; 0 for i = number of bins."""
+        if i not in self._cut:
+            self._cut[i] = float(np.cumsum(self.values[i:])[-1])
+        return self._cut[i]
+
+    def fraction_above(self, e_min, mode="binned"):
+        """
+        Returns the fraction of the spectrum above e_min.
+
+        Args:
+            e_min (float or array): minimum energy threshold(s) (MeV).
+            mode (str): 'binned' (historical bin sum) or 'analytic' (closed form).
+
+        Returns:
+            float or np.ndarray: matching the shape of e_min.
+        """
+        e_min = np.asarray(e_min, dtype=float)
+        if mode == "binned":
+            if self.total == 0:
+                fraction = np.zeros_like(e_min)
+            else:
+                index = np.searchsorted(self.lower_edges, e_min, side="left")
+                fraction = np.vectorize(self.cut, otypes=[float])(index) / self.total
+        elif mode == "analytic":
+            x_low = RMC_LOW_ENERGY / self.k_max
+            x_min = np.clip(np.maximum(e_min, RMC_LOW_ENERGY) / self.k_max, x_low, 1.0)
+            norm = rmc_closure_integral(1.0) - rmc_closure_integral(x_low)
+            fraction = (rmc_closure_integral(1.0) - rmc_closure_integral(x_min)) / norm
+        else:
+            raise ValueError(f"Unknown RMC spectrum mode: {mode}")
+        return float(fraction) if fraction.ndim == 0 else fraction
+
+@lru_cache(maxsize=None)
+def _rmc_spectrum(k_max, bin_width):
+    return RMCSpectrum(k_max, bin_width)
+
+def rmc_spectrum(k_max=90.1, bin_width=RMC_BIN_WIDTH):
+    """Returns the RMCSpectrum for (k_max, bin_width), built at most once per process."""
+    return _rmc_spectrum(float(k_max), float(bin_width))
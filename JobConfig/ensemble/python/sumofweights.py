@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+"""
+Single-pass extractor of the pion lifetime SumOfWeights totals.
+
+getWeights.py prints one sum per call, so CreateSimEfficiency.sh used to scan
+the PiMinusFilter files several times. Here every file is scanned once, in
+parallel and through the metadata cache (see rootscan.py and
+metadatacache.py), reading all SumOfWeights products of both the pion filter
+and the stop sampler. The sums of the filter file list and of the sampler
+file list are then reported in one record.
+
+How to use:
+python sumofweights.py --filterfiles filenames_pionfilter --samplerfiles filenames_pionsampler --format json
+python sumofweights.py --filterfiles filenames_pionfilter --samplerfiles filenames_pionsampler --format simeff >> MDC2025_SimEff.txt
+"""
+import argparse
+import csv
+import json
+import sys
+
+import metadatacache
+import rootscan
+
+# SimEfficiencies rows written by CreateSimEfficiency.sh: tag -> (sample, sum)
+SIMEFF_ROWS = {
+    "PiTotalLifetimeWeight_filter": ("filter", "total"),
+    "PiSelectedLifetimeWeight_filter": ("filter", "selected"),
+    "PiSelectedLifetimeWeight_sampler": ("sampler", "selected"),
+}
+
+#-------------------------------------------------------------------------------------#
+def extract(file_lists, workers=None):
+    """
+    Returns the SumOfWeights totals of each sample.
+
+    Args:
+        file_lists (dict): sample ('filter' or 'sampler') -> list of files.
+        workers (int): process pool size for the files that need a scan.
+
+    Returns:
+        dict: '<sample>_<sum>' -> total, e.g. 'filter_total', plus '<sample>_files'.
+    """
+    # one scan over all files; files in both lists are only opened once
+    paths = list(dict.fromkeys(path for files in file_lists.values() for path in files))
+    records = dict(zip(paths, metadatacache.scan_files(paths, metadatacache.CACHED_REDUCTIONS, workers)))
+    sums = {}
+    for sample, files in file_lists.items():
+        sample_records = [records[path] for path in files]
+        sums[f"{sample}_files"] = len(sample_records)
+        for name, reduction in rootscan.SUM_OF_WEIGHTS[sample].items():
+            sums[f"{sample}_{name}"] = rootscan.total(sample_records, reduction)
+    return sums
+
+def main(args):
+    file_lists = {}
+    if args.filterfiles:
+        file_lists["filter"] = rootscan.read_file_list(args.filterfiles)
+    if args.samplerfiles:
+        file_lists["sampler"] = rootscan.read_file_list(args.samplerfiles)
+    if not file_lists:
+        sys.exit("Error: give --filterfiles and/or --samplerfiles")
+    sums = extract(file_lists, args.workers)
+
+    if args.format == "json":
+        json.dump(sums, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(sums))
+        writer.writeheader()
+        writer.writerow(sums)
+    else:
+        for tag, (sample, name) in SIMEFF_ROWS.items():
+            if sample in file_lists:
+                print(f"{tag}, 0, 0, {sums[f'{sample}_{name}']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sum the pion filter and sampler SumOfWeights in one pass")
+    parser.add_argument("--filterfiles", help="file list of the pion filter sample e.g. PiMinusFilter")
+    parser.add_argument("--samplerfiles", help="file list of the stop sampler sample e.g. PhysicalPionStops")
+    parser.add_argument("--format", choices=["json", "csv", "simeff"], default="json", help="output format; simeff prints SimEfficiencies rows")
+    parser.add_argument("--workers", type=int, help="number of parallel file scans (default: number of CPUs)")
+    args = parser.parse_args()
+    main(args)
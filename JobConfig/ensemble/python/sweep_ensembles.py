@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+"""
+Sweep driver making a family of ensembles (e.g. MDS3a, MDS3b, ...) in one run.
+
+The ensembles of a family share their input file lists and differ only in
+parameters such as livetime, BB mode, seed or thresholds. The file lists
+(filenames_<prc>, as made by Stage2_submitensemble.sh) are scanned once,
+the normalizations of every point share the spectrum caches of spectra.py,
+and for every point the SamplingInput fcls and the job definition are
+written to a directory named after the point's tag. The job definition embeds
+only SamplingInput_sr0.fcl, so a point whose events do not fit in one subrun
+of "maxevents" (default 10000000) events is an error.
+
+The JSON config has a "base" object with the common parameters, a "matrix"
+object whose keys are each a list of values (every combination is one
+ensemble, as in gen_Mix_json.py), and a "tag" format string that may use
+{index}, {letter} and any parameter name:
+
+{
+    "tag": "MDS3{letter}",
+    "base": {"release": "MDC2020ba", "run": 1201, "tmin": 640, "dioemin": 95, "rpcemin": 50,
+             "rmcemin": 85, "rmckmax": 90.1, "ipaemin": 70, "samplingseed": 1, "njobs": 10,
+             "prc": ["DIO", "CRYCosmic", "RPCInternal", "RPCExternal", "RMCInternal", "RMCExternal", "IPAMichel"],
+             "setup": "/cvmfs/mu2e.opensciencegrid.org/Musings/SimJob/MDC2020ba/setup.sh"},
+    "matrix": {"livetime": [86400, 604800], "BB": ["1BB", "2BB"]}
+}
+
+How to use:
+python sweep_ensembles.py --json sweep.json --dry-run
+"""
+import argparse
+import itertools
+import json
+import os
+import shlex
+import string
+import subprocess
+import sys
+
+import ROOT
+import make_template_fcl
+
+#-------------------------------------------------------------------------------------#
+def points(cfg):
+    """Yields (tag, params) for every combination of the matrix, merged over the base parameters."""
+    matrix = cfg.get("matrix", {})
+    keys = list(matrix)
+    for index, combo in enumerate(itertools.product(*(matrix[k] for k in keys))):
+        params = dict(cfg.get("base", {}))
+        params.update(zip(keys, combo))
+        letter = string.ascii_lowercase[index] if index < 26 else str(index)
+        params["tag"] = cfg.get("tag", "{index}").format(index=index, letter=letter, **params)
+        yield params["tag"], params
+
+def jobdef_command(params, listdir="."):
+    """Returns the mu2ejobdef command of one ensemble, as run by Stage2_submitensemble.sh."""
+    cmd = ["mu2ejobdef", f"--desc=ensemble{params['tag']}", f"--dsconf={params['release']}",
+           f"--run={params['run']}", "--setup", params["setup"], "--embed", "SamplingInput_sr0.fcl"]
+    for signal in params["prc"]:
+        listing = os.path.join(os.path.abspath(listdir), f"filenames_{signal}_{params['njobs']}.txt")
+        cmd.append(f"--sampling=1:{signal}:{listing}")
+    cmd.append("--verb")
+    return cmd
+
+#-------------------------------------------------------------------------------------#
+def main(args):
+    with open(args.json) as f:
+        cfg = json.load(f)
+    if not isinstance(cfg, dict):
+        print("Error: JSON root must be an object", file=sys.stderr)
+        sys.exit(1)
+
+    plan = list(points(cfg))
+    tags = [tag for tag, _ in plan]
+    if len(set(tags)) != len(tags):
+        print(f"Error: tags are not unique: {tags}", file=sys.stderr)
+        sys.exit(1)
+    processes = plan[0][1]["prc"]
+    if any(params["prc"] != processes for _, params in plan):
+        print("Error: all ensembles of a sweep must use the same processes", file=sys.stderr)
+        sys.exit(1)
+
+    # scan the inputs once for the whole family
+    ROOT.gRandom.SetSeed(0)
+    scans = make_template_fcl.scan_inputs(processes, args.workers, args.verbose)
+    t = make_template_fcl.load_template()
+
+    for tag, params in plan:
+        print(f"\n=== ensemble{tag}: " + ", ".join(f"{k}={params[k]}" for k in sorted(params) if k != "prc"))
+        os.makedirs(tag, exist_ok=True)
+        with open(os.path.join(tag, "parameters.json"), "w") as f:
+            json.dump(params, f, indent=2)
+        nsubruns = make_template_fcl.make_ensemble(params, scans, t, args.verbose, outdir=tag)
+        if nsubruns > 1:
+            print(f"Error: ensemble{tag} needs {nsubruns} SamplingInput subruns but the job definition embeds only "
+                  "SamplingInput_sr0.fcl; raise maxevents", file=sys.stderr)
+            sys.exit(1)
+
+        cmd = jobdef_command(params)
+        print(">>>", " ".join(shlex.quote(a) for a in cmd))
+        if not args.dry_run:
+            subprocess.run(cmd, check=True, cwd=tag)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make the SamplingInput fcls and job definitions of a family of ensembles")
+    parser.add_argument("--json", required=True, help="sweep configuration")
+    parser.add_argument("--dry-run", action="store_true", dest="dry_run", help="write the fcls but only print the mu2ejobdef commands")
+    parser.add_argument("--workers", type=int, help="number of parallel file scans (default: number of CPUs)")
+    parser.add_argument("--verbose", default=0, help="verbose")
+    args = parser.parse_args()
+    main(args)
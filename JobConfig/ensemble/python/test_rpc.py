@@ -6,6 +6,9 @@ import random
 import os
 import glob
 import ROOT
+import rootscan
+import metadatacache
+import eventweights
 import subprocess
 
 def main():
@@ -25,55 +28,34 @@ def main():
     # loop over each "signal"
     for signal in prc:
         print(signal)
-        # open file list from the filelists directory
-        ffns = open(os.path.join("filenames_%s" % signal))
-
-        # add empty file list
-        filenames[signal] = []
-
         # enter empty entry for current file
         current_file[signal] = 0
 
         # enter empty entry for starting event
         starting_event_num[signal] = [0,0,0]
 
+        # scan all files of this signal, and reduce the EventWeights of RPCInternal
+        records = metadatacache.scan_files(rootscan.read_file_list("filenames_%s" % signal))
+        filenames[signal] = [record.path for record in records]
+        weights = eventweights.reduce_files(filenames[signal]) if signal == "RPCInternal" else []
+
         # start counters
         reco_events = 0
         total_weight = 0
 
-        # loop over files in list
-        for line in ffns:
-            
-            # find a given filename
-            fn = line.strip()
-            
-            # add this filename to the list of filenames
-            filenames[signal].append(fn)
-            
-            # use ROOT to get the events in that file
-            fin = ROOT.TFile(fn)
-            te = fin.Get("Events")
-
+        for i, record in enumerate(records):
             # determine total number of events surviving all cuts
-            reco_events += te.GetEntries()
+            reco_events += record.reco_events
             print(" dts events ", reco_events)
-            
-            # determine total number of events generated
-            t = fin.Get("Events")
-            
-            # things are slightly different for the Cosmics:
-            if signal == "RPCInternal":
-                # find the right branch
-                bl = t.GetListOfBranches()
-                bn = ""
-                for i in range(bl.GetEntries()):
-                    if bl[i].GetName().startswith("mu2e::EventWeight"):
-                        bn = bl[i].GetName()
-                for i in range(t.GetEntries()):
-                    t.GetEntry(i)
-                    total_weight += getattr(t,bn).product().weight()
+            if weights:
+                total_weight += weights[i].sum
             print(total_weight)
 
+        # weight statistics, e.g. the mean survival weight used by rpc_normalization
+        if weights:
+            summary = eventweights.merge(weights)
+            print("events", summary.entries, "sum of weights", summary.sum,
+                  "mean weight", summary.mean, "+-", summary.mean_error, "min", summary.min, "max", summary.max)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
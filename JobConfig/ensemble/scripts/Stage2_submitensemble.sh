@@ -34,6 +34,7 @@ IPA_EMIN=""
 TMIN=""
 BB=""
 SAMPLINGSEED=1
+MAXEVENTS=10000000 #events per SamplingInput fcl; the job definition embeds only one
 COSMICTAG="MDC2020ar"
 GEN="CRY"
 # Loop: Get the next option;
@@ -65,6 +66,9 @@ while getopts ":-:" options; do
         ipaversion)
           IPAVERSION=${!OPTIND} OPTIND=$(( $OPTIND + 1 ))
           ;;
+        maxevents)
+          MAXEVENTS=${!OPTIND} OPTIND=$(( $OPTIND + 1 ))
+          ;;
         *)
           echo "Unknown option " ${OPTARG}
           exit_abnormal
@@ -139,6 +143,7 @@ rm filenames_RMCInternal
 rm filenames_RMCExternal
 rm filenames_IPAMichel
 rm *.tar
+rm -f SamplingInput_sr*.fcl
 
 echo "accessing files, making file lists"
 mu2eDatasetFileList "dts.mu2e.Cosmic${GEN}SignalAll.${COSMICTAG}.art" | head -${NJOBS} > filenames_${GEN}Cosmic
@@ -151,7 +156,14 @@ samListLocations --dim "dh.dataset=dts.mu2e.RMCExternalCat.MDC2020at.art and eve
 mu2eDatasetFileList "dts.mu2e.IPAMuminusMichel.${RELEASE}${IPAVERSION}.art" | head -${NJOBS} > filenames_IPAMichel
 
 echo "making template fcl"
-make_template_fcl.py --BB=${BB} --release=${RELEASE}${CURRENT}  --tag=${TAG} --verbose=${VERBOSE} --livetime=${LIVETIME} --run=${RUN} --dioemin=${DIO_EMIN} --rpcemin=${RPC_EMIN} --rmcemin=${RMC_EMIN} --rmckmax=${RMC_kmax} --ipaemin=${IPA_EMIN} --tmin=${TMIN} --samplingseed=${SAMPLINGSEED} --prc "DIO" "${GEN}Cosmic" "RPCInternal" "RPCExternal" "RMCInternal" "RMCExternal" "IPAMichel"
+make_template_fcl.py --BB=${BB} --release=${RELEASE}${CURRENT}  --tag=${TAG} --verbose=${VERBOSE} --livetime=${LIVETIME} --run=${RUN} --dioemin=${DIO_EMIN} --rpcemin=${RPC_EMIN} --rmcemin=${RMC_EMIN} --rmckmax=${RMC_kmax} --ipaemin=${IPA_EMIN} --tmin=${TMIN} --samplingseed=${SAMPLINGSEED} --maxevents=${MAXEVENTS} --prc "DIO" "${GEN}Cosmic" "RPCInternal" "RPCExternal" "RMCInternal" "RMCExternal" "IPAMichel"
+
+# the job definition embeds a single SamplingInput fcl, so events of further subruns would be lost
+NSUBRUNS=$(ls SamplingInput_sr*.fcl 2>/dev/null | wc -l)
+if [ "${NSUBRUNS}" -ne 1 ]; then
+  echo "Error: make_template_fcl.py wrote ${NSUBRUNS} SamplingInput fcls but the job definition embeds only SamplingInput_sr0.fcl; rerun with a larger --maxevents"
+  exit 1
+fi
 
 ##### Below is genEnsemble and Grid:
 echo "remove old files"
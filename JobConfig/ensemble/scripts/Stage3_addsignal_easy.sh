@@ -11,6 +11,7 @@ usage() { echo "Usage: $0
   --dbversion = db version e.g. v1_3
   --nexp = number of sets of mixed samples or 'pseudo experiments' to make default is 1
   --chooselivetime = chose a livetime in seconds e.g 86000
+  --seed = extra seed for the signal yields and file selections, default is 0
   
   NOTE: assumes signal and known are the same versions
 "
@@ -31,6 +32,7 @@ DBVERSION="v1_3"
 NEXP=1
 CHOOSE=0.
 EVENTNTUPLE="MDC2020-000"
+SEED=0
 
 while getopts ":-:" options; do
   case "${options}" in
@@ -66,6 +68,9 @@ while getopts ":-:" options; do
         chooselivetime)
           CHOOSE=${!OPTIND} OPTIND=$(( $OPTIND + 1 ))
           ;;
+        seed)
+          SEED=${!OPTIND} OPTIND=$(( $OPTIND + 1 ))
+          ;;
         *)
           echo "Unknown option " ${OPTARG}
           exit_abnormal
@@ -164,70 +169,27 @@ mu2eDatasetFileList "mcs.${OWNER}.${SIGNAL}Mix${BB}Triggered.${RELEASE}_${DBPURP
 
 mu2eDatasetFileList nts.mu2e.ensemble${KNOWN}Mix${BB}Triggered.${EVENTNTUPLE}.root > filenames_All_${KNOWN}
 
-# step: split the signal files to get an exact number:
+# step: plan all pseudo experiments in one pass: signal yields, file selections and configs
+rm -f ntuple_*.fcl splitter_*.fcl filenames_ChosenSig_* filenames_ChosenMixed_*
+echo "Building configs WARNING: this will fail if you dont have the correct permissions"
+plan_addsignal.py --owner ${OWNER} --known ${KNOWN} --signal ${SIGNAL} --rate ${RATE} --release ${RELEASE} \
+  --dbpurpose ${DBPURPOSE} --dbversion ${DBVERSION} --BB ${BB} --livetime ${LIVETIME} \
+  --nknownfiles ${N_KNOWN_FILES_TO_USE} --nexp ${NEXP} --ngen ${NGEN} --seed ${SEED} || exit 1
+
+# step: split the signal files to get an exact number and make the ntuples
 i=1
 while [ $i -le ${NEXP} ]
 do
-  # remove old files
-  rm ntuple_$i.fcl
-  rm splitter_$i.fcl
-  
-  # calculate yield of signal for chose rate, if > 0 then proceed --> use python scripts
-  NSIG=$(calculateEvents.py --livetime ${LIVETIME} --prc ${SIGNAL} --BB ${BB} --rue ${RATE})
-  echo "${RATE} for ${BB} and ${LIVETIME} s means ${NSIG} events will be sampled"
-  NSIG=$(awk "BEGIN {printf \"%.0f\", ${NSIG}}")
-
-  # calculate number of files
-  N_TOTAL_SIGNAL=$(samDatasetsSummary.sh mcs.${OWNER}.${SIGNAL}Mix${BB}Triggered.${RELEASE}_${DBPURPOSE}_${DBVERSION}.art  | awk '/Files/ {print $2}')
-  EVENTS_PER_FILE=$(awk "BEGIN {printf \"%.0f\", ${NGEN}/${N_TOTAL_SIGNAL}}")
-  echo "signal sample has ${N_TOTAL_SIGNAL} files with ${EVENTS_PER_FILE} events per file"
-  N_SIGNAL_FILES_TO_USE=$(awk "BEGIN {printf \"%.0f\", ${NSIG}/${EVENTS_PER_FILE}}")
-  
-  # if its < 1 file the above will be 0, so we need to make sure we use at least 1 file here
-  if (( N_SIGNAL_FILES_TO_USE == 0 )); then
-    N_SIGNAL_FILES_TO_USE=1
-  fi
-  echo "based on requested rate, will use ${N_SIGNAL_FILES_TO_USE} signal files"
-  
-  # build the splitter .fcl file and run on the chosen samples
-  echo "will sample ${N_SIGNAL_FILES_TO_USE} signal files"
-  # randomly select a file here
-  shuf -n ${N_SIGNAL_FILES_TO_USE} filenames_All_${SIGNAL} > temp
-  shuf temp > filenames_ChosenSig_$i
-  rm temp
-  # construct .fcl
-  echo "Building configs WARNING: this will fail if you dont have the correct permissions"
-  echo "#include \"Production/JobConfig/ensemble/fcl/split.fcl\"" >> splitter_$i.fcl
-  
-  echo "source.fileNames: [" >> splitter_$i.fcl
-  while IFS= read -r line; do
-    echo "adding file: " $line
-    echo "\"$line\"" >> splitter_$i.fcl
-    if (( ${N_SIGNAL_FILES_TO_USE} > 1 )); then
-      echo "," >> splitter_$i.fcl
-    fi
-  done < "filenames_ChosenSig_$i"
-  echo "]" >> splitter_$i.fcl
-  echo "source.maxEvents: ${NSIG}" >> splitter_$i.fcl
-  echo "outputs.out.fileName: \"mcs.${OWNER}.${SIGNAL}Mix${BB}TriggeredSplit.${RELEASE}_${DBPURPOSE}_${DBVERSION}.${i}.art\"" >> splitter_$i.fcl
-  cmd=$(mu2e -c splitter_$i.fcl)
+  cmd="mu2e -c splitter_$i.fcl"
   echo "Running: $cmd"
   # run the splitting function
   $cmd
   
   # make the ntuples
   echo "making ntuples"
-  echo "#include \"EventNtuple/fcl/from_mcs-mockdata.fcl\"" >> ntuple_$i.fcl
-  echo "services.TFileService.fileName: \"nts.${OWNER}.${SIGNAL}Mix${BB}TriggeredSplit.${RELEASE}_${DBPURPOSE}_${DBVERSION}.${i}.root\"" >> ntuple_$i.fcl
-  cmd=$(mu2e -c ntuple_$i.fcl mcs.${OWNER}.${SIGNAL}Mix${BB}TriggeredSplit.${RELEASE}_${DBPURPOSE}_${DBVERSION}.${i}.art)
+  cmd="mu2e -c ntuple_$i.fcl mcs.${OWNER}.${SIGNAL}Mix${BB}TriggeredSplit.${RELEASE}_${DBPURPOSE}_${DBVERSION}.${i}.art"
   echo "Running: $cmd"
   $cmd
-  ls nts.${OWNER}.${SIGNAL}Mix${BB}TriggeredSplit.${RELEASE}_${DBPURPOSE}_${DBVERSION}.${i}.root > temp
-
-  # create randomly mixed list of ntuples
-  shuf -n ${N_KNOWN_FILES_TO_USE} filenames_All_${KNOWN} >> temp
-  shuf temp > filenames_ChosenMixed_$i
-  rm temp
   i=$((i + 1))
 
 done
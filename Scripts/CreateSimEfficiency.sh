@@ -22,17 +22,12 @@ sed -i -e 's/dts\.mu2e\.//' -e 's/sim\.mu2e\.//' -e 's/\..*\.art//' -e 's/ IOV//
 #sim.mu2e.PiminusStopsCat.MDC2025ac.art
 
 mu2eDatasetFileList sim.mu2e.PiMinusFilter.MDC2025ac.art > filenames_pionfilter
+mu2eDatasetFileList sim.mu2e.PhysicalPionStops.MDC2025ac.art > filenames_pionsampler
 
-TOTALWEIGHT_FILTER=$(getWeights.py --weight "total" --files filenames_pionfilter --tag "filter")
-SELECTEDWEIGHT_FILTER=$(getWeights.py  --weight "selected" --files filenames_pionfilter --tag "filter")
+# every file is scanned once for all of its SumOfWeights
+sumofweights.py --filterfiles filenames_pionfilter --samplerfiles filenames_pionsampler --format simeff > pionweights.txt || exit 1
 
-rm filenames_pionfilter
-mu2eDatasetFileList sim.mu2e.PhysicalPionStops.MDC2025ac.art > filenames_pionfilter
+rm filenames_pionfilter filenames_pionsampler
 
-SELECTEDWEIGHT_SAMPLER=$(getWeights.py  --weight "selected" --files filenames_pionfilter --tag "sampler")
-
-rm filenames_pionfilter
-
-echo "PiTotalLifetimeWeight_filter, 0, 0, ${TOTALWEIGHT_FILTER}" >> MDC2025_SimEff.txt
-echo "PiSelectedLifetimeWeight_filter, 0, 0, ${SELECTEDWEIGHT_FILTER}" >> MDC2025_SimEff.txt
-echo "PiSelectedLifetimeWeight_sampler, 0, 0, ${SELECTEDWEIGHT_SAMPLER}" >> MDC2025_SimEff.txt
+cat pionweights.txt >> MDC2025_SimEff.txt
+rm pionweights.txt
@@ -3,8 +3,20 @@
 Summarize Mu2e log performance metrics per dataset (no pandas).
 Reads a list of datasets, gathers CPU/Real time, memory, and SAM summary
 numbers via samDatasetsSummary.sh, and writes JSON output.
+
+Datasets are probed concurrently by a bounded thread pool (-j), since nearly
+all the time is spent waiting on samDatasetsSummary.sh and mu2eDatasetFileList.
+Each dataset can be given a time budget (--timeout); the output keeps the
+order of the input list.
+
+All logs of a dataset are parsed (or a reservoir sample of them, --sample) by
+a shared thread pool. The parser reads only the end of each log, where art
+writes TimeReport and MemReport. Besides the mean and max, each record
+holds the p50/p90/p99 percentiles and a histogram of CPU, Real, VmPeak and VmHWM.
 """
-import sys, subprocess, argparse, re, json, shutil, os
+import sys, subprocess, argparse, re, json, shutil, os, time, random, sqlite3, threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Regex patterns
@@ -14,6 +26,10 @@ MEMREPORT_REGEX = re.compile(r"MemReport\s+VmPeak\s*=\s*([0-9]*\.?[0-9]+)\s+VmHW
 SECONDS_PER_HOUR = 3600.0
 MB_PER_GB = 1024.0
 
+# bytes read from the end of a log before falling back to a full scan
+TAIL_BYTES = 64 * 1024
+PERCENTILES = (50, 90, 99)
+
 # ------------------------- helper functions -----------------------------
 
 def run_cmd(cmd:list, **kwargs):
@@ -21,14 +37,24 @@ def run_cmd(cmd:list, **kwargs):
     return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs)
 
 
-def get_sam_summary(dataset:str):
+def remaining(deadline):
+    """Seconds left before deadline (a time.monotonic() value), or None without a deadline."""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("dataset time budget exhausted")
+    return left
+
+
+def get_sam_summary(dataset:str, deadline=None):
     """Return dict with triggered, generated, files, size_bytes using samDatasetsSummary.sh."""
     summary = {}
     script = "samDatasetsSummary.sh"
     if not shutil.which(script):
         print("[ERROR] samDatasetsSummary.sh not found in PATH", file=sys.stderr)
         return summary
-    proc = run_cmd([script, dataset], check=False)
+    proc = run_cmd([script, dataset], check=False, timeout=remaining(deadline))
     for line in proc.stdout.splitlines():
         if m := re.match(r"Triggered:\s*(\d+)", line):
             summary["Triggered"] = int(m.group(1)); continue
@@ -41,80 +67,271 @@ def get_sam_summary(dataset:str):
     return summary
 
 
-def mu2e_file_list(dataset:str):
+def mu2e_file_list(dataset:str, deadline=None):
     """Return list of log file paths using mu2eDatasetFileList (switch family to log)."""
     parts = dataset.split('.')
     parts[0]  = 'log'   # family
     parts[-1] = 'log'   # extension
     dataset = '.'.join(parts)
-    proc = run_cmd(["mu2eDatasetFileList", dataset], check=False)
+    proc = run_cmd(["mu2eDatasetFileList", dataset], check=False, timeout=remaining(deadline))
     if proc.returncode != 0:
         print(f"[WARN] mu2eDatasetFileList failed for {dataset}: {proc.stderr}", file=sys.stderr)
         return []
     return [l.strip() for l in proc.stdout.splitlines() if l.startswith('/')]
 
-def parse_log(fp:Path):
-    """Extract CPU (h), Real (h), VmPeak (MB), VmHWM (MB) from log file."""
+def scan_reports(text:str):
+    """Return (cpu, real, vmp, vmh) from the last TimeReport/MemReport lines in text; None where missing."""
     cpu = real = vmp = vmh = None
+    for m in TIMEREPORT_REGEX.finditer(text):
+        cpu = float(m.group(1))/SECONDS_PER_HOUR
+        real = float(m.group(2))/SECONDS_PER_HOUR
+    for m in MEMREPORT_REGEX.finditer(text):
+        vmp = float(m.group(1))
+        vmh = float(m.group(2))
+    return cpu, real, vmp, vmh
+
+def parse_log(fp:Path, tail_bytes:int=TAIL_BYTES):
+    """
+    Extract CPU (h), Real (h), VmPeak (MB), VmHWM (MB) from log file.
+    TimeReport and MemReport are at the end of art logs, so only the last
+    tail_bytes are read first; the whole file is scanned only if either is missing there.
+    """
     try:
+        with open(fp, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = max(0, size - tail_bytes)
+            f.seek(offset)
+            tail = f.read().decode(errors='ignore')
+        if offset > 0:
+            tail = tail.partition('\n')[2]  # drop the partial first line
+        result = scan_reports(tail)
+        if offset == 0 or None not in result:
+            return result
         with open(fp, errors='ignore') as f:
-            for line in f:
-                if (m := TIMEREPORT_REGEX.search(line)):
-                    cpu = float(m.group(1))/SECONDS_PER_HOUR
-                    real = float(m.group(2))/SECONDS_PER_HOUR
-                elif (m := MEMREPORT_REGEX.search(line)):
-                    vmp = float(m.group(1))
-                    vmh = float(m.group(2))
+            return scan_reports(f.read())
     except Exception as e:
         print(f"[WARN] cannot read {fp}: {e}", file=sys.stderr)
-    return cpu, real, vmp, vmh
+    return None, None, None, None
+
+def reservoir_sample(items, k:int, rng:random.Random):
+    """Return k items chosen uniformly from an iterable of unknown length (algorithm R), in input order."""
+    reservoir = []
+    for i, item in enumerate(items):
+        if i < k:
+            reservoir.append((i, item))
+        elif (j := rng.randint(0, i)) < k:
+            reservoir[j] = (i, item)
+    return [item for _, item in sorted(reservoir)]
+
+def percentile(values:list, q:float):
+    """q-th percentile (0-100) with linear interpolation between order statistics, as numpy's default."""
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+def histogram(values:list, bins:int):
+    """Equal-width histogram between min and max: {'edges': [...], 'counts': [...]}."""
+    lo, hi = min(values), max(values)
+    width = (hi - lo) / bins if hi > lo else 1.0
+    counts = [0] * bins
+    for v in values:
+        counts[min(int((v - lo) / width), bins - 1)] += 1
+    return {'edges': [round(lo + i*width, 4) for i in range(bins + 1)], 'counts': counts}
+
+def log_stamp(fp:str):
+    """Return (size, mtime_ns) of a log, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+class LogStore:
+    """
+    SQLite store of parsed per-log records, so a run only parses logs that are
+    new or changed since they were stored. Safe to share between threads.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS logs (
+        path TEXT PRIMARY KEY,
+        dataset TEXT NOT NULL,
+        size INTEGER,
+        mtime_ns INTEGER,
+        cpu REAL, real REAL, vmpeak REAL, vmhwm REAL,
+        parsed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS logs_dataset ON logs(dataset);
+    """
+    CHUNK = 500  # host parameters per query
+
+    def __init__(self, path:str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _select(self, columns:str, paths:list):
+        rows = []
+        with self.lock:
+            for i in range(0, len(paths), self.CHUNK):
+                chunk = paths[i:i+self.CHUNK]
+                rows += self.db.execute(f"SELECT path, {columns} FROM logs WHERE path IN ({','.join('?'*len(chunk))})", chunk).fetchall()
+        return rows
+
+    def stamps(self, paths:list):
+        """Return {path: (size, mtime_ns)} for the stored logs among paths."""
+        return {row[0]: (row[1], row[2]) for row in self._select("size, mtime_ns", paths)}
+
+    def values(self, paths:list):
+        """Return {path: (cpu, real, vmpeak, vmhwm)} for the stored logs among paths."""
+        return {row[0]: row[1:] for row in self._select("cpu, real, vmpeak, vmhwm", paths)}
+
+    def put(self, dataset:str, records:list):
+        """Store (path, stamp, (cpu, real, vmpeak, vmhwm)) records of a dataset."""
+        now = time.time()
+        rows = [(fp, dataset, *(stamp or (None, None)), *values, now) for fp, stamp, values in records]
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def history(self, pattern:str='%'):
+        """Per-dataset aggregates over every stored log of the datasets matching a LIKE pattern."""
+        query = """SELECT dataset, COUNT(*), AVG(cpu), MAX(cpu), AVG(real), MAX(real),
+                          AVG(vmpeak), MAX(vmpeak), AVG(vmhwm), MAX(vmhwm), MAX(parsed)
+                   FROM logs WHERE dataset LIKE ? GROUP BY dataset ORDER BY dataset"""
+        with self.lock:
+            return self.db.execute(query, (pattern,)).fetchall()
+
+def summarize_dataset(ds:str, max_logs:int, timeout=None, log_pool=None, sample=0, seed=0, bins=10, store=None):
+    """Return the JSON record of one dataset; metrics are None for whatever ran past the timeout (s)."""
+    print(f"Processing {ds}", file=sys.stderr)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    sam = {}
+    acc = { 'CPU':[], 'Real':[], 'VmPeak':[], 'VmHWM':[] }
+    nlogs = 0
+    files = []
+    futures = []
+    parsed = {}
+    try:
+        sam = get_sam_summary(ds, deadline)
+        files = mu2e_file_list(ds, deadline)
+        if max_logs > 0:
+            files = files[:max_logs]
+        if sample > 0:
+            files = reservoir_sample(files, sample, random.Random(f"{seed}:{ds}"))
+        if not files:
+            print(f"[WARN] no log files found for {ds}", file=sys.stderr)
+        # with a store, only logs that are new or changed since the last run are parsed
+        todo = files
+        if store:
+            stamps = dict(zip(files, log_pool.map(log_stamp, files) if log_pool else map(log_stamp, files)))
+            known = store.stamps(files)
+            todo = [fp for fp in files if stamps[fp] is None or known.get(fp) != stamps[fp]]
+            print(f"{ds}: {len(files)-len(todo)} logs from the store, {len(todo)} to parse", file=sys.stderr)
+        futures = [log_pool.submit(parse_log, fp) if log_pool else None for fp in todo]
+        for fp, future in zip(todo, futures):
+            parsed[fp] = future.result(timeout=remaining(deadline)) if future else parse_log(fp)
+    except (subprocess.TimeoutExpired, TimeoutError, concurrent.futures.TimeoutError):
+        print(f"[WARN] timeout after {timeout} s for {ds}, partial results", file=sys.stderr)
+        for future in futures:
+            if future: future.cancel()
+
+    values = parsed
+    if store:
+        store.put(ds, [(fp, stamps[fp], result) for fp, result in parsed.items()])
+        values = store.values(files)
+    for fp in files:
+        if fp not in values:
+            continue
+        cpu, real, vmp, vmh = values[fp]
+        nlogs += 1
+        if cpu is not None: acc['CPU'].append(cpu)
+        if real is not None: acc['Real'].append(real)
+        if vmp is not None: acc['VmPeak'].append(vmp)
+        if vmh is not None: acc['VmHWM'].append(vmh)
+
+    # compute means and maxes rounded to 2 decimals
+    def mean(lst): return round(sum(lst)/len(lst),2) if lst else None
+    def maxv(lst): return round(max(lst),2) if lst else None
+
+    record = {
+        'dataset': ds,
+        'CPU [h]': mean(acc['CPU']),
+        'CPU_max [h]': maxv(acc['CPU']),
+        'Real [h]': mean(acc['Real']),
+        'Real_max [h]': maxv(acc['Real']),
+        'VmPeak [GB]': round(mean(acc['VmPeak'])/MB_PER_GB,2) if acc['VmPeak'] else None,
+        'VmPeak_max [GB]': round(maxv(acc['VmPeak'])/MB_PER_GB,2) if acc['VmPeak'] else None,
+        'VmHWM [GB]': round(mean(acc['VmHWM'])/MB_PER_GB,2) if acc['VmHWM'] else None,
+        'VmHWM_max [GB]': round(maxv(acc['VmHWM'])/MB_PER_GB,2) if acc['VmHWM'] else None,
+    }
+    record.update(sam)  # merge SAM summary fields
+
+    # distributions over all parsed logs, memory in GB as above
+    record['Logs'] = nlogs
+    histograms = {}
+    for key, unit, scale in (('CPU', 'h', 1.0), ('Real', 'h', 1.0), ('VmPeak', 'GB', MB_PER_GB), ('VmHWM', 'GB', MB_PER_GB)):
+        values = [v/scale for v in acc[key]]
+        for q in PERCENTILES:
+            record[f'{key}_p{q} [{unit}]'] = round(percentile(values, q),2) if values else None
+        if values and bins > 0:
+            histograms[f'{key} [{unit}]'] = histogram(values, bins)
+    if histograms:
+        record['Histograms'] = histograms
+    return record
 
 # ------------------------- main -----------------------------
 
 def main():
     ap = argparse.ArgumentParser(description="Summarize Mu2e logs (no pandas)")
-    ap.add_argument('-l','--list-file', required=True, help='File containing dataset names')
+    ap.add_argument('-l','--list-file', help='File containing dataset names')
     ap.add_argument('-J','--json-output', default='summary.json', help='Output JSON file')
-    ap.add_argument('-n','--max-logs', type=int, default=1, help='Max logs to parse per dataset (default 1)')
+    ap.add_argument('-n','--max-logs', type=int, default=0, help='Max logs to parse per dataset (default 0 = all)')
+    ap.add_argument('-s','--sample', type=int, default=0, help='Parse a uniform random sample of this many logs per dataset (reservoir sampling, default 0 = no sampling)')
+    ap.add_argument('--seed', type=int, default=0, help='Seed of the log sampling')
+    ap.add_argument('--log-jobs', type=int, default=16, help='Logs parsed concurrently across all datasets (default 16)')
+    ap.add_argument('--bins', type=int, default=10, help='Histogram bins per metric (default 10, 0 = no histograms)')
+    ap.add_argument('-j','--jobs', type=int, default=8, help='Datasets probed concurrently (default 8, 1 = sequential)')
+    ap.add_argument('-t','--timeout', type=float, default=None, help='Time budget per dataset in seconds (default: none)')
+    ap.add_argument('--store', default=os.environ.get('MU2E_LOG_STORE'), help='SQLite store of parsed logs; only new logs are parsed (default: $MU2E_LOG_STORE, none if unset)')
+    ap.add_argument('--history', metavar='PATTERN', help='Print per-dataset aggregates of the store for datasets LIKE PATTERN (e.g. %%MDC2020%%) and exit')
     args = ap.parse_args()
 
+    store = LogStore(args.store) if args.store else None
+    if args.history:
+        if not store:
+            ap.error('--history needs --store')
+        keys = ['dataset', 'Logs', 'CPU [h]', 'CPU_max [h]', 'Real [h]', 'Real_max [h]',
+                'VmPeak [GB]', 'VmPeak_max [GB]', 'VmHWM [GB]', 'VmHWM_max [GB]', 'Last parsed']
+        for row in store.history(args.history):
+            record = dict(zip(keys, row))
+            for key in ('VmPeak [GB]', 'VmPeak_max [GB]', 'VmHWM [GB]', 'VmHWM_max [GB]'):
+                if record[key] is not None: record[key] /= MB_PER_GB
+            for key in keys[2:-1]:
+                if record[key] is not None: record[key] = round(record[key],2)
+            record['Last parsed'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['Last parsed']))
+            print(json.dumps(record))
+        return
+    if not args.list_file:
+        ap.error('-l/--list-file is required')
+
     try:
         datasets = [ln.strip() for ln in open(args.list_file) if ln.strip() and not ln.startswith('#')]
     except IOError as e:
         print(f"[ERROR] cannot read {args.list_file}: {e}", file=sys.stderr)
         sys.exit(1)
 
-    results = []
-    for ds in datasets:
-        print(f"Processing {ds}", file=sys.stderr)
-        sam = get_sam_summary(ds)
-        files = mu2e_file_list(ds)[:args.max_logs]
-        if not files:
-            print(f"[WARN] no log files found for {ds}", file=sys.stderr)
-        acc = { 'CPU':[], 'Real':[], 'VmPeak':[], 'VmHWM':[] }
-        for fp in files:
-            cpu, real, vmp, vmh = parse_log(fp)
-            if cpu is not None: acc['CPU'].append(cpu)
-            if real is not None: acc['Real'].append(real)
-            if vmp is not None: acc['VmPeak'].append(vmp)
-            if vmh is not None: acc['VmHWM'].append(vmh)
-        # compute means and maxes rounded to 2 decimals
-        def mean(lst): return round(sum(lst)/len(lst),2) if lst else None
-        def maxv(lst): return round(max(lst),2) if lst else None
-
-        record = {
-            'dataset': ds,
-            'CPU [h]': mean(acc['CPU']),
-            'CPU_max [h]': maxv(acc['CPU']),
-            'Real [h]': mean(acc['Real']),
-            'Real_max [h]': maxv(acc['Real']),
-            'VmPeak [GB]': round(mean(acc['VmPeak'])/MB_PER_GB,2) if acc['VmPeak'] else None,
-            'VmPeak_max [GB]': round(maxv(acc['VmPeak'])/MB_PER_GB,2) if acc['VmPeak'] else None,
-            'VmHWM [GB]': round(mean(acc['VmHWM'])/MB_PER_GB,2) if acc['VmHWM'] else None,
-            'VmHWM_max [GB]': round(maxv(acc['VmHWM'])/MB_PER_GB,2) if acc['VmHWM'] else None,
-        }
-        record.update(sam)  # merge SAM summary fields
-        results.append(record)
+    # map keeps the input order whatever order the datasets finish in
+    with ThreadPoolExecutor(max_workers=max(1, args.log_jobs)) as log_pool, \
+         ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        results = list(pool.map(lambda ds: summarize_dataset(ds, args.max_logs, args.timeout, log_pool,
+                                                             args.sample, args.seed, args.bins, store), datasets))
+    if store:
+        store.close()
 
     # pretty print to console
     for r in results:
@@ -126,4 +343,4 @@ def main():
     print(f"[INFO] wrote {args.json_output}", file=sys.stderr)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,66 @@
+# Local stand-in for samweb_client.SAMWebClient, for benchmarking remove_sam_locations.py offline.
+# Examples of usage:
+# python remove_sam_locations.py --fake-files 20000 --fake-latency 0.05 --definition fake.definition --workers 16
+#
+# Every definition named in a run holds the same number of generated files. Every file has a tape
+# location, and every bad_every-th file also has a location containing the keyword. Each call sleeps
+# for the configured round-trip latency, and the state is shared by all clients made from the same
+# FakeSam, as the SAM database is shared by real clients.
+
+import threading
+import time
+
+class FakeSam:
+    """The in-memory SAM database shared by FakeSAMWebClient instances."""
+    def __init__(self, files_per_definition=1000, latency=0.02, bad_every=3, keyword="override_me"):
+        self.files_per_definition = files_per_definition
+        self.latency = latency
+        self.bad_every = bad_every
+        self.keyword = keyword
+        self.lock = threading.Lock()
+        self.locations = {}
+        self.calls = {}
+
+    def _count(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        time.sleep(self.latency)
+
+    def _locations(self, file_name):
+        # generated on first use, so a large definition costs nothing until it is located
+        with self.lock:
+            if file_name not in self.locations:
+                index = int(file_name.split(".")[-2])
+                self.locations[file_name] = [f"enstore:/pnfs/mu2e/tape/phy-nts/{file_name}"]
+                if index % self.bad_every == 0:
+                    self.locations[file_name].append(f"dcache:/pnfs/mu2e/scratch/{self.keyword}/{file_name}")
+            return list(self.locations[file_name])
+
+    def client(self):
+        return FakeSAMWebClient(self)
+
+class FakeSAMWebClient:
+    """The subset of the samweb_client.SAMWebClient interface used by remove_sam_locations.py."""
+    def __init__(self, sam):
+        self.sam = sam
+
+    def listFiles(self, defname=None, **kwargs):
+        self.sam._count("listFiles")
+        stem = defname.rsplit(".", 1)[0]
+        return [f"{stem}.{i:08d}.root" for i in range(self.sam.files_per_definition)]
+
+    def locateFile(self, filenameorid):
+        self.sam._count("locateFile")
+        return [{"full_path": path} for path in self.sam._locations(filenameorid)]
+
+    def locateFiles(self, filenameorids):
+        self.sam._count("locateFiles")
+        return {name: [{"full_path": path} for path in self.sam._locations(name)] for name in filenameorids}
+
+    def removeFileLocation(self, filenameorid, location):
+        self.sam._count("removeFileLocation")
+        with self.sam.lock:
+            paths = self.sam.locations.get(filenameorid, [])
+            if location not in paths:
+                raise RuntimeError(f"Location {location} not found for file {filenameorid}")
+            paths.remove(location)
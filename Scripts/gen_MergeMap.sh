@@ -2,6 +2,15 @@
 #set -euo pipefail
 
 PROD=false
+EXPANDED=false
+BATCH=1
+
+# The merge map is range encoded: after a '#rangemap v1' header, one record per parfile
+#   <offset> <parfile> <njobs> <inloc> <outloc>
+# where offset is the global index of the parfile's first job (the sum of njobs of the records
+# above). run_JITfcl.py finds the record of a global index by binary search. --expanded writes
+# the legacy map instead, with one '<parfile> <index> <inloc> <outloc>' line per job.
+# --batch N sizes the index definition for run_JITfcl.py --batch N, each grid slot running N map indices.
 
 # Parse optional flags
 while [[ $# -gt 0 ]]; do
@@ -10,13 +19,21 @@ while [[ $# -gt 0 ]]; do
       PROD=true
       shift
       ;;
+    --expanded)
+      EXPANDED=true
+      shift
+      ;;
+    --batch)
+      BATCH="$2"
+      shift 2
+      ;;
     --help)
-      echo "Usage: $0 [--prod] <merge_map_file>"
+      echo "Usage: $0 [--prod] [--expanded] [--batch N] <merge_map_file>"
       exit 0
       ;;
     --*)
       echo "Unknown option: $1"
-      echo "Usage: $0 [--prod] <merge_map_file>"
+      echo "Usage: $0 [--prod] [--expanded] [--batch N] <merge_map_file>"
       exit 1
       ;;
     *)
@@ -27,7 +44,7 @@ done
 
 # Now we expect exactly one positional argument
 if [ "$#" -ne 1 ]; then
-  echo "Usage: $0 [--prod] <merge_map_file>"
+  echo "Usage: $0 [--prod] [--expanded] [--batch N] <merge_map_file>"
   exit 1
 fi
 
@@ -40,7 +57,12 @@ echo "Input file: $INPUT_FILE"
 echo "Output file: $OUTPUT_FILE"
 
 # Empty/initialize the output file.
-> "$OUTPUT_FILE"
+if [ "$EXPANDED" = true ]; then
+  > "$OUTPUT_FILE"
+else
+  echo "#rangemap v1" > "$OUTPUT_FILE"
+fi
+JOBS=0
 
 # Read each non-empty line in the merge map file.
 while IFS= read -r line || [ -n "$line" ]; do
@@ -82,9 +104,14 @@ while IFS= read -r line || [ -n "$line" ]; do
 
   echo "Job count for $parfile: $job_count"
 
-  for (( i = 0; i < job_count; i++ )); do
-    echo "${parfile} ${i} ${inloc} ${outloc}" >> "$OUTPUT_FILE"
-  done
+  if [ "$EXPANDED" = true ]; then
+    for (( i = 0; i < job_count; i++ )); do
+      echo "${parfile} ${i} ${inloc} ${outloc}" >> "$OUTPUT_FILE"
+    done
+  else
+    echo "${JOBS} ${parfile} ${job_count} ${inloc} ${outloc}" >> "$OUTPUT_FILE"
+  fi
+  JOBS=$(( JOBS + job_count ))
 
 done < "$INPUT_FILE"
 
@@ -93,8 +120,10 @@ echo "Merge map generated successfully in '$OUTPUT_FILE'."
 index_dataset=$(basename "${INPUT_FILE}")
 echo "index_dataset: $index_dataset"
 
-JOBS=$(wc -l < "$OUTPUT_FILE")
-idx_format=$(printf "%07d" "${JOBS}")
+echo "Total jobs: $JOBS"
+SLOTS=$(( (JOBS + BATCH - 1) / BATCH ))
+echo "Grid slots of $BATCH jobs: $SLOTS"
+idx_format=$(printf "%07d" "${SLOTS}")
 echo "idx_format: $idx_format"
 
 # Only source gen_IndexDef.sh if --prod was given
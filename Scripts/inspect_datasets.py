@@ -5,76 +5,258 @@ Run as:
 mu2einit
 muse setup ops
 muse setup
-inspect_datasets.py data/datasets_dig.txt
+inspect_datasets.py --input-file data/datasets_dig.txt --jobs 8
+inspect_datasets.py --input-file data/datasets_dig.txt --trend '%CeEndpoint%'
+inspect_datasets.py --input-file data/datasets_dig.txt --added-since 2025-06-01
+
+Several datasets are inspected at once (--jobs). The metacat file list is
+streamed and size and rse.nevent are accumulated file by file, so a dataset
+with 100k+ files does not have to fit in memory. The dCache status of the
+files is asked for through the mdh Python client in batches while the list
+streams, on a pool shared by all datasets (--status-jobs). A dataset whose
+listing fails is left out of the run; if only its dCache query fails, its
+status counts are left empty.
+
+Each run appends one snapshot per dataset to an SQLite store (by default
+datasetMon.sqlite in the CSV folder), together with its change since the
+previous snapshot of the dataset. The HTML table, the trend and the
+added-since reports are queries on that store. --import-csv loads the daily
+CSV files written by earlier versions.
 """
 
 import mdh_cli
 import sys
 import argparse
 from collections import Counter
-from io import StringIO
-import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import re
 import subprocess
+import sqlite3
 import json
 import os
+import tempfile
+import threading
 from datetime import datetime
 
-def analyze_dataset(cli, dataset, skip_dcache_status):
+CHUNK_SIZE = 1 << 16  # bytes read from metacat at a time
+STATUS_BATCH = 1000   # files per dCache locality request
+LOCATIONS = ('tape', 'disk', 'scratch')
 
-    counts = {}
-    
-    if not skip_dcache_status:
-        try:
-            # Run mdh query-dcache with online status
-            output = StringIO()
-            with contextlib.redirect_stdout(output):
-                cli.run(['query-dcache', '-o', dataset])
-
-            # Extract statuses from the output
-            statuses = re.findall(r'(NEARLINE|ONLINE_AND_NEARLINE)', output.getvalue())
-            counts = Counter(statuses)
-        except RuntimeError as e:
-            print ("Bad dataset - please fix")
-
-    # Get file info including size and rse.nevent using metacat command
+class DCacheStatus:
+    """
+    dCache localities of files through the mdh Python client, which maps the
+    file names to their standard paths and queries dCache for them (what mdh
+    query-dcache prints). Each thread uses its own client.
+    """
+    def __init__(self, location='tape'):
+        self.location = location
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = mdh_cli.MdhCli().client
+        return self.local.client
+
+    def count(self, filenames):
+        """Return a Counter of the fileLocality (ONLINE, NEARLINE, ONLINE_AND_NEARLINE...) of filenames."""
+        records = self.client().query_dcache(filenames, location=self.location)
+        return Counter(record.get('fileLocality', 'UNKNOWN') for record in records)
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """Yield the elements of a JSON array read incrementally from a text stream."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # skip separators, then decode the next element once it is complete in the buffer
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if not started and pos < len(buffer):
+            if buffer[pos] != '[':
+                raise json.JSONDecodeError('Expected a JSON array', buffer, pos)
+            started = True
+            pos += 1
+            continue
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        if pos < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        if eof:
+            # metacat always prints at least [], so an empty output is a failure too
+            raise json.JSONDecodeError('Unterminated JSON array' if started else 'Expected a JSON array', buffer, pos)
+        chunk = stream.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+
+def analyze_dataset(dataset, skip_dcache_status, dcache=None, status_pool=None):
+    """
+    Return the snapshot of dataset, or None if its metacat listing failed or
+    was cut short. If only the dCache query failed, the totals are kept and
+    the status counts are None.
+    """
+    # the localities are asked for in batches on the status pool while the listing streams
+    statuses = []
+    batch = []
+
+    total_size_int = 0
+    total_nevent = 0
+    total_files = 0
+
+    # Get file info including size and rse.nevent using metacat command, streamed
+    cmd = ['metacat', 'query', '-m', 'all', '-j', f'files from mu2e:{dataset}']
+    print("cmd: %s"%' '.join(cmd))
+    complete = False
     try:
+        # stderr goes to a file, so a verbose metacat cannot block on a full pipe
+        with tempfile.TemporaryFile('w+') as errors, \
+             subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors, universal_newlines=True) as proc:
+            try:
+                for file_info in iter_json_array(proc.stdout):
+                    total_files += 1
+                    # Sum up sizes
+                    total_size_int += file_info.get('size', 0) or 0
+                    # Sum up rse.nevent values
+                    metadata = file_info.get('metadata', {}) or {}
+                    total_nevent += metadata.get('rse.nevent', 0) or 0
 
-        cmd = f'metacat query -m all -j files from mu2e:{dataset}'
-        print("cmd: %s"%cmd)
-        metacat_output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT, universal_newlines=True)
-        file_list = json.loads(metacat_output)
-
-        total_size_int = 0
-        total_nevent = 0
-        total_files = len(file_list)
-
-        
-        for file_info in file_list:
-            # Sum up sizes
-            size = file_info.get('size', 0)
-            total_size_int += size
-
-            # Sum up rse.nevent values
-            metadata = file_info.get('metadata', {})
-            nevent = metadata.get('rse.nevent', 0)
-            total_nevent += nevent
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error running metacat command for dataset '{dataset}': {e.output}")
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON output from metacat command for dataset '{dataset}': {e}")
-    
+                    if not skip_dcache_status:
+                        batch.append(file_info.get('name', ''))
+                        if len(batch) >= STATUS_BATCH:
+                            statuses.append(status_pool.submit(dcache.count, batch))
+                            batch = []
+                if batch and not skip_dcache_status:
+                    statuses.append(status_pool.submit(dcache.count, batch))
+                complete = True
+            except json.JSONDecodeError as e:
+                print(f"Error parsing JSON output from metacat command for dataset '{dataset}': {e}")
+                proc.kill()
+            proc.wait()
+            if proc.returncode != 0:
+                errors.seek(0)
+                print(f"Error running metacat command for dataset '{dataset}': {errors.read()}")
+                complete = False
+    except OSError as e:
+        print(f"Error running metacat command for dataset '{dataset}': {e}")
+
+    if not complete:
+        for status in statuses:
+            status.cancel()
+        return None
+    counts = None
+    if not skip_dcache_status:
+        try:
+            counts = sum((status.result() for status in statuses), Counter())
+        except Exception as e:
+            print(f"Error querying dCache status for dataset '{dataset}': {e} - Bad dataset - please fix")
     return {
         'dataset': dataset,
-        'NEARLINE': counts.get('NEARLINE', 0) if not skip_dcache_status else None,
-        'ONLINE_AND_NEARLINE': counts.get('ONLINE_AND_NEARLINE', 0) if not skip_dcache_status else None,
+        'NEARLINE': counts.get('NEARLINE', 0) if counts is not None else None,
+        'ONLINE_AND_NEARLINE': counts.get('ONLINE_AND_NEARLINE', 0) if counts is not None else None,
         'Total size': round(total_size_int / (1024 ** 3), 2),   # Convert bytes to GB
         'Total events': total_nevent,
         'Total files': total_files  # Include the total number of files
     }
 
+# columns of a snapshot: result key -> store column
+SNAPSHOT_COLUMNS = {'NEARLINE': 'nearline', 'ONLINE_AND_NEARLINE': 'online_and_nearline',
+                    'Total size': 'size_gb', 'Total events': 'events', 'Total files': 'files'}
+
+class MonitorStore:
+    """
+    SQLite time series of dataset snapshots, one row per (list, dataset, date)
+    with the change of every column since the previous snapshot of the dataset.
+    """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        columns = ', '.join(f'{c} REAL, d_{c} REAL' for c in SNAPSHOT_COLUMNS.values())
+        self.db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                list TEXT NOT NULL, dataset TEXT NOT NULL, date TEXT NOT NULL, {columns},
+                PRIMARY KEY (list, dataset, date));
+            CREATE INDEX IF NOT EXISTS snapshots_date ON snapshots(list, date);
+            CREATE INDEX IF NOT EXISTS snapshots_dataset ON snapshots(dataset, date);""")
+
+    def close(self):
+        self.db.close()
+
+    def previous(self, name, dataset, date, column):
+        """Return the latest non-NULL value of column for dataset before date, or None."""
+        row = self.db.execute(
+            f"SELECT {column} FROM snapshots WHERE list = ? AND dataset = ? AND date < ? AND {column} IS NOT NULL "
+            "ORDER BY date DESC LIMIT 1", (name, dataset, date)).fetchone()
+        return row[0] if row else None
+
+    def append(self, name, date, results):
+        """
+        Store the results of a run of list name on date, with the deltas to the previous snapshots.
+
+        Failed results (None) are skipped. A value that could not be measured is
+        stored as NULL without a delta, and deltas are taken to the last measured
+        value, so a failed query leaves no spurious drop and jump in the series.
+        """
+        rows = []
+        for result in results:
+            if result is None:
+                continue
+            row = [name, result['dataset'], date]
+            for key, column in SNAPSHOT_COLUMNS.items():
+                value = result.get(key)
+                before = self.previous(name, result['dataset'], date, column) if value is not None else None
+                row += [value, value - before if before is not None else None]
+            rows.append(row)
+        if rows:
+            with self.db:
+                self.db.executemany(f"INSERT OR REPLACE INTO snapshots VALUES ({', '.join('?' * len(rows[0]))})", rows)
+
+    def latest(self, name):
+        """Return the DataFrame of the latest snapshot of list name."""
+        return pd.read_sql_query(
+            "SELECT * FROM snapshots WHERE list = ? AND date = (SELECT MAX(date) FROM snapshots WHERE list = ?) "
+            "ORDER BY dataset", self.db, params=(name, name))
+
+    def trend(self, name, pattern):
+        """Return the DataFrame of every snapshot of the datasets of list name LIKE pattern."""
+        return pd.read_sql_query("SELECT * FROM snapshots WHERE list = ? AND dataset LIKE ? ORDER BY dataset, date",
+                                 self.db, params=(name, pattern))
+
+    def added_since(self, name, date):
+        """Return the DataFrame of the files, events and size added per dataset of list name after date."""
+        return pd.read_sql_query(
+            "SELECT dataset, SUM(d_files) AS files, SUM(d_events) AS events, SUM(d_size_gb) AS size_gb, "
+            "MIN(date) AS first, MAX(date) AS last FROM snapshots WHERE list = ? AND date > ? "
+            "GROUP BY dataset HAVING SUM(d_files) != 0 ORDER BY dataset", self.db, params=(name, date))
+
+def import_csv(store, name, paths):
+    """Load daily CSV files of earlier versions into the store, oldest first so the deltas chain."""
+    frames = [pd.read_csv(path) for path in paths]
+    frames = [df[df['dataset'] != 'TOTAL'] for df in frames]
+    for df in sorted(frames, key=lambda df: df['date'].iloc[0] if len(df) else ''):
+        if len(df):
+            df = df.astype(object).where(df.notna(), None)
+            store.append(name, df['date'].iloc[0], df.to_dict('records'))
+
+def render_html(df, path):
+    """Write the HTML table of a snapshot, with a TOTAL row."""
+    names = {v: k for k, v in SNAPSHOT_COLUMNS.items()}
+    names.update({f'd_{v}': f'{k} change' for k, v in SNAPSHOT_COLUMNS.items()})
+    df = df.drop(columns=['list']).rename(columns=names)
+    sum_row = df.select_dtypes(include='number').sum()
+    sum_row['dataset'] = 'TOTAL'
+    df = pd.concat([df, sum_row.to_frame().T], ignore_index=True)
+    df.to_html(path, index=False)
+
 def main():
 
     # Parse command-line arguments
@@ -85,6 +267,14 @@ def main():
     parser.add_argument("--output-html-folder", default="/web/sites/mu2e.fnal.gov/htdocs/atwork/computing/ops/datasetMon", 
                         help="Path to the folder where output HTML files will be saved.")
     parser.add_argument("--skip-dcache-status", action="store_true", help="Skip querying dCache status.")
+    parser.add_argument("--location", choices=LOCATIONS, default="tape", help="dCache location whose status is queried (default: tape)")
+    parser.add_argument("--status-jobs", type=int, default=4, help="Concurrent dCache status requests (default: 4)")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Datasets inspected concurrently (default: 4)")
+    parser.add_argument("--store", help="SQLite snapshot store (default: datasetMon.sqlite in the CSV folder)")
+    parser.add_argument("--csv", action="store_true", help="Also write the daily <list>_<date>.csv file")
+    parser.add_argument("--import-csv", nargs="+", metavar="CSV", help="Load daily CSV files of earlier runs into the store first")
+    parser.add_argument("--trend", metavar="PATTERN", help="Print every snapshot of the datasets LIKE PATTERN and exit")
+    parser.add_argument("--added-since", metavar="DATE", help="Print what was added to each dataset after DATE (YYYY-MM-DD) and exit")
     args = parser.parse_args()
 
     # Use args.input_file for input file
@@ -92,43 +282,54 @@ def main():
     output_csv_folder = args.output_csv_folder
     output_html_folder = args.output_html_folder
 
-    # Create MdhCli instance
-    cli = mdh_cli.MdhCli()
+    # Derive the list name and HTML file name from input_file
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    html_file = '%s/%s.html'%(output_html_folder, base_name)
+    store = MonitorStore(args.store or os.path.join(output_csv_folder, 'datasetMon.sqlite'))
+
+    if args.import_csv:
+        import_csv(store, base_name, args.import_csv)
+    if args.trend or args.added_since:
+        with pd.option_context('display.max_rows', None, 'display.width', None):
+            if args.trend:
+                print(store.trend(base_name, args.trend))
+            if args.added_since:
+                print(store.added_since(base_name, args.added_since))
+        store.close()
+        return
 
     # Process each dataset
     results = []
     with open(input_file, 'r') as f:
         datasets = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
-        
-    for dataset in datasets:
-        result = analyze_dataset(cli, dataset, args.skip_dcache_status)
-        results.append(result)
-        print(result)
+
+    # the status pool is shared by all datasets, so it bounds the load on dCache
+    dcache = DCacheStatus(args.location)
+    with ThreadPoolExecutor(max_workers=max(1, args.status_jobs)) as status_pool, \
+         ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        for dataset, result in zip(datasets, pool.map(lambda ds: analyze_dataset(ds, args.skip_dcache_status, dcache, status_pool), datasets)):
+            if result is None:
+                print(f"Skipping dataset '{dataset}': its metacat listing failed or was incomplete")
+                continue
+            results.append(result)
+            print(result)
 
     # Get the current date in YYYY-MM-DD format
     current_date = datetime.now().strftime('%Y-%m-%d')
+    store.append(base_name, current_date, results)
 
-    # Create and display DataFrame
-    df = pd.DataFrame(results)
-    df = df.sort_values(by='dataset', ascending=True, ignore_index=True)
-    # Add the current date as a new column to the DataFrame
-    df['date'] = current_date
+    # Display and render the snapshot from the store
+    df = store.latest(base_name)
     print(df)
-
-    # Derive HTML file name from input_file
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
-    html_file = f"{base_name}_results.html"
-
-    # Calculate the sum of columns
-    sum_row = df.select_dtypes(include='number').sum()
-    sum_row['dataset'] = 'TOTAL'
-    df = pd.concat([df, sum_row.to_frame().T], ignore_index=True)
-
-    df.to_html('%s/%s.html'%(output_html_folder, base_name), index=False)
+    render_html(df, html_file)
     print(f"HTML file '{html_file}' has been created.")
-    
+
     # Optionally save to CSV
-    df.to_csv('%s/%s_%s.csv'%(output_csv_folder, base_name, current_date), index=False)
+    if args.csv:
+        df = pd.DataFrame(results).sort_values(by='dataset', ascending=True, ignore_index=True)
+        df['date'] = current_date
+        df.to_csv('%s/%s_%s.csv'%(output_csv_folder, base_name, current_date), index=False)
+    store.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Streaming command runner shared by the grid job wrappers (run_JITfcl.py,
+run_RecoEntuple.py, run_mu2ejobfcl.py).
+
+The output of the command is teed line by line to the job log, but only a
+bounded ring buffer of lines (optionally only those passing a filter) is kept
+for the return value, so a verbose mu2e job does not grow the wrapper's
+memory with its log. Lines matching the capture patterns, such as the art
+TimeReport and MemReport summaries, are parsed into dicts on the fly.
+"""
+
+import os
+import re
+import subprocess
+from collections import deque
+from typing import NamedTuple
+
+DEFAULT_KEEP = 1000  # lines kept for the return value
+
+# art end-of-job summaries, parsed into dicts of floats
+ART_REPORTS = {
+    "TimeReport": re.compile(r"TimeReport\s+CPU\s*=\s*(?P<cpu>[\d.eE+-]+)\s+Real\s*=\s*(?P<real>[\d.eE+-]+)"),
+    "MemReport": re.compile(r"MemReport\s+VmPeak\s*=\s*(?P<vmpeak>[\d.eE+-]+)\s+VmHWM\s*=\s*(?P<vmhwm>[\d.eE+-]+)"),
+}
+
+class CommandResult(NamedTuple):
+    """
+    Attributes:
+        returncode (int): exit status of the command.
+        lines (list[str]): the kept output lines, stripped, the last ones if the output was longer.
+        dropped (int): output lines not kept.
+        captured (dict): capture name -> list of dicts of the named groups of every matching line.
+        cpu_s (float): user + system CPU of the command and the descendants it waited for.
+        maxrss_mb (float): peak RSS of the largest of those processes.
+    """
+    returncode: int
+    lines: list
+    dropped: int
+    captured: dict
+    cpu_s: float = 0.0
+    maxrss_mb: float = 0.0
+
+    @property
+    def output(self):
+        return "\n".join(self.lines)
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def stream_command(command, log=print, keep=DEFAULT_KEEP, line_filter=None, capture=None, cwd=None,
+                   stderr=subprocess.STDOUT):
+    """
+    Run a command, teeing its output to log while it runs.
+
+    Args:
+        command (str or list): shell command line, or argument list run without a shell.
+        log (callable): called with every output line (newline stripped); None for silence.
+        keep (int): number of last lines kept for the result; None keeps all, 0 none.
+        line_filter (callable): if given, only lines for which it is true are kept.
+        capture (dict): name -> compiled regex; matches are parsed into result.captured.
+        cwd (str): working directory of the command.
+        stderr: where the command's stderr goes: merged into the output (default),
+            None to inherit the wrapper's stderr, or any subprocess.Popen stderr value.
+
+    Returns:
+        CommandResult
+    """
+    capture = capture or {}
+    kept = deque(maxlen=keep)
+    seen = 0
+    captured = {name: [] for name in capture}
+    process = subprocess.Popen(command, shell=isinstance(command, str), cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=stderr, text=True, errors="replace")
+    with process.stdout:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            if log:
+                log(line)
+            for name, pattern in capture.items():
+                match = pattern.search(line)
+                if match:
+                    captured[name].append({k: _number(v) for k, v in match.groupdict().items()})
+            if line_filter is None or line_filter(line):
+                seen += 1
+                kept.append(line.strip())
+    # reap the command with wait4 for its own resource usage, which getrusage(RUSAGE_CHILDREN)
+    # would mix with that of every other command the wrapper ran
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return CommandResult(process.returncode, list(kept), seen - len(kept), captured,
+                         usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024.0)  # ru_maxrss is in kB on Linux
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Per-phase timing and resource telemetry of the grid job wrappers
+(run_JITfcl.py, run_RecoEntuple.py), and its per-dataset roll-up.
+
+A wrapper times each phase of its job (token check, parfile copy, FCL
+generation, input staging, mu2e, pushOutput) with Telemetry.phase or
+Telemetry.begin/end. Each phase records:
+  - wall time;
+  - CPU time of the wrapper and of the commands it ran (their CPU is counted
+    once they have exited);
+  - peak RSS of the largest process so far (getrusage only keeps the maximum);
+  - bytes moved, as reported by the wrapper.
+
+When several phases run at once (run_JITfcl.py --batch with --parallel), the
+process-wide CPU and RSS would charge one index's mu2e to another index's
+phase. Such phases are accounted per command instead: the wrapper hands every
+command it ran to Phase.add_command, and the phase records the CPU of its
+commands plus that of its own thread, and the peak RSS of its largest command.
+These records carry "accounting": "per_command" and are rolled up separately
+from the process-wide ones.
+
+The record is written as a JSON sidecar shipped in output.txt next to the
+job log. Since the sidecar has to be written before pushOutput runs, the
+complete record, pushOutput included, is also printed on a 'Telemetry: '
+line when the wrapper exits, also if it fails. The roll-up reads either.
+
+Roll-up of sidecars or job logs per dataset:
+jobtelemetry.py log.mu2e.*.json
+jobtelemetry.py --list files.txt --format json
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_MARKER = "Telemetry: "
+PERCENTILES = (50, 90)
+
+#----------------------------------------------------------------------------------------------------#
+class Phase:
+    """
+    One timed phase; add moved bytes to .bytes and any other fields, e.g. art reports, to .details.
+
+    With per_command the phase must begin and end in the same thread.
+    """
+    def __init__(self, name, per_command=False):
+        self.name = name
+        self.bytes = 0
+        self.per_command = per_command
+        self.command_cpu = 0.0
+        self.command_rss = 0.0
+        self.lock = threading.Lock()
+        self.start_wall = time.time()
+        self.start_cpu = self._thread_cpu() if per_command else self._cpu()
+        self.details = {}
+        self.record = None
+
+    @staticmethod
+    def _cpu():
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system
+
+    @staticmethod
+    def _thread_cpu():
+        usage = resource.getrusage(getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF))
+        return usage.ru_utime + usage.ru_stime
+
+    def add_command(self, result):
+        """Charge a finished command, a jobcommand.CommandResult, to this phase."""
+        with self.lock:
+            self.command_cpu += result.cpu_s
+            self.command_rss = max(self.command_rss, result.maxrss_mb)
+
+    @staticmethod
+    def _peak_rss_mb():
+        # ru_maxrss is in kB on Linux
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return peak / 1024.0
+
+    def finish(self, ok=True):
+        if self.per_command:
+            cpu = self._thread_cpu() - self.start_cpu + self.command_cpu
+            rss = self.command_rss
+        else:
+            cpu = self._cpu() - self.start_cpu
+            rss = self._peak_rss_mb()
+        self.record = {"phase": self.name, "start": round(self.start_wall, 3),
+                       "wall_s": round(time.time() - self.start_wall, 3),
+                       "cpu_s": round(cpu, 3), "peak_rss_mb": round(rss, 1),
+                       "bytes": int(self.bytes), "ok": ok}
+        if self.per_command:
+            self.record["accounting"] = "per_command"
+        self.record.update(self.details)
+        return self.record
+
+class Telemetry:
+    """
+    Collects the phases of one job.
+
+    Args:
+        job (str): job identifier, e.g. the fname of the job.
+        dataset (str): dataset the job contributes to, '<desc>.<dsconf>'.
+        wrapper (str): name of the wrapper script.
+        per_command (bool): account the phases begun from now on per command, see Phase.
+    """
+    def __init__(self, job, dataset, wrapper, per_command=False):
+        self.info = {"job": job, "dataset": dataset, "wrapper": wrapper, "host": socket.gethostname(),
+                     "start": round(time.time(), 3)}
+        self.phases = []
+        self.per_command = per_command
+        self.lock = threading.Lock()
+        atexit.register(self.log)
+
+    def begin(self, name):
+        return Phase(name, self.per_command)
+
+    def end(self, phase, ok=True):
+        record = phase.finish(ok)
+        with self.lock:
+            self.phases.append(record)
+        return phase.record
+
+    @contextmanager
+    def phase(self, name):
+        phase = self.begin(name)
+        ok = False
+        try:
+            yield phase
+            ok = True
+        finally:
+            self.end(phase, ok)
+
+    def to_dict(self):
+        record = dict(self.info)
+        record["wall_s"] = round(time.time() - self.info["start"], 3)
+        record["phases"] = list(self.phases)
+        return record
+
+    def write(self, path):
+        """Write the JSON sidecar."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+            f.write("\n")
+
+    def log(self):
+        """Print the full record on one line of the job log."""
+        print(LOG_MARKER + json.dumps(self.to_dict()), flush=True)
+
+def dataset_of(filename):
+    """Return '<desc>.<dsconf>' of a Mu2e file name, or the name itself."""
+    fields = os.path.basename(filename).split(".")
+    return ".".join(fields[2:4]) if len(fields) == 6 else filename
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+#----------------------------------------------------------------------------------------------------#
+def read_record(path):
+    """Return the telemetry record of a JSON sidecar or, from the last 'Telemetry: ' line, of a job log."""
+    with open(path, errors="replace") as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        return json.loads(text)
+    record = None
+    for line in text.splitlines():
+        if line.startswith(LOG_MARKER):
+            record = line[len(LOG_MARKER):]
+    return json.loads(record) if record else None
+
+def percentile(values, q):
+    """Return the q-th percentile of values, interpolating linearly between ranks."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def rollup(records):
+    """Return {dataset: {'jobs': n, 'wall_s': ..., 'phases': {phase: stats}}} over job records."""
+    grouped = {}
+    # a job given both as its sidecar and its log counts once, with the more complete log record
+    unique = {}
+    for record in records:
+        key = (record.get("job"), record.get("start"))
+        if key not in unique or len(record.get("phases", [])) > len(unique[key].get("phases", [])):
+            unique[key] = record
+    for record in unique.values():
+        grouped.setdefault(record.get("dataset", "unknown"), []).append(record)
+    summary = {}
+    for dataset, jobs in sorted(grouped.items()):
+        phases = {}
+        for job in jobs:
+            for phase in job.get("phases", []):
+                # per-command and process-wide CPU/RSS are not comparable, so they are kept apart
+                name = phase["phase"] + (" (per command)" if phase.get("accounting") == "per_command" else "")
+                phases.setdefault(name, []).append(phase)
+        summary[dataset] = {"jobs": len(jobs), "wall_s": summarize([job.get("wall_s", 0.0) for job in jobs]),
+                            "phases": {name: phase_stats(values) for name, values in phases.items()}}
+    return summary
+
+def summarize(values):
+    stats = {"mean": round(sum(values) / len(values), 3) if values else None, "max": max(values, default=None)}
+    for q in PERCENTILES:
+        stats[f"p{q}"] = round(percentile(values, q), 3) if values else None
+    return stats
+
+def phase_stats(phases):
+    wall = sum(p["wall_s"] for p in phases)
+    cpu = sum(p["cpu_s"] for p in phases)
+    moved = sum(p["bytes"] for p in phases)
+    return {"jobs": len(phases), "failed": sum(not p.get("ok", True) for p in phases),
+            "wall_s": summarize([p["wall_s"] for p in phases]),
+            "cpu_efficiency": round(cpu / wall, 3) if wall else None,
+            "peak_rss_mb": max(p["peak_rss_mb"] for p in phases),
+            "bytes": moved, "mb_per_s": round(moved / wall / 1e6, 3) if wall else None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up job telemetry sidecars or job logs per dataset")
+    parser.add_argument("files", nargs="*", help="Telemetry JSON sidecars or job logs (globs allowed)")
+    parser.add_argument("-l", "--list", help="File containing telemetry file names, one per line")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="Output format (default: text)")
+    args = parser.parse_args()
+
+    paths = [p for pattern in args.files for p in (glob.glob(pattern) or [pattern])]
+    if args.list:
+        with open(args.list) as f:
+            paths += [line.strip() for line in f if line.strip()]
+    records = []
+    for path in paths:
+        try:
+            record = read_record(path)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] {path}: {e}", file=sys.stderr)
+            continue
+        if record:
+            records.append(record)
+    summary = rollup(records)
+
+    if args.format == "json":
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    for dataset, stats in summary.items():
+        wall = stats["wall_s"]
+        print(f"{dataset}: {stats['jobs']} jobs, wall mean {wall['mean']} s p90 {wall['p90']} s max {wall['max']} s")
+        for name, p in stats["phases"].items():
+            print(f"  {name:<23} wall mean {p['wall_s']['mean']:>10} s p90 {p['wall_s']['p90']:>10} s  "
+                  f"cpu/wall {p['cpu_efficiency']}  peak RSS {p['peak_rss_mb']} MB  "
+                  f"{p['bytes']} bytes ({p['mb_per_s']} MB/s)  failed {p['failed']}")
+
+if __name__ == "__main__":
+    main()
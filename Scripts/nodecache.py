@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Worker-node cache of files fetched by the job wrappers (parfiles, shared
+pileup inputs), shared by all the jobs running on a node.
+
+Entries live under <root>/data/<key>/<file name>, the key being the file name
+plus its SAM adler32 checksum, so a file that is re-declared with different
+content gets a new entry. Every entry has a lock file under <root>/locks: the
+job that misses holds it exclusively while downloading, so concurrent jobs
+asking for the same file wait for that one download instead of making their
+own. A hit refreshes the entry's modification time, and whenever an entry is
+added the least recently used unlocked entries are evicted, lock file
+included, until the cache is below its size cap.
+
+The cache is opt-in: run_JITfcl.py uses it with --node_cache DIR (or
+MU2E_NODE_CACHE). Run as a script it prints or clears a cache:
+nodecache.py --root /scratch/mu2e-cache --stats
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+DEFAULT_MAX_GB = 20.0
+
+def sam_checksum(name):
+    """Return the 'adler32:<hex>' checksum of a file in SAM, or None if it cannot be found."""
+    try:
+        result = subprocess.run(["samweb", "get-metadata", "--json", name], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, timeout=120)
+        if result.returncode == 0:
+            for checksum in json.loads(result.stdout).get("checksum", []):
+                if checksum.startswith("adler32:"):
+                    return checksum
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        pass
+    return None
+
+def adler32(path):
+    """Return the 'adler32:<hex>' checksum of a local file, as SAM records it."""
+    value = 1
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            value = zlib.adler32(block, value)
+    return f"adler32:{value:08x}"
+
+def _same_file(f, path):
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+@contextmanager
+def locked(path, exclusive=True, blocking=True):
+    """
+    Hold an flock on path; yields False if non-blocking and the lock is taken.
+
+    Lock files are removed together with evicted entries, so a lock taken on a
+    file that was unlinked meanwhile is dropped and taken again on the new one.
+    """
+    flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+    while True:
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                if not _same_file(f, path):
+                    continue
+                yield True
+                return
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class NodeCache:
+    """
+    A size-capped LRU file cache shared by the jobs of a node.
+
+    Attributes:
+        root (str): cache directory.
+        max_bytes (int): size cap.
+        hits, misses, bytes_saved (int): counters of this process.
+    """
+    def __init__(self, root, max_gb=DEFAULT_MAX_GB):
+        self.root = root
+        self.max_bytes = int(max_gb * 1024**3)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+        for sub in ("data", "locks", "tmp"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def key(self, name, checksum=None):
+        return f"{name}.{checksum.replace(':', '_')}" if checksum else name
+
+    def fetch(self, name, download, dest_dir=".", checksum=None):
+        """
+        Place file name in dest_dir, from the cache or by downloading it.
+
+        Args:
+            name (str): file name.
+            download (callable): download(directory) copies the file into directory.
+            dest_dir (str): where the job wants the file.
+            checksum (str): 'adler32:<hex>' from SAM, if known; a download that
+                does not match it is not cached and raises RuntimeError.
+
+        Returns:
+            str: path of the file in dest_dir.
+        """
+        key = self.key(name, checksum)
+        entry = os.path.join(self.root, "data", key, name)
+        with locked(os.path.join(self.root, "locks", key + ".lock")):
+            if os.path.exists(entry):
+                os.utime(entry)
+                with self.lock:
+                    self.hits += 1
+                    self.bytes_saved += os.path.getsize(entry)
+                print(f"Node cache hit: {name}")
+            else:
+                with self.lock:
+                    self.misses += 1
+                print(f"Node cache miss: {name}")
+                tmp = tempfile.mkdtemp(dir=os.path.join(self.root, "tmp"))
+                try:
+                    download(tmp)
+                    fetched = os.path.join(tmp, name)
+                    if not os.path.exists(fetched):
+                        raise RuntimeError(f"Download of {name} did not produce the file")
+                    if checksum and checksum.startswith("adler32:") and adler32(fetched) != checksum:
+                        raise RuntimeError(f"Checksum mismatch for {name}: expected {checksum}")
+                    os.makedirs(os.path.dirname(entry), exist_ok=True)
+                    os.replace(fetched, entry)
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+            path = os.path.join(dest_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+            try:
+                os.link(entry, path)
+            except OSError:
+                shutil.copy(entry, path)
+        self.evict()
+        return path
+
+    def entries(self):
+        """Return [(mtime, size, key)] of the cached entries."""
+        result = []
+        data = os.path.join(self.root, "data")
+        for key in os.listdir(data):
+            try:
+                for name in os.listdir(os.path.join(data, key)):
+                    st = os.stat(os.path.join(data, key, name))
+                    result.append((st.st_mtime, st.st_size, key))
+            except FileNotFoundError:
+                continue  # evicted by another job meanwhile
+        return result
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries until the cache is below max_bytes; entries in use are kept."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with locked(os.path.join(self.root, "cache.lock")):
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= max_bytes:
+                    break
+                lock = os.path.join(self.root, "locks", key + ".lock")
+                with locked(lock, blocking=False) as free:
+                    if free:
+                        shutil.rmtree(os.path.join(self.root, "data", key), ignore_errors=True)
+                        # removed while held, so a job waiting on it locks the new file instead
+                        os.remove(lock)
+                        total -= size
+
+    def report(self):
+        """Print the counters of this job, for the job log."""
+        print(f"Node cache {self.root}: {self.hits} hits, {self.misses} misses, {self.bytes_saved} bytes saved")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear a worker-node file cache.")
+    parser.add_argument("--root", default=os.environ.get("MU2E_NODE_CACHE"), help="Cache directory (default: $MU2E_NODE_CACHE)")
+    parser.add_argument("--stats", action="store_true", help="Print the entries and total size")
+    parser.add_argument("--clear", action="store_true", help="Remove every entry not in use")
+    args = parser.parse_args()
+    if not args.root:
+        parser.error("--root or MU2E_NODE_CACHE is required")
+    cache = NodeCache(args.root)
+    if args.clear:
+        cache.evict(0)
+    if args.stats or not args.clear:
+        entries = sorted(cache.entries(), reverse=True)
+        for mtime, size, key in entries:
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))} {size:>14} {key}")
+        print(f"{len(entries)} entries, {sum(size for _, size, _ in entries)} bytes")
+        sys.exit(0)
@@ -2,65 +2,186 @@
 # python /exp/mu2e/app/users/oksuzian/muse_080224/Production/Scripts/remove_bad_locations.py --file /exp/mu2e/app/users/mu2epro/production_manager/current_datasets/mc/datasets_evntuple_an.txt --dry-run
 # or
 # python /exp/mu2e/app/users/oksuzian/muse_080224/Production/Scripts/remove_bad_locations.py --definition nts.mu2e.CosmicCORSIKASignalAllOnSpillTriggered.MDC2020an_v06_01_01_perfect_v1_3.root
+# or, resumable after an interruption and benchmarked offline against fake_samweb.py:
+# python remove_sam_locations.py --file datasets_evntuple_an.txt --checkpoint cleanup.ckpt --workers 8 --rate 20
+# python remove_sam_locations.py --definition fake.definition --fake-files 20000 --fake-latency 0.05
+#
+# Files are located in batches (--batch) through one samweb_client connection per thread, and the
+# removals run on a worker pool (--workers) limited to --rate calls per second. Every removal and
+# every finished file is appended to the checkpoint file, and a rerun with the same checkpoint skips
+# them, so an interrupted cleanup resumes where it stopped.
 
-import subprocess
 import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Function to make a samweb client, a fake one when benchmarking
+def make_client_factory(args):
+    if args.fake_files:
+        import fake_samweb
+        sam = fake_samweb.FakeSam(args.fake_files, args.fake_latency, keyword=args.keyword)
+        return sam.client, sam
+    import samweb_client
+    return (lambda: samweb_client.SAMWebClient(experiment="mu2e")), None
+
+class ThreadClients:
+    """One reusable client connection per thread."""
+    def __init__(self, factory):
+        self.factory = factory
+        self.local = threading.local()
+
+    def get(self):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.factory()
+        return self.local.client
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads; rate <= 0 means unlimited."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+class Checkpoint:
+    """Append-only JSON-lines record of removed locations and finished files."""
+    def __init__(self, path):
+        self.path = path
+        self.removed = set()
+        self.done = set()
+        self.lock = threading.Lock()
+        self.out = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by the interruption
+                    if "location" in record:
+                        self.removed.add((record["file"], record["location"]))
+                    else:
+                        self.done.add(record["file"])
+        if path:
+            self.out = open(path, "a")
+
+    def record(self, **record):
+        if not self.out:
+            return
+        with self.lock:
+            self.out.write(json.dumps(record) + "\n")
+            self.out.flush()
+
+    def close(self):
+        if self.out:
+            self.out.close()
 
 # Function to get file list from a definition
-def get_files_from_definition(definition_name):
+def get_files_from_definition(client, definition_name):
     try:
-        result = subprocess.run(
-            ["samweb", "list-definition-files", definition_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        result.check_returncode()
-        return result.stdout.strip().split("\n")
-    except subprocess.CalledProcessError as e:
-        print(f"Error fetching file list: {e.stderr}")
+        return list(client.listFiles(defname=definition_name))
+    except Exception as e:
+        print(f"Error fetching file list: {e}")
         return []
 
-# Function to get file list from a text file containing definitions
-def get_files_from_definitions_file(file_path):
-    files = []
+# Function to get the definitions from a text file containing definitions
+def get_definitions_from_file(file_path):
     try:
         with open(file_path, "r") as file:
-            definitions = [line.strip() for line in file if line.strip()]
-        for definition in definitions:
-            files.extend(get_files_from_definition(definition))
+            return [line.strip() for line in file if line.strip()]
     except Exception as e:
         print(f"Error reading definitions file {file_path}: {e}")
-    return files
+        return []
 
-# Function to get locations for a file
-def get_file_locations(file_name):
+# Function to get the locations of a batch of files, {file: [full_path, ...]}
+def get_file_locations(client, file_names):
     try:
-        result = subprocess.run(
-            ["samweb", "locate-file", file_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        result.check_returncode()
-        return [line.strip() for line in result.stdout.strip().split("\n") if line]
-    except subprocess.CalledProcessError as e:
-        print(f"Error fetching locations for {file_name}: {e.stderr}")
-        return []
+        located = client.locateFiles(file_names)
+        return {name: [location["full_path"] for location in located.get(name, [])] for name in file_names}
+    except Exception as e:
+        print(f"Error fetching locations for a batch of {len(file_names)} files: {e}")
+        return {}
 
 # Function to remove a specific location for a file
-def remove_file_location(file_name, location):
+def remove_file_location(client, file_name, location):
     try:
-        result = subprocess.run(
-            ["samweb", "remove-file-location", file_name, location],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        result.check_returncode()
+        client.removeFileLocation(file_name, location)
         print(f"Removed location {location} for file {file_name}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error removing location {location} for file {file_name}: {e.stderr}")
+        return True
+    except Exception as e:
+        print(f"Error removing location {location} for file {file_name}: {e}")
+        return False
+
+class Cleanup:
+    """Locates files in batches and removes their bad locations on a rate-limited pool."""
+    def __init__(self, clients, checkpoint, keyword, workers=8, rate=0.0, dry_run=False):
+        self.clients = clients
+        self.checkpoint = checkpoint
+        self.keyword = keyword
+        self.dry_run = dry_run
+        self.limiter = RateLimiter(rate)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.stats = {"files": 0, "skipped": 0, "located": 0, "removed": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def _remove(self, file_name, location):
+        self.limiter.wait()
+        ok = remove_file_location(self.clients.get(), file_name, location)
+        with self.lock:
+            self.stats["removed" if ok else "failed"] += 1
+        if ok:
+            self.checkpoint.record(file=file_name, location=location)
+        return ok
+
+    def _finish(self, file_name, futures):
+        # a file is done only once all its removals succeeded, so failures are retried on resume
+        if all(future.result() for future in futures):
+            self.checkpoint.record(file=file_name)
+
+    def process_batch(self, file_names):
+        self.stats["files"] += len(file_names)
+        todo = [name for name in file_names if name not in self.checkpoint.done]
+        self.stats["skipped"] += len(file_names) - len(todo)
+        if not todo:
+            return []
+        locations = get_file_locations(self.clients.get(), todo)
+        self.stats["located"] += len(locations)
+        pending = []
+        for file_name, paths in locations.items():
+            bad = [path for path in paths if self.keyword in path and (file_name, path) not in self.checkpoint.removed]
+            if self.dry_run:
+                for location in bad:
+                    print(f"[Dry Run] Would remove location {location} for file {file_name}")
+                continue
+            futures = [self.pool.submit(self._remove, file_name, location) for location in bad]
+            pending.append((file_name, futures))
+        return pending
+
+    def run(self, files, batch_size=500):
+        pending = []
+        for i in range(0, len(files), batch_size):
+            pending += self.process_batch(files[i:i + batch_size])
+            # settle the removals of earlier batches so the bookkeeping does not grow with the list,
+            # waiting for them when locating runs more than a couple of batches ahead of removing
+            while pending and (len(pending) > 2 * batch_size or all(future.done() for future in pending[0][1])):
+                self._finish(*pending.pop(0))
+        for file_name, futures in pending:
+            self._finish(file_name, futures)
+
+    def close(self):
+        self.pool.shutdown()
 
 # Main script
 if __name__ == "__main__":
@@ -69,28 +190,45 @@ if __name__ == "__main__":
     parser.add_argument("--file", help="Path to a text file containing a list of definitions.")
     parser.add_argument("--keyword", default="override_me", help="Keyword to identify locations to remove (default: override_me).")
     parser.add_argument("--dry-run", action="store_true", help="If set, only print the actions without executing them.")
+    parser.add_argument("--checkpoint", help="Progress file; a rerun with the same file resumes where the last one stopped.")
+    parser.add_argument("--batch", type=int, default=500, help="Files located per samweb call (default: 500).")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent removals (default: 8).")
+    parser.add_argument("--rate", type=float, default=0.0, help="Maximum removals per second (default: unlimited).")
+    parser.add_argument("--fake-files", type=int, default=0, help="Benchmark against fake_samweb.py with this many files per definition.")
+    parser.add_argument("--fake-latency", type=float, default=0.02, help="Round-trip time of a fake samweb call in seconds (default: 0.02).")
     args = parser.parse_args()
 
-    override_keyword = args.keyword
+    factory, fake = make_client_factory(args)
+    clients = ThreadClients(factory)
 
-    # Get the list of files from the definition or a file containing definitions
+    # Get the definitions from the definition or a file containing definitions
     if args.definition:
-        files = get_files_from_definition(args.definition)
+        definitions = [args.definition]
     elif args.file:
-        files = get_files_from_definitions_file(args.file)
+        definitions = get_definitions_from_file(args.file)
     else:
         print("Error: You must provide either a SAM definition name or a file containing a list of definitions.")
-        exit(1)
-
-    for file_name in files:
-        # Get locations for the current file
-        locations = get_file_locations(file_name)
+        sys.exit(1)
 
-        for location in locations:
-            if override_keyword in location:
-                if args.dry_run:
-                    print(f"[Dry Run] Would remove location {location} for file {file_name}")
-                else:
-                    remove_file_location(file_name, location)
+    start = time.monotonic()
+    checkpoint = Checkpoint(args.checkpoint)
+    cleanup = Cleanup(clients, checkpoint, args.keyword, args.workers, args.rate, args.dry_run)
+    try:
+        # the definitions are listed concurrently; each list is cleaned as it arrives
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(definitions)))) as pool:
+            for definition, files in zip(definitions, pool.map(lambda d: get_files_from_definition(clients.get(), d), definitions)):
+                print(f"{definition}: {len(files)} files")
+                cleanup.run(files, args.batch)
+    finally:
+        cleanup.close()
+        checkpoint.close()
 
+    elapsed = time.monotonic() - start
+    stats = cleanup.stats
+    print(f"Files: {stats['files']} ({stats['skipped']} already done), located {stats['located']}, "
+          f"removed {stats['removed']} locations, {stats['failed']} failures")
+    print(f"Elapsed {elapsed:.1f} s, {stats['located'] / elapsed if elapsed else 0:.1f} files/s, "
+          f"{stats['removed'] / elapsed if elapsed else 0:.1f} removals/s")
+    if fake:
+        print(f"Fake samweb calls: {fake.calls}")
     print("Processing complete.")
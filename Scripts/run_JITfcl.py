@@ -9,6 +9,15 @@ from pathlib import Path
 import textwrap
 import glob
 import shutil
+import bisect
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import NamedTuple
+import nodecache
+import jobcommand
+import jobtelemetry
 
 # Function: Exit with error.
 def exit_abnormal():
@@ -20,22 +29,30 @@ def usage():
     print("Usage: script_name.py [--copy_input_mdh --copy_input_ifdh]")
     print("e.g. run_JITfcl.py --copy_input_mdh")
 
-# Function to run a shell command and return the output while streaming
-def run_command(command, hard_fail=True):
-    print(f"Running: {command}")
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    output = []  # Collect the command output
-    for line in process.stdout:
-        print(line, end="")  # Print each line in real-time
-        output.append(line.strip())  # Collect the output lines
-    process.wait()  # Wait for the command to complete
-
-    if process.returncode != 0:
-        print(f"Error running command: {command}")
+class CommandFailed(Exception):
+    pass
+
+# Function to run a shell command, streaming its output, and return its last `keep` output lines
+# (all with keep=None); lines matching the `capture` patterns are parsed into the `captured` dict.
+# With raise_error a failure raises CommandFailed instead of exiting, so one index of a batch can fail alone.
+# The CPU and peak RSS of the command are charged to the telemetry phase, if given.
+def run_command(command, hard_fail=True, keep=jobcommand.DEFAULT_KEEP, capture=None, captured=None,
+                cwd=None, prefix="", raise_error=False, phase=None):
+    print(f"{prefix}Running: {command}")
+    result = jobcommand.stream_command(command, log=lambda line: print(prefix + line), keep=keep, capture=capture, cwd=cwd)
+    if captured is not None:
+        captured.update(result.captured)
+    if phase:
+        phase.add_command(result)
+
+    if result.returncode != 0:
+        print(f"{prefix}Error running command: {command}")
+        if raise_error:
+            raise CommandFailed(f"{command} exited with status {result.returncode}")
         if hard_fail:
             exit_abnormal()
 
-    return "\n".join(output)  # Return the full output as a string
+    return result.output
 
 # Replace the first and last fields
 def replace_file_extensions(input_str, first_field, last_field):
@@ -44,6 +61,120 @@ def replace_file_extensions(input_str, first_field, last_field):
     fields[-1] = last_field
     return '.'.join(fields)
 
+RANGEMAP_HEADER = "#rangemap v1"
+
+# Resolve a global job index to (parfile, index, inloc, outloc) in a merge map written by gen_MergeMap.sh.
+# Range-encoded maps hold one '<offset> <parfile> <njobs> <inloc> <outloc>' record per parfile and are
+# searched by offset; legacy expanded maps are read only up to the requested line.
+def resolve_map_index(mapfile, ind):
+    with open(mapfile, 'r') as f:
+        first = f.readline()
+        if first.strip() == RANGEMAP_HEADER:
+            records = [line.split() for line in f if line.strip() and not line.startswith('#')]
+            for record in records:
+                if len(record) != 5:
+                    raise ValueError(f"Expected 5 fields (offset parfile njobs inloc outloc) in the map record, but got: {' '.join(record)}")
+            offsets = [int(record[0]) for record in records]
+            total = offsets[-1] + int(records[-1][2]) if records else 0
+            print("map records: %d, jobs: %d, IND: %d"%(len(records), total, ind))
+            if not 0 <= ind < total:
+                raise ValueError(f"Expected at least {ind + 1} jobs in the map, but got only {total}")
+            offset, parfile, _, inloc, outloc = records[bisect.bisect_right(offsets, ind) - 1]
+            return parfile, ind - int(offset), inloc, outloc
+
+        # Legacy map: the IND-th line (0-indexed), without reading the rest of the file
+        mapline = next(itertools.islice(itertools.chain([first], f), ind, None), None)
+        if mapline is None:
+            raise ValueError(f"Expected at least {ind + 1} maplines, but the map is shorter")
+        print(f"The {ind}th line is: {mapline.strip()}")
+
+        # Split the line into fields (assuming whitespace-separated).
+        fields = mapline.split()
+        if len(fields) != 4:
+            raise ValueError(f"Expected 4 fields (parfile njobs inloc outloc) in the line, but got: {mapline}")
+        return fields[0], int(fields[1]), fields[2], fields[3]
+
+# Number of jobs in a merge map, range-encoded or legacy.
+def map_size(mapfile):
+    with open(mapfile, 'r') as f:
+        first = f.readline()
+        if first.strip() == RANGEMAP_HEADER:
+            records = [line.split() for line in f if line.strip() and not line.startswith('#')]
+            return int(records[-1][0]) + int(records[-1][2]) if records else 0
+        return sum(1 for line in itertools.chain([first], f) if line.strip())
+
+print_lock = threading.Lock()
+
+# Copy one input file into destdir with mdh, retrying with a growing pause; returns (bytes, seconds).
+# The output of a copy is printed in one block, so parallel copies do not interleave.
+# With a node cache the file is taken from the cache, which makes the copy on a miss.
+# Setting the stop event ends the retries, and the pause between them, early.
+def copy_input(infile, inloc, destdir, retries=3, cache=None, stop=None, prefix="", phase=None):
+    stop = stop or threading.Event()
+    if cache:
+        start = time.monotonic()
+        name = os.path.basename(infile)
+        path = cache.fetch(name, lambda directory: copy_input(infile, inloc, directory, retries, None, stop, prefix, phase),
+                           destdir, nodecache.sam_checksum(name))
+        return os.path.getsize(path), time.monotonic() - start
+    command = f"mdh copy-file -e 3 -o -v -s {inloc} -l local {infile}"
+    for attempt in range(1, retries + 1):
+        if stop.is_set():
+            break
+        start = time.monotonic()
+        result = jobcommand.stream_command(command, log=None, keep=None, cwd=destdir)
+        elapsed = time.monotonic() - start
+        if phase:
+            phase.add_command(result)
+        path = os.path.join(destdir, os.path.basename(infile))
+        with print_lock:
+            print(f"{prefix}Running: {command} (attempt {attempt}/{retries})")
+            for line in result.lines:
+                print(prefix + line)
+            if result.returncode == 0 and os.path.exists(path):
+                size = os.path.getsize(path)
+                print(f"{prefix}Staged {infile}: {size} bytes in {elapsed:.1f} s, {size / max(elapsed, 1e-9) / 1e6:.1f} MB/s")
+                return size, elapsed
+            print(f"{prefix}Error copying {infile} (attempt {attempt}/{retries})")
+        if attempt < retries and stop.wait(10 * attempt):
+            break
+    if stop.is_set():
+        raise RuntimeError(f"Copy of {infile} cancelled")
+    raise RuntimeError(f"Could not copy {infile} from {inloc} after {retries} attempts")
+
+class StageIn(NamedTuple):
+    futures: list
+    stop: threading.Event
+
+# Start copying the input files into destdir on a pool of parallel streams; returns the StageIn.
+def start_stage_in(infiles, inloc, destdir, streams=4, retries=3, cache=None, prefix="", phase=None):
+    os.makedirs(destdir, exist_ok=True)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(streams, len(infiles))))
+    futures = [pool.submit(copy_input, infile, inloc, destdir, retries, cache, stop, prefix, phase) for infile in infiles]
+    pool.shutdown(wait=False)
+    return StageIn(futures, stop)
+
+# Cancel the copies that have not started and end the retries of the running ones.
+def cancel_stage_in(staging):
+    staging.stop.set()
+    for future in staging.futures:
+        future.cancel()
+
+# Wait for the stage-in and report its throughput; returns the bytes staged, raises RuntimeError if any file
+# could not be copied, after cancelling the remaining copies.
+def finish_stage_in(staging, start, prefix=""):
+    # the first failure, in whatever order the copies end, cancels the others
+    try:
+        wait(staging.futures, return_when=FIRST_EXCEPTION)
+        total = sum(future.result()[0] for future in staging.futures)
+    except BaseException:
+        cancel_stage_in(staging)
+        raise
+    elapsed = time.monotonic() - start
+    print(f"{prefix}Stage-in: {len(staging.futures)} files, {total} bytes in {elapsed:.1f} s, {total / max(elapsed, 1e-9) / 1e6:.1f} MB/s")
+    return total
+
 def main():
     parser = argparse.ArgumentParser(description="Process some inputs.")
     parser.add_argument("--copy_input_mdh", action="store_true", help="Copy input files using mdh")
@@ -51,13 +182,24 @@ def main():
     parser.add_argument('--dry_run', action='store_true', help='Print commands without actually running pushOutput')
     parser.add_argument('--test_run', action='store_true', help='Run 10 events only')
     parser.add_argument('--save_root', action='store_true', help='Save root and art output files')
+    parser.add_argument('--stage_streams', type=int, default=4, help='Parallel input copies with --copy_input_mdh (default: 4)')
+    parser.add_argument('--stage_retries', type=int, default=3, help='Attempts per input copy with --copy_input_mdh (default: 3)')
+    parser.add_argument('--node_cache', default=os.getenv("MU2E_NODE_CACHE"), help='Node-local cache directory for the parfile (default: $MU2E_NODE_CACHE, no cache if unset)')
+    parser.add_argument('--node_cache_gb', type=float, default=nodecache.DEFAULT_MAX_GB, help=f'Size cap of the node cache in GB (default: {nodecache.DEFAULT_MAX_GB})')
+    parser.add_argument('--node_cache_inputs', action='store_true', help='Also cache the inputs copied with --copy_input_mdh, e.g. shared pileup files')
+    parser.add_argument('--batch', type=int, default=1, help='Map indices per grid slot; the fname index is then the slot number (default: 1)')
+    parser.add_argument('--parallel', type=int, default=1, help='Map indices of a batch run concurrently (default: 1)')
     
     args = parser.parse_args()
     copy_input_mdh = args.copy_input_mdh
     copy_input_ifdh = args.copy_input_ifdh
 
+    # per-phase timing, written to a JSON sidecar shipped with the log
+    telemetry = jobtelemetry.Telemetry(os.getenv("fname"), None, "run_JITfcl.py")
+
     #check token before proceeding
-    run_command(f"httokendecode -H", hard_fail=False)
+    with telemetry.phase("token") as phase:
+        run_command(f"httokendecode -H", hard_fail=False, phase=phase)
     
     fname = os.getenv("fname")
     if not fname:
@@ -81,36 +223,36 @@ def main():
         exit_abnormal()
 
     mapfile = run_command(f"ls {CONDOR_DIR_INPUT}/merged*.txt").strip()
-    # Split the output into a list of lines.
-    with open(mapfile, 'r') as f:
-        maplines = f.read().splitlines()
-        
-    print("len(maplines): %d, IND: %d"%(len(maplines), IND))
-        
-    # Check that there are at least IND maplines.
-    if len(maplines) < IND:
-        raise ValueError(f"Expected at least {IND} maplines, but got only {len(maplines)}")
-    
-    # Get the IND-th line (adjusting for Python's 0-index).
-    mapline = maplines[IND]
-    print(f"The {IND}th line is: {mapline}")
-
-    # Split the line into fields (assuming whitespace-separated).
-    fields = mapline.split()
-    if len(fields) != 4:
-        raise ValueError(f"Expected 4 fields (parfile njobs inloc outloc) in the line, but got: {mapline}")
 
-    # Assign the fields to the appropriate variables.
-    TARF = fields[0]
-    IND = int(fields[1])  # update IND based on extracted value from the map
-    INLOC = fields[2]     # use inloc from map file
-    OUTLOC = fields[3]    # use outloc from map file
+    # In batch mode the index of fname is a slot, running the map indices [IND*batch, (IND+1)*batch)
+    if args.batch > 1:
+        first = IND * args.batch
+        indices = list(range(first, min(first + args.batch, map_size(mapfile))))
+        print(f"Batch slot {IND}: map indices {indices}")
+        if not indices:
+            print(f"Error: slot {IND} is beyond the end of the map")
+            exit_abnormal()
+    else:
+        indices = [IND]
 
-    run_command(f"mdh copy-file -e 3 -o -v -s disk -l local {TARF}")
+    # Assign the fields to the appropriate variables; each IND becomes the index within its parfile.
+    records = {gind: resolve_map_index(mapfile, gind) for gind in indices}
 
-    print(f"IND={IND} TARF={TARF} INLOC={INLOC} OUTLOC={OUTLOC}")
+    telemetry.info["dataset"] = jobtelemetry.dataset_of(records[indices[0]][0])
 
-    FCL = os.path.basename(TARF)[:-6] + f".{IND}.fcl"
+    # Each parfile is copied once and reused by all the indices of the slot
+    cache = nodecache.NodeCache(args.node_cache, args.node_cache_gb) if args.node_cache else None
+    for TARF in dict.fromkeys(record[0] for record in records.values()):
+        with telemetry.phase("parfile") as phase:
+            if cache:
+                try:
+                    copy_input(TARF, "disk", ".", args.stage_retries, cache, phase=phase)
+                except RuntimeError as e:
+                    print(f"Error: {e}")
+                    exit_abnormal()
+            else:
+                run_command(f"mdh copy-file -e 3 -o -v -s disk -l local {TARF}", phase=phase)
+            phase.bytes = jobtelemetry.file_size(os.path.basename(TARF))
 
     #unset BEARER_TOKEN
     print(f"BEARER_TOKEN before unset: {os.environ.get('BEARER_TOKEN')}")
@@ -118,41 +260,143 @@ def main():
     # Check if the variable is unset
     print(f"BEARER_TOKEN after unset: {os.environ.get('BEARER_TOKEN')}")
 
-    infiles = run_command(f"mu2ejobiodetail --jobdef {TARF} --index {IND} --inputs")
+    # Run the indices, several at once with --parallel; a failing index does not stop the others.
+    # Concurrent phases are charged only the commands they ran, not whichever child exited meanwhile.
+    batch = len(indices) > 1
+    telemetry.per_command = batch and args.parallel > 1
+    def run_one(gind):
+        workdir = f"index_{gind}" if batch else "."
+        prefix = f"[{gind}] " if batch and args.parallel > 1 else ""
+        try:
+            return gind, run_index(gind, records[gind], args, fname, telemetry, cache, workdir, prefix, batch), None
+        except (CommandFailed, RuntimeError, OSError) as e:
+            print(f"{prefix}Error: map index {gind} failed: {e}")
+            return gind, None, str(e)
+    with ThreadPoolExecutor(max_workers=max(1, min(args.parallel, len(indices)))) as pool:
+        results = list(pool.map(run_one, indices))
+
+    run_command(f"ls {fname}")
+
+    succeeded = [(gind, result) for gind, result, error in results if error is None]
+    print("Per-index results:")
+    for gind, result, error in results:
+        print(f"  map index {gind}: " + (f"OK, {len(result[1]) - 1} outputs" if error is None else f"FAILED ({error})"))
+    telemetry.info["indices"] = {str(gind): error or "ok" for gind, _, error in results}
+    if not succeeded:
+        exit_abnormal()
+
+    # One output.txt for the whole slot
+    out_content = "".join(line for _, (FCL, lines) in succeeded for line in lines)
+
+    # The telemetry sidecar goes out with the log; pushOutput itself is only in the log's Telemetry line
+    FCL, _ = succeeded[0][1]
+    TELEMETRY = replace_file_extensions(FCL, "log", "json")
+    telemetry.write(TELEMETRY)
+    out_content += f"disk {TELEMETRY} {parents_name(succeeded[0][0], batch)}\n"
+    Path("output.txt").write_text(out_content)
+
+    if cache:
+        cache.report()
+
+    # Push output
+    with telemetry.phase("pushOutput") as phase:
+        run_command(f"httokendecode -H", hard_fail=False, phase=phase)
+        if args.dry_run:
+            print("[DRY RUN] Would run: pushOutput output.txt")
+        else:
+            run_command("pushOutput output.txt", phase=phase)
+        phase.bytes = sum(jobtelemetry.file_size(line.split()[1]) for line in out_content.splitlines())
+
+    if len(succeeded) < len(results):
+        print(f"Error: {len(results) - len(succeeded)} of {len(results)} map indices failed")
+        sys.exit(1)
+
+#    run_command("rm -f *.root *.art *.txt")
+
+def parents_name(gind, batch):
+    return f"parents_{gind}.txt" if batch else "parents_list.txt"
+
+# Generate the FCL, stage the inputs and run mu2e for global map index gind in workdir; its outputs are moved
+# to the job directory. Returns (FCL, output.txt lines of the index); raises CommandFailed, RuntimeError
+# or OSError if the index fails.
+def run_index(gind, record, args, fname, telemetry, cache, workdir, prefix, batch):
+    TARF, IND, INLOC, OUTLOC = record
+    os.makedirs(workdir, exist_ok=True)
+    workdir_abs = os.path.abspath(workdir)
+    tarf_abs = os.path.abspath(os.path.basename(TARF))
+    print(f"{prefix}IND={IND} TARF={TARF} INLOC={INLOC} OUTLOC={OUTLOC}")
+
+    FCL = os.path.basename(TARF)[:-6] + f".{IND}.fcl"
+
+    def run(command, **kwargs):
+        return run_command(command, cwd=workdir, prefix=prefix, raise_error=True, **kwargs)
+
+    fcl_phase = telemetry.begin("fcl")
+    fcl_phase.details["index"] = IND
+    infiles = run(f"mu2ejobiodetail --jobdef {tarf_abs} --index {IND} --inputs", keep=None, phase=fcl_phase)
     # Generate FCL without input if infiles is empty
     if not infiles.strip():
-        run_command(f"mu2ejobfcl --jobdef {TARF} --index {IND} > {FCL}")
-    elif copy_input_mdh:
-        run_command(f"mu2ejobfcl --jobdef {TARF} --index {IND} --default-proto file --default-loc dir:{os.getcwd()}/indir > {FCL}")
-        print("infiles: %s"%infiles)
-        run_command(f"mdh copy-file -e 3 -o -v -s {INLOC} -l local {infiles}")
-        run_command(f"mkdir indir; mv *.art indir/")
+        run(f"mu2ejobfcl --jobdef {tarf_abs} --index {IND} > {FCL}", phase=fcl_phase)
+        telemetry.end(fcl_phase)
+    elif args.copy_input_mdh:
+        # copy the inputs on parallel streams while the FCL is generated
+        print(f"{prefix}infiles: %s"%infiles)
+        stage_start = time.monotonic()
+        stage_phase = telemetry.begin("stage_in")
+        stage_phase.details["index"] = IND
+        staging = start_stage_in(infiles.split(), INLOC, os.path.join(workdir, "indir"), args.stage_streams, args.stage_retries,
+                                 cache if args.node_cache_inputs else None, prefix, stage_phase)
+        ok = False
+        try:
+            run(f"mu2ejobfcl --jobdef {tarf_abs} --index {IND} --default-proto file --default-loc dir:{workdir_abs}/indir > {FCL}",
+                phase=fcl_phase)
+            ok = True
+        except BaseException:
+            cancel_stage_in(staging)
+            telemetry.end(stage_phase, ok=False)
+            raise
+        finally:
+            telemetry.end(fcl_phase, ok)
+        try:
+            stage_phase.bytes = finish_stage_in(staging, stage_start, prefix)
+        finally:
+            telemetry.end(stage_phase)
     else:
-        run_command(f"mu2ejobfcl --jobdef {TARF} --index {IND} --default-proto root --default-loc {INLOC} > {FCL}")
+        run(f"mu2ejobfcl --jobdef {tarf_abs} --index {IND} --default-proto root --default-loc {INLOC} > {FCL}", phase=fcl_phase)
+        telemetry.end(fcl_phase)
 
-    print(f"{datetime.now()} submit_fclless {FCL} content")
-    with open(FCL, 'r') as f:
-        print(f.read())
+    with open(os.path.join(workdir, FCL), 'r') as f:
+        print(f"{prefix}{datetime.now()} submit_fclless {FCL} content\n" + f.read())
 
-    if args.test_run:
-        run_command(f"mu2e -n 10 -c {FCL}")
-    else:
-        run_command(f"mu2e -c {FCL}")
-
-    run_command(f"ls {fname}")
+    # only the art reports are kept from the mu2e output; the rest just goes to the log
+    with telemetry.phase("mu2e") as phase:
+        phase.details["index"] = IND
+        if args.test_run:
+            run(f"mu2e -n 10 -c {FCL}", keep=0, capture=jobcommand.ART_REPORTS, captured=phase.details, phase=phase)
+        else:
+            run(f"mu2e -c {FCL}", keep=0, capture=jobcommand.ART_REPORTS, captured=phase.details, phase=phase)
 
     if args.save_root:
-        out_fnames = glob.glob("*.art") + glob.glob("*.root")
+        out_fnames = glob.glob(os.path.join(workdir, "*.art")) + glob.glob(os.path.join(workdir, "*.root"))
     else:
-        out_fnames = glob.glob("*.art")  # Find all .art files
+        out_fnames = glob.glob(os.path.join(workdir, "*.art"))  # Find all .art files
+    if batch:
+        # outputs of different indices have different sequencers, so they do not clash in the job directory
+        with print_lock:
+            for name in [FCL] + [os.path.basename(out_fname) for out_fname in out_fnames]:
+                if os.path.exists(name):
+                    raise OSError(f"{name} was already made by another index of the batch")
+            os.replace(os.path.join(workdir, FCL), FCL)
+            for out_fname in out_fnames:
+                os.replace(out_fname, os.path.basename(out_fname))
+    out_fnames = [os.path.basename(out_fname) for out_fname in out_fnames]
 
     # Write the list to the file in one line
+    parents_list = parents_name(gind, batch)
     parents = infiles.split() + [fname]  # Add {fname} to the list of files
-    Path("parents_list.txt").write_text("\n".join(parents) + "\n")
+    Path(parents_list).write_text("\n".join(parents) + "\n")
 
-    out_content = ""
-    for out_fname in out_fnames:
-        out_content += f"{OUTLOC} {out_fname} parents_list.txt\n"
+    lines = [f"{OUTLOC} {out_fname} {parents_list}\n" for out_fname in out_fnames]
 
     # In production mode, copy the job submission log file from jsb_tmp to LOGFILE_LOC.
     LOGFILE_LOC = replace_file_extensions(FCL, "log", "log")
@@ -162,20 +406,11 @@ def main():
     if jsb_tmp:
         jobsub_log = "JOBSUB_LOG_FILE"
         src = os.path.join(jsb_tmp, jobsub_log)
-        print(f"Copying jobsub log from {src} to {LOGFILE_LOC}")
+        print(f"{prefix}Copying jobsub log from {src} to {LOGFILE_LOC}")
         shutil.copy(src, LOGFILE_LOC)
 
-    out_content += f"disk {LOGFILE_LOC} parents_list.txt\n"
-    Path("output.txt").write_text(out_content)
-
-    # Push output
-    run_command(f"httokendecode -H", hard_fail=False)
-    if args.dry_run:
-        print("[DRY RUN] Would run: pushOutput output.txt")
-    else:
-        run_command("pushOutput output.txt")
-
-#    run_command("rm -f *.root *.art *.txt")
+    lines.append(f"disk {LOGFILE_LOC} {parents_list}\n")
+    return FCL, lines
 
 if __name__ == "__main__":
     main()
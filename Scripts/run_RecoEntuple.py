@@ -9,6 +9,8 @@ import subprocess
 import textwrap
 import hashlib
 import shutil
+import jobtelemetry
+import jobcommand
 
 # ---------------------------------------------------
 # Configure Logging to stdout (no timestamp or level)
@@ -48,27 +50,14 @@ def parse_args():
 
     return parser.parse_args()
 
-def run_command(command: str) -> None:
+def run_command(command: str, captured: dict = None) -> None:
     logging.info(f"Running: {command}")
-    process = subprocess.Popen(
-        command,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
-    )
-    
-    # Stream the output line-by-line
-    while True:
-        line = process.stdout.readline()
-        if not line:
-            break
-        logging.info(line.rstrip())
-    
-    process.stdout.close()
-    process.wait()
+    # Stream the output line-by-line, keeping only the art reports
+    result = jobcommand.stream_command(command, log=logging.info, keep=0, capture=jobcommand.ART_REPORTS)
+    if captured is not None:
+        captured.update(result.captured)
     
-    if process.returncode != 0:
+    if result.returncode != 0:
         logging.error(f"Error running command: {command}")
         sys.exit(1)
 
@@ -181,14 +170,21 @@ def main():
         raise ValueError("fname environment variable not set")
     
     logging.info(f"Using output MDC2020 version")
+
+    # per-phase timing, written to a JSON sidecar shipped with the log
+    telemetry = jobtelemetry.Telemetry(in_fname, None, "run_RecoEntuple.py")
     
     # Write fcl configuration
-    fcl_file, out_fname_list = write_fcl_file(in_fname, args)
+    with telemetry.phase("fcl"):
+        fcl_file, out_fname_list = write_fcl_file(in_fname, args)
     print("Filelist: %s" % out_fname_list)
+    telemetry.info["dataset"] = jobtelemetry.dataset_of(out_fname_list[0])
     
     # Run processing
     nevents = args.nevents  # Number of events to process
-    run_command(f"mu2e -n {nevents} -s {in_fname} -c {fcl_file}")
+    with telemetry.phase("mu2e") as phase:
+        run_command(f"mu2e -n {nevents} -s {in_fname} -c {fcl_file}", captured=phase.details)
+        phase.bytes = jobtelemetry.file_size(in_fname)
     
     # Handle parent files
     in_fname_base = os.path.basename(in_fname)
@@ -209,14 +205,20 @@ def main():
         print(f"Copying jobsub log from {src} to {LOGFILE_LOC}")
         shutil.copy(src, LOGFILE_LOC)
 
+    # The telemetry sidecar goes out with the log; pushOutput itself is only in the log's Telemetry line
+    TELEMETRY = replace_file_fields(fcl_file, first_field="log", last_field="json")
+    telemetry.write(TELEMETRY)
     out_content += f"disk {LOGFILE_LOC} parents_{in_fname_base}\n"
+    out_content += f"disk {TELEMETRY} parents_{in_fname_base}\n"
     Path("output.txt").write_text(out_content)
     
     # Push output
-    if args.dry_run:
-        logging.info(f"[DRY RUN] Would run: pushOutput output.txt")
-    else:
-        run_command("pushOutput output.txt")
+    with telemetry.phase("pushOutput") as phase:
+        if args.dry_run:
+            logging.info(f"[DRY RUN] Would run: pushOutput output.txt")
+        else:
+            run_command("pushOutput output.txt")
+        phase.bytes = sum(jobtelemetry.file_size(line.split()[1]) for line in out_content.splitlines())
 
     # Cleanup
     run_command("rm -f *.root *.art *.txt")
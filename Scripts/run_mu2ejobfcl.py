@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 import sys
-import subprocess
+import jobcommand
 
 def transform_filename(filename: str) -> str:
     """
@@ -26,15 +26,14 @@ def main():
     transformed_file = transform_filename(input_file)
     print(f"Par file: {transformed_file}")
 
-    # Locate the par file via samweb
-    try:
-        location_bytes = subprocess.check_output(["samweb", "locate-file", transformed_file])
-    except subprocess.CalledProcessError as e:
+    # Locate the par file via samweb; its warnings on stderr must not end up in the location
+    result = jobcommand.stream_command(["samweb", "locate-file", transformed_file], log=None, keep=None, stderr=None)
+    if result.returncode != 0:
         print(f"Error: samweb locate-file failed for {transformed_file}")
-        print(e)
+        print(result.output)
         sys.exit(1)
 
-    location_str = location_bytes.decode().strip()
+    location_str = result.output.strip()
     
     # Strip off 'dcache:' prefix
     if location_str.startswith("dcache:"):
@@ -45,18 +44,17 @@ def main():
     print(f"Par file located at: {full_path}")
     print("++++++++++++++++++++++++++++++++++++++++")
     
-    # Call mu2ejobfcl
-    try:
-        subprocess.run([
-            "mu2ejobfcl",
-            "--jobdef", full_path,
-            "--target", input_file,
-            "--default-proto", "root",
-            "--default-loc", "tape"
-        ], check=True)
-    except subprocess.CalledProcessError as e:
+    # Call mu2ejobfcl, streaming the FCL to stdout and leaving its stderr out of it
+    result = jobcommand.stream_command([
+        "mu2ejobfcl",
+        "--jobdef", full_path,
+        "--target", input_file,
+        "--default-proto", "root",
+        "--default-loc", "tape"
+    ], keep=0, stderr=None)
+    if result.returncode != 0:
         print("Error: mu2ejobfcl command failed.")
-        print(e)
+        print(f"Command returned non-zero exit status {result.returncode}.")
         sys.exit(1)
 
 if __name__ == "__main__":